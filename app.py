@@ -1,21 +1,28 @@
 import streamlit as st
-import json
 import os
 import asyncio
 import re
+import hashlib
 from datetime import datetime
 from docx import Document
-from editor_generate import generate_script, analyze_multi_styles
-from video_utils import parse_script_to_scenes, generate_audio, generate_image, assemble_video
+from editor_generate import generate_script_stream, analyze_multi_styles, analyze_styles_hierarchical, build_batch_jobs, generate_scripts_batch, BATCH_CONCURRENCY
+from video_utils import parse_script_to_scenes, generate_audio, assemble_video, is_annotation_scene
+from image_pipeline import generate_all_images, generate_scene_image, scene_image_path, ensure_thumbnail
+from tts_pipeline import synthesize_all, apply_audio_results
+from llm_cache import cache_stats
+from prompt_budget import describe_report
+import state_cache
+import refresh_jobs
+import topic_history
+from storage import load_json, append_scripts, search_scripts, create_factory_script, list_factory_scripts, get_factory_script, update_scenes, list_styles, save_style
 
 # 配置 - 使用相对路径以兼容云端部署
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DAILY_TOPICS_PATH = os.path.join(BASE_DIR, "daily_topics.json")
-HISTORY_TOPICS_PATH = os.path.join(BASE_DIR, "history_topics.json")
-EDITOR_OUTPUT_PATH = os.path.join(BASE_DIR, "editor_output.json")
-STYLES_PATH = os.path.join(BASE_DIR, "blogger_styles.json")
 VIDEO_TEMP_DIR = os.path.join(BASE_DIR, "temp_video")
-VIDEO_FACTORY_STATE_PATH = os.path.join(BASE_DIR, "video_factory_state.json")
+
+LIBRARY_PAGE_SIZE = 20
+SCENE_PAGE_SIZE = 10
 
 os.makedirs(VIDEO_TEMP_DIR, exist_ok=True)
 
@@ -39,24 +46,41 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def load_json(path, default={}):
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content: return default
-                return json.loads(content)
-        except: return default
-    return default
-
-def save_json(path, data):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
 def parse_docx(file):
     doc = Document(file)
     return "\n".join([para.text for para in doc.paragraphs])
 
+# 后台刷新：进程内只启动一次定时任务
+refresh_jobs.start_scheduler()
+
+@st.fragment(run_every=2)
+def refresh_status():
+    """
+    每 2 秒轮询后台刷新任务；聚类中今日选题有更新或任务结束时整页重跑以载入新选题。
+    """
+    job = refresh_jobs.latest_job()
+    if job is None:
+        return
+    if job.active:
+        detail = ""
+        if job.stage == "cluster":
+            # 流式聚类会逐个写入今日选题：文件有变化就整页重跑，热榜随之逐条出现
+            if state_cache.file_signature([DAILY_TOPICS_PATH]) != st.session_state.get('topics_sig'):
+                st.rerun(scope="app")
+            detail = f" · 今日选题 {len(load_json(DAILY_TOPICS_PATH, default=[]))} 个"
+        st.progress(job.progress, text=f"{job.stage_label}（{job.completed_stages}/{len(refresh_jobs.STAGES)}）{detail}")
+    elif st.session_state.get('refresh_seen_job') != job.id:
+        st.session_state.refresh_seen_job = job.id
+        st.rerun(scope="app")
+    elif job.status == "failed":
+        st.caption(f"⚠️ {job.finished_at} {job.stage_label}：{job.error}")
+    else:
+        cost = " / ".join(f"{k} {v:.1f}s" for k, v in job.timings.items())
+        st.caption(f"上次刷新：{job.finished_at}（{cost}）")
+
+# 记录本次重跑开始时的状态缓存计数
+state_cache_start = state_cache.snapshot()
+
 # 初始化状态
 if 'generated_script' not in st.session_state: st.session_state.generated_script = ""
 if 'temp_style_desc' not in st.session_state: st.session_state.temp_style_desc = ""
@@ -65,19 +89,27 @@ if 'video_scenes' not in st.session_state: st.session_state.video_scenes = []
 if 'selected_title' not in st.session_state: st.session_state.selected_title = ""
 if 'video_factory_scripts' not in st.session_state: st.session_state.video_factory_scripts = {}
 if 'current_video_factory_script_id' not in st.session_state: st.session_state.current_video_factory_script_id = None
+if 'refresh_seen_job' not in st.session_state:
+    # 新会话不需要为已结束的旧刷新任务再重跑一次
+    _job = refresh_jobs.latest_job()
+    st.session_state.refresh_seen_job = _job.id if _job and not _job.active else None
 
 # 侧边栏
 with st.sidebar:
     st.markdown('<div class="logo-container"><div class="logo-icon">α</div><div class="logo-text">财经Alpha</div></div>', unsafe_allow_html=True)
     st.markdown("<h3 style='color:#e63946; font-size:1.1rem;'>今日热榜</h3>", unsafe_allow_html=True)
+    st.session_state.topics_sig = state_cache.file_signature([DAILY_TOPICS_PATH])
     raw_topics = load_json(DAILY_TOPICS_PATH, default=[])
     topics_data = [t for t in raw_topics if t.get('topic') and str(t.get('topic')).strip().lower() != 'none']
     for i, t in enumerate(topics_data[:10]):
         st.markdown(f'<div style="display:flex; justify-content:space-between; padding:8px 0; border-bottom:1px solid #f0f0f0; font-size:0.9rem;"><span style="color:#e63946; font-weight:bold; margin-right:10px;">{i+1}</span><span style="flex:1;">{t.get("topic")}</span><span style="color:#999;">🔥{t.get("heat")}</span></div>', unsafe_allow_html=True)
     if st.button("🔄 刷新全网数据", use_container_width=True):
-        with st.spinner("正在抓取全网热点..."):
-            os.system("cd /home/ubuntu/finance_video_gen && venv/bin/python3 news_fetcher.py && venv/bin/python3 topic_cluster.py")
-            st.rerun()
+        refresh_jobs.start_refresh()
+    refresh_status()
+    llm_stats = cache_stats()
+    st.caption(f"模型缓存：命中 {llm_stats['memory_hits'] + llm_stats['disk_hits']} / 未命中 {llm_stats['misses']}（命中率 {llm_stats['hit_rate']:.0%}）")
+    # 本次重跑的状态缓存统计，页面末尾填充
+    state_cache_caption = st.empty()
 
 # 主界面
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["🔴 今日热榜", "📜 历史选题", "✍️ 脚本生成", "🧪 风格实验室", "🎬 视频工厂", "📂 文稿库"])
@@ -95,16 +127,37 @@ with tab1:
                         st.markdown(f'<div style="background:white; border:1px solid #eee; border-radius:8px; padding:15px; min-height:280px;"><div style="display:flex; justify-content:space-between; margin-bottom:10px;"><span style="color:#e63946; font-weight:bold;">{letter_id}</span><span style="color:#e63946; font-size:0.8rem;">🔥{t.get("heat")}</span></div><div style="font-weight:bold; margin-bottom:10px; font-size:0.95rem;">{t.get("topic")}</div>{sub_html}</div>', unsafe_allow_html=True)
 
 with tab2:
-    history = load_json(HISTORY_TOPICS_PATH, default={})
-    if not history:
+    history_days = topic_history.list_days()
+    if not history_days:
         st.info("暂无历史选题数据。")
     else:
-        for date, day_topics in sorted(history.items(), reverse=True):
-            with st.expander(f"📅 {date}"):
-                if isinstance(day_topics, list):
-                    for t in day_topics: 
-                        if isinstance(t, dict) and t.get('topic') and str(t.get('topic')).lower() != 'none':
-                            st.markdown(f"- **{t.get('topic')}** (🔥 {t.get('heat')})")
+        # 趋势只读小体积的索引文件，不加载各天的完整选题
+        trend_index = topic_history.load_index()
+        trend_cols = st.columns(2)
+        with trend_cols[0]:
+            st.markdown(f"**📈 近 {topic_history.RISING_WINDOW_DAYS} 天升温**")
+            rising = topic_history.rising_topics(trend_index)
+            if not rising:
+                st.caption("近期没有选题记录。")
+            for r in rising:
+                change = "新出现" if r["new"] else f"{r['delta']:+d}"
+                st.markdown(f"- **{r['label']}** · {r['recent_days']} 天 · 🔥 {r['recent_heat']}（{change}）")
+        with trend_cols[1]:
+            st.markdown(f"**🔁 近 {topic_history.RECURRING_SPAN_DAYS} 天反复出现**")
+            recurring = topic_history.recurring_topics(trend_index)
+            if not recurring:
+                st.caption("还没有在多天出现的选题。")
+            for r in recurring:
+                st.markdown(f"- **{r['label']}** · {r['days']} 天（{r['first_seen']} ~ {r['last_seen']}）· 平均 🔥 {r['avg_heat']}")
+
+        st.divider()
+        sel_day = st.selectbox("📅 查看某天的选题", history_days, key="history_day")
+        day_topics = topic_history.load_day(sel_day)
+        if not day_topics:
+            st.caption("当天没有选题。")
+        for t in day_topics:
+            if isinstance(t, dict) and t.get('topic') and str(t.get('topic')).lower() != 'none':
+                st.markdown(f"- **{t.get('topic')}** (🔥 {t.get('heat')})")
 
 with tab3:
     if not topics_data: st.warning("请先刷新数据。")
@@ -115,28 +168,39 @@ with tab3:
             sel_topic = st.selectbox("选择大方向", [t.get('topic') for t in topics_data])
             t_data = next((t for t in topics_data if t.get('topic') == sel_topic), None)
             sel_sub = st.selectbox("选择具体子选题", [n.get('title') for n in t_data.get('news_items', [])] if t_data else [])
-            styles = load_json(STYLES_PATH, default={})
+            styles = list_styles()
             style_names = ["专业分析风", "快节奏口播风", "幽默吐槽风"] + list(styles.keys())
             sel_style = st.selectbox("选择创作风格", style_names)
             sop_template = styles.get(sel_style, {}).get('sop_template', "") if isinstance(styles.get(sel_style), dict) else ""
+            force_regen = st.checkbox("忽略缓存，重新生成", value=False)
             
-            if st.button("🚀 立即生成深度脚本", use_container_width=True):
-                with st.spinner("Gemini 2.5 Flash 正在深度创作..."):
-                    s_desc = styles.get(sel_style, {}).get('description', "口语化、深度分析") if isinstance(styles.get(sel_style), dict) else "口语化、深度分析"
-                    script = generate_script(sel_topic, sel_sub, sel_style, s_desc, t_data.get('news_items', []), sop_template)
-                    st.session_state.generated_script = script
-                    lib = load_json(EDITOR_OUTPUT_PATH, default=[])
-                    if not isinstance(lib, list): lib = []
-                    lib.append({
-                        "id": len(lib) + 1,
-                        "topic": sel_topic,
-                        "subtopic": sel_sub,
-                        "style": sel_style,
-                        "content": script,
-                        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                    save_json(EDITOR_OUTPUT_PATH, lib)
-                    st.rerun()
+            # 生成请求交给右侧 c2 栏流式渲染
+            start_generation = st.button("🚀 立即生成深度脚本", use_container_width=True)
+
+            with st.expander("📦 批量生成（多子选题 × 多风格）"):
+                batch_topic_names = st.multiselect("选择大方向（留空为全部今日选题）", [t.get('topic') for t in topics_data])
+                batch_styles = st.multiselect("选择创作风格", style_names, default=[sel_style])
+                batch_concurrency = st.slider("并发数", 1, 16, BATCH_CONCURRENCY)
+                batch_topics = [t for t in topics_data if not batch_topic_names or t.get('topic') in batch_topic_names]
+                batch_jobs = build_batch_jobs(batch_topics, batch_styles, styles)
+                st.caption(f"共 {len(batch_jobs)} 份脚本待生成")
+                if st.button("🚀 批量生成", use_container_width=True, disabled=not batch_jobs):
+                    progress = st.progress(0.0, text="批量生成中...")
+                    def on_batch_progress(done, total, result):
+                        job = result["job"]
+                        status = "✅" if result["ok"] else "❌"
+                        progress.progress(done / total, text=f"{done}/{total} {status} {job['subtopic']}（{job['style']}）")
+                    batch_results = generate_scripts_batch(batch_jobs, max_concurrency=batch_concurrency, on_progress=on_batch_progress, use_cache=not force_regen)
+                    saved = append_scripts([
+                        {"topic": r["job"]["topic"], "subtopic": r["job"]["subtopic"], "style": r["job"]["style"], "content": r["content"]}
+                        for r in batch_results if r["ok"]
+                    ])
+                    failures = [r for r in batch_results if not r["ok"]]
+                    st.success(f"已生成 {len(saved)} 份脚本并存入【文稿库】。")
+                    if failures:
+                        st.error(f"{len(failures)} 份生成失败：")
+                        for r in failures:
+                            st.caption(f"- {r['job']['subtopic']}（{r['job']['style']}）：{r['error']}")
             
             if st.session_state.generated_script:
                 st.markdown("---")
@@ -164,16 +228,8 @@ with tab3:
                     if st.button("确认并同步到视频工厂", use_container_width=True):
                         with st.spinner("正在深度解析脚本并构建视频场景..."):
                             st.session_state.video_scenes = parse_script_to_scenes(st.session_state.generated_script)
-                            # 保存到视频工厂状态
-                            factory_state = load_json(VIDEO_FACTORY_STATE_PATH, default={})
-                            script_id = str(datetime.now().timestamp())
-                            factory_state[script_id] = {
-                                "title": st.session_state.selected_title,
-                                "scenes": st.session_state.video_scenes,
-                                "original_script": st.session_state.generated_script,
-                                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            }
-                            save_json(VIDEO_FACTORY_STATE_PATH, factory_state)
+                            # 保存到视频工厂
+                            script_id = create_factory_script(st.session_state.selected_title, st.session_state.video_scenes, st.session_state.generated_script)
                             st.session_state.current_video_factory_script_id = script_id
                             st.success("同步成功！请前往【视频工厂】。")
                 else:
@@ -183,21 +239,30 @@ with tab3:
                         st.session_state.selected_title = sel_sub
                         with st.spinner("正在解析脚本并构建视频场景..."):
                             st.session_state.video_scenes = parse_script_to_scenes(st.session_state.generated_script)
-                            factory_state = load_json(VIDEO_FACTORY_STATE_PATH, default={})
-                            script_id = str(datetime.now().timestamp())
-                            factory_state[script_id] = {
-                                "title": st.session_state.selected_title,
-                                "scenes": st.session_state.video_scenes,
-                                "original_script": st.session_state.generated_script,
-                                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            }
-                            save_json(VIDEO_FACTORY_STATE_PATH, factory_state)
+                            script_id = create_factory_script(st.session_state.selected_title, st.session_state.video_scenes, st.session_state.generated_script)
                             st.session_state.current_video_factory_script_id = script_id
                             st.success("同步成功！")
         
         with c2:
-            if st.session_state.generated_script:
+            if start_generation:
                 st.subheader("生成的脚本内容")
+                s_desc = styles.get(sel_style, {}).get('description', "口语化、深度分析") if isinstance(styles.get(sel_style), dict) else "口语化、深度分析"
+                timing = {}
+                budget_report = {}
+                script = st.write_stream(generate_script_stream(sel_topic, sel_sub, sel_style, s_desc, t_data.get('news_items', []), sop_template, use_cache=not force_regen, timing=timing, budget_report=budget_report))
+                st.session_state.generated_script = script
+                st.session_state.script_timing = timing
+                st.session_state.script_budget_note = describe_report(budget_report)
+                append_scripts([{"topic": sel_topic, "subtopic": sel_sub, "style": sel_style, "content": script}])
+                st.rerun()
+            elif st.session_state.generated_script:
+                st.subheader("生成的脚本内容")
+                timing = st.session_state.get('script_timing') or {}
+                if timing.get('total') is not None:
+                    source = "缓存命中" if timing.get('cached') else "模型生成"
+                    st.caption(f"{source} · 首字 {timing.get('ttft') or 0:.2f}s · 总耗时 {timing['total']:.2f}s")
+                if st.session_state.get('script_budget_note'):
+                    st.caption(f"✂️ {st.session_state.script_budget_note}")
                 # 移除可能存在的"脚本预览"字样（如果 AI 输出了的话）
                 display_content = st.session_state.generated_script.replace("脚本预览", "").strip()
                 st.markdown(display_content)
@@ -206,7 +271,7 @@ with tab3:
 
 with tab4:
     st.header("🧪 博主风格克隆中心")
-    styles = load_json(STYLES_PATH, default={})
+    styles = list_styles()
     col_train, col_list = st.columns([3, 2])
     with col_train:
         st.subheader("第一步：海量样本喂料")
@@ -220,6 +285,11 @@ with tab4:
             if st.button("➕ 添加更多样本输入框"):
                 st.session_state.sample_count += 1
                 st.rerun()
+        hierarchical = st.toggle("分层分析：逐样本并发提取特征并按内容缓存，追加样本时只分析新样本", value=True)
+        existing_style = styles.get(new_style_name) if new_style_name and isinstance(styles.get(new_style_name), dict) else None
+        append_samples = False
+        if hierarchical and existing_style and existing_style.get("sample_features"):
+            append_samples = st.checkbox(f"追加到已有风格（已分析 {len(existing_style['sample_features'])} 份样本）", value=True)
         if st.button("🧠 开始全量交叉分析基因", use_container_width=True):
             all_texts = [s for s in manual_samples if s.strip()]
             if uploaded_files:
@@ -234,39 +304,60 @@ with tab4:
             
             if all_texts and new_style_name:
                 with st.spinner("正在深度分析风格基因..."):
-                    style_desc = analyze_multi_styles(all_texts)
-                    styles[new_style_name] = {
-                        "description": style_desc,
-                        "sop_template": "",
+                    style_data = {
+                        "sop_template": existing_style.get("sop_template", "") if append_samples else "",
                         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     }
-                    save_json(STYLES_PATH, styles)
-                    st.success(f"✅ 风格 '{new_style_name}' 已保存！")
-                    st.markdown(f"**风格描述**：{style_desc}")
+                    if hierarchical:
+                        progress = st.progress(0.0, text="正在逐样本提取风格特征...")
+                        def on_sample_progress(done, total, key, result):
+                            progress.progress(done / total, text=f"{done}/{total} 份样本 {'✅' if result['ok'] else '❌'}")
+                        known = existing_style.get("sample_features", {}) if append_samples else {}
+                        style_desc, sample_features, style_stats = analyze_styles_hierarchical(all_texts, known_features=known, on_progress=on_sample_progress)
+                        progress.progress(1.0, text="特征归并完成")
+                        style_data["sample_features"] = sample_features
+                        st.caption(
+                            f"新分析 {style_stats['new'] - style_stats['failed']} 份 · 复用 {style_stats['reused']} 份"
+                            + (f" · 失败 {style_stats['failed']} 份" if style_stats['failed'] else "")
+                            + f" · 提取 {style_stats['extract_seconds']:.1f}s · 归并 {style_stats.get('merge_seconds', 0):.1f}s"
+                        )
+                    else:
+                        style_budget = {}
+                        style_desc = analyze_multi_styles(all_texts, budget_report=style_budget)
+                        if describe_report(style_budget):
+                            st.info(f"✂️ {describe_report(style_budget)}")
+                    style_data["description"] = style_desc
+                    if style_desc.startswith("风格分析失败"):
+                        st.error(style_desc)
+                    else:
+                        save_style(new_style_name, style_data)
+                        st.success(f"✅ 风格 '{new_style_name}' 已保存！")
+                        st.markdown(f"**风格描述**：{style_desc}")
             else:
                 st.warning("请输入风格名称并提供至少一份样本。")
     
     with col_list:
         st.subheader("已训练风格")
         if styles:
-            for style_name in styles.keys():
-                st.markdown(f"✅ {style_name}")
+            for style_name, style_info in styles.items():
+                sample_count = len(style_info.get("sample_features") or {}) if isinstance(style_info, dict) else 0
+                st.markdown(f"✅ {style_name}" + (f"（{sample_count} 份样本）" if sample_count else ""))
         else:
             st.info("暂无已训练风格。")
 
 with tab5:
     st.header("🎬 视频全自动生产工厂")
-    factory_state = load_json(VIDEO_FACTORY_STATE_PATH, default={})
+    factory_scripts = list_factory_scripts()
     
-    if not factory_state:
+    if not factory_scripts:
         st.info('请先在【脚本生成】页面生成脚本并点击"同步到视频工厂"。')
     else:
         # 脚本选择器
-        script_options = {script_id: f"{data.get('title', '未命名')} ({data.get('created_at', '未知时间')})" for script_id, data in factory_state.items()}
+        script_options = {script_id: f"{data.get('title', '未命名')} ({data.get('created_at', '未知时间')})" for script_id, data in factory_scripts.items()}
         selected_script_id = st.selectbox("选择要编辑的脚本", list(script_options.keys()), format_func=lambda x: script_options[x])
         
-        if selected_script_id and selected_script_id in factory_state:
-            current_script_data = factory_state[selected_script_id]
+        current_script_data = get_factory_script(selected_script_id) if selected_script_id else None
+        if current_script_data:
             st.subheader(f"当前视频标题：{current_script_data.get('title', '未命名')}")
             
             col_v1, col_v2 = st.columns([2, 1])
@@ -283,20 +374,45 @@ with tab5:
                 if not scenes:
                     st.warning("该脚本没有场景数据。")
                 else:
-                    for idx, scene in enumerate(scenes):
+                    if st.button("🎨 一键生成全部配图", use_container_width=True):
+                        deleted = {i for i in range(len(scenes)) if st.session_state.scene_deletions.get(f"{selected_script_id}_{i}", False)}
+                        progress = st.progress(0.0, text="正在并发生成配图...")
+                        def on_image_progress(done, total, idx, result):
+                            status = "♻️ 复用缓存" if result["cached"] else ("✅" if result["path"] else "❌")
+                            progress.progress(done / total, text=f"{done}/{total} 场景 {idx+1} {status}")
+                        image_results = generate_all_images(scenes, selected_script_id, skip=deleted, on_progress=on_image_progress)
+                        update_scenes(selected_script_id, {idx: dict(scenes[idx], image_url=r["path"]) for idx, r in image_results.items() if r["path"]})
+                        failed = [idx + 1 for idx, r in image_results.items() if not r["path"]]
+                        if failed:
+                            st.error(f"以下场景配图生成失败：{failed}")
+                        else:
+                            st.rerun()
+
+                    # 场景较多时分页显示，每次重跑只发送当前页的图片
+                    visible = [i for i in range(len(scenes)) if not st.session_state.scene_deletions.get(f"{selected_script_id}_{i}", False)]
+                    scene_pages = max(1, -(-len(visible) // SCENE_PAGE_SIZE))
+                    if scene_pages > 1:
+                        col_sp1, col_sp2 = st.columns([1, 3])
+                        with col_sp1:
+                            scene_page = min(st.number_input("场景页码", min_value=1, value=1, step=1, key=f"scene_page_{selected_script_id}"), scene_pages)
+                        with col_sp2:
+                            st.caption(f"共 {len(visible)} 个场景，第 {scene_page}/{scene_pages} 页")
+                    else:
+                        scene_page = 1
+                    page_start = (scene_page - 1) * SCENE_PAGE_SIZE
+
+                    for idx in visible[page_start:page_start + SCENE_PAGE_SIZE]:
+                        scene = scenes[idx]
                         scene_key = f"{selected_script_id}_{idx}"
                         
-                        # 检查该场景是否被标记为删除
-                        if st.session_state.scene_deletions.get(scene_key, False):
-                            continue
-                        
                         with st.container():
                             st.markdown(f'<div class="scene-card">', unsafe_allow_html=True)
                             
                             # 场景编号和删除按钮
                             col_scene_header = st.columns([3, 1])
                             with col_scene_header[0]:
-                                st.markdown(f'<div class="video-step">场景 {idx+1}</div>', unsafe_allow_html=True)
+                                duration_label = f" · 约 {scene['duration']}s（{scene.get('start', 0)}s 起）" if scene.get('duration') else ""
+                                st.markdown(f'<div class="video-step">场景 {idx+1}{duration_label}</div>', unsafe_allow_html=True)
                             with col_scene_header[1]:
                                 if st.button("🗑️ 删除此场景", key=f"del_scene_{scene_key}"):
                                     st.session_state.scene_deletions[scene_key] = True
@@ -306,9 +422,7 @@ with tab5:
                             content = scene.get("content", "")
                             
                             # 检查是否是画面标注（通常包含"配图建议"或"画面"等关键词）
-                            is_annotation = "配图建议" in content or "画面" in content or "（" in content
-                            
-                            if is_annotation:
+                            if is_annotation_scene(content):
                                 # 这是一个画面标注，只显示为标注，不作为配音文案
                                 annotation_text = re.sub(r'\(配图建议[：:].*?\)', '', content).strip()
                                 st.markdown(f"**画面标注** <span class='annotation-badge'>仅标注，不配音</span>：{annotation_text}", unsafe_allow_html=True)
@@ -323,18 +437,22 @@ with tab5:
                                 st.caption(f"视觉描述：{image_suggestion}")
                             
                             # 配图生成
-                            img_path = os.path.join(VIDEO_TEMP_DIR, f"img_{selected_script_id}_{idx}.png")
+                            img_path = scene_image_path(selected_script_id, idx)
                             if os.path.exists(img_path):
-                                st.image(img_path, width=400)
+                                # 默认只显示 WebP 缩略图，勾选后才加载原图
+                                if st.toggle("查看原图", key=f"full_img_{scene_key}"):
+                                    st.image(img_path)
+                                else:
+                                    st.image(ensure_thumbnail(img_path) or img_path, width=400)
                                 if st.button(f"🔄 重新生成配图 {idx+1}", key=f"regen_img_{scene_key}"):
                                     with st.spinner(f"正在重新绘制场景 {idx+1}..."):
-                                        if generate_image(image_suggestion, img_path):
+                                        if generate_scene_image(image_suggestion, img_path, force=True)[0]:
                                             st.success(f"场景 {idx+1} 配图生成成功！")
                                             st.rerun()
                             else:
                                 if st.button(f"🎨 生成配图 {idx+1}", key=f"gen_img_{scene_key}"):
                                     with st.spinner(f"DALL-E 3 正在绘制场景 {idx+1}..."):
-                                        if generate_image(image_suggestion, img_path):
+                                        if generate_scene_image(image_suggestion, img_path)[0]:
                                             st.success(f"场景 {idx+1} 配图生成成功！")
                                             st.rerun()
                             
@@ -342,32 +460,85 @@ with tab5:
                 
                 st.markdown("---")
                 if st.button("🚀 一键合成完整视频", use_container_width=True):
-                    with st.spinner("正在合成视频素材，请稍候..."):
-                        st.warning("由于当前订阅限制，视频最终渲染功能暂未开启。系统已为您准备好所有素材。")
+                    kept = [i for i in range(len(scenes)) if not st.session_state.scene_deletions.get(f"{selected_script_id}_{i}", False)]
+                    if not kept:
+                        st.warning("没有可合成的场景。")
+                    else:
+                        # 优先使用场景保存的本地配图，其次是按约定路径生成的配图
+                        local_images = {}
+                        for pos, i in enumerate(kept):
+                            fallback = scene_image_path(selected_script_id, i)
+                            if not (scenes[i].get('image_url') and os.path.exists(str(scenes[i]['image_url']))) and os.path.exists(fallback):
+                                local_images[pos] = fallback
+                        progress = st.progress(0.0, text="正在并行渲染场景片段...")
+                        def on_render_progress(done, total, idx):
+                            progress.progress(done / total, text=f"{done}/{total} 片段已渲染")
+                        assembly_report = {}
+                        try:
+                            video_path = assemble_video(
+                                [scenes[i] for i in kept],
+                                bgm_style=st.session_state.get("bgm_style", "激昂财经"),
+                                out_path=os.path.join(VIDEO_TEMP_DIR, f"final_{selected_script_id}.mp4"),
+                                image_paths=local_images,
+                                report=assembly_report,
+                                on_progress=on_render_progress,
+                            )
+                            progress.progress(1.0, text="合成完成")
+                            st.video(video_path)
+                            timings = assembly_report["timings"]
+                            st.caption(
+                                f"⏱️ 总耗时 {timings['total']:.1f}s · 渲染 {timings['render']:.1f}s（新渲染 {assembly_report['rendered']} 段，复用 {assembly_report['cached']} 段）"
+                                f" · 拼接 {timings['concat']:.1f}s" + (f" · BGM 混音 {timings['bgm']:.1f}s" if 'bgm' in timings else "")
+                            )
+                            if assembly_report.get("bgm_missing"):
+                                st.warning(f"未找到 BGM 文件 `{assembly_report['bgm_missing']}`，本次视频未混入背景音乐。请将音乐文件放入 `assets/bgm/`（或用 FINVIDEO_BGM_DIR 指定目录）。")
+                        except Exception as e:
+                            st.error(f"视频合成失败: {e}")
             
             with col_v2:
                 st.subheader("🎙️ 音色克隆中心")
                 uploaded_voice = st.file_uploader("上传音色样本 (MP3/WAV)", type=['mp3', 'wav'])
+                voice_sample_path = None
                 if uploaded_voice:
+                    # 样本按内容哈希落盘，同一样本重复上传不会产生新的缓存键
+                    voice_bytes = uploaded_voice.getvalue()
+                    voice_ext = os.path.splitext(uploaded_voice.name)[1].lower() or ".wav"
+                    voice_sample_path = os.path.join(VIDEO_TEMP_DIR, "voice_samples", f"{hashlib.sha256(voice_bytes).hexdigest()}{voice_ext}")
+                    if not os.path.exists(voice_sample_path):
+                        os.makedirs(os.path.dirname(voice_sample_path), exist_ok=True)
+                        with open(voice_sample_path, 'wb') as f:
+                            f.write(voice_bytes)
                     st.success("音色样本已接收，正在提取特征基因...")
-                st.selectbox("选择 BGM 风格", ["激昂财经", "沉稳叙事", "快节奏电子", "无"])
+                if scenes and st.button("🗣️ 一键生成全部配音", use_container_width=True):
+                    deleted = {i for i in range(len(scenes)) if st.session_state.scene_deletions.get(f"{selected_script_id}_{i}", False)}
+                    progress = st.progress(0.0, text="正在并发合成配音...")
+                    def on_tts_progress(done, total, idx, result):
+                        status = "♻️ 复用缓存" if result["cached"] else ("✅" if result["path"] else "❌")
+                        progress.progress(done / total, text=f"{done}/{total} 场景 {idx+1} {status}")
+                    tts_results = synthesize_all(scenes, voice_sample_path, skip=deleted, on_progress=on_tts_progress)
+                    retimed = apply_audio_results(scenes, tts_results, skip=deleted)
+                    update_scenes(selected_script_id, {idx: scene for idx, scene in enumerate(retimed) if scene != scenes[idx]})
+                    failed = [idx + 1 for idx, r in tts_results.items() if not r["path"]]
+                    if failed:
+                        st.error(f"以下场景配音生成失败：{failed}")
+                    else:
+                        st.rerun()
+                st.selectbox("选择 BGM 风格", ["激昂财经", "沉稳叙事", "快节奏电子", "无"], key="bgm_style")
 
 with tab6:
     st.header("📂 文稿库")
-    lib_data = load_json(EDITOR_OUTPUT_PATH, default=[])
     search_q = st.text_input("🔍 搜索文稿关键词", placeholder="输入选题、子选题或内容关键词...")
-    
-    filtered_lib = []
-    if isinstance(lib_data, list):
-        for item in lib_data:
-            if isinstance(item, dict):
-                if not search_q or search_q.lower() in str(item).lower():
-                    filtered_lib.append(item)
+    col_page1, col_page2 = st.columns([1, 3])
+    with col_page1:
+        lib_page = st.number_input("页码", min_value=1, value=1, step=1)
+    lib_total, filtered_lib = search_scripts(search_q, page=lib_page, page_size=LIBRARY_PAGE_SIZE)
+    with col_page2:
+        st.caption(f"共 {lib_total} 份文稿，第 {lib_page}/{max(1, -(-lib_total // LIBRARY_PAGE_SIZE))} 页")
     
     if not filtered_lib:
-        st.info("文稿库空空如也，快去生成一份吧！")
+        st.info("没有找到匹配的文稿。" if search_q else "文稿库空空如也，快去生成一份吧！")
     else:
-        for item in reversed(filtered_lib):
+        for item in filtered_lib:
             with st.container():
                 topic_name = item.get('topic', '未知选题')
                 created_at = item.get('created_at', '未知时间')
@@ -383,6 +554,7 @@ with tab6:
                     </div>
                     <div style="margin:10px 0; font-weight:500;">{subtopic}</div>
                     <div style="font-size:0.85rem; color:#666;">风格：{style}</div>
+                    {f'<div style="font-size:0.85rem; color:#444; margin-top:8px;">{item["snippet"]}</div>' if search_q and item.get("snippet") else ""}
                 </div>
                 """, unsafe_allow_html=True)
                 
@@ -400,14 +572,9 @@ with tab6:
                     if st.button("🎬 同步至视频工厂", key=f"sync_{item.get('id', 0)}"):
                         with st.spinner("正在解析脚本并构建视频场景..."):
                             scenes = parse_script_to_scenes(content)
-                            factory_state = load_json(VIDEO_FACTORY_STATE_PATH, default={})
-                            script_id = str(datetime.now().timestamp())
-                            factory_state[script_id] = {
-                                "title": subtopic,
-                                "scenes": scenes,
-                                "original_script": content,
-                                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            }
-                            save_json(VIDEO_FACTORY_STATE_PATH, factory_state)
+                            create_factory_script(subtopic, scenes, content)
                             st.success("✅ 文稿已同步至视频工厂！")
                             st.rerun()
+
+state_cache_end = state_cache.snapshot()
+state_cache_caption.caption(f"状态缓存：本次重跑复用 {state_cache_end['hits'] - state_cache_start['hits']} 次、重新解析 {state_cache_end['misses'] - state_cache_start['misses']} 次")
@@ -0,0 +1,92 @@
+"""
+聚类耗时随输入规模变化的基准测试（单次调用 vs map-reduce）。
+
+使用本地假客户端模拟模型延迟：固定首包延迟 + 按输入条数线性增长的生成耗时，
+不访问网络。用法：
+
+    python benchmarks/bench_cluster.py --sizes 50 100 200 400 800
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("FINVIDEO_TELEMETRY", "0")
+
+import llm_cache  # noqa: E402
+import topic_cluster  # noqa: E402
+
+WORDS = ("央行 降准 美联储 加息 A股 港股 黄金 原油 芯片 新能源 楼市 汇率 人工智能 出口 关税 消费 基建 债市 "
+         "光伏 锂电 券商 银行 保险 白酒 医药 半导体 机器人 航运 钢铁 煤炭 电力 通信 游戏 传媒 军工 地产 农业 旅游 零售 物流").split()
+
+
+class FakeCompletions:
+    def __init__(self, base_latency, per_item_latency):
+        self.base_latency = base_latency
+        self.per_item_latency = per_item_latency
+
+    def create(self, model, messages, **kwargs):
+        lines = re.findall(r"^\s*- (.+?) \(", messages[-1]["content"], re.M)
+        time.sleep(self.base_latency + self.per_item_latency * len(lines))
+        topics = []
+        for i in range(0, len(lines), 8):
+            group = lines[i:i + 8]
+            topics.append({
+                "topic": group[0][:6],
+                "heat": 10000 + len(group) * 1000 + i,
+                "news_items": [{"title": t, "url": ""} for t in group[:4]],
+            })
+        message = SimpleNamespace(content=json.dumps(topics, ensure_ascii=False))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_news(n, seed=42):
+    rng = random.Random(seed)
+    return [{"title": "".join(rng.sample(WORDS, 5)), "source": rng.choice(["国际新闻", "全网热搜", "今日头条"])} for _ in range(n)]
+
+
+def run(sizes, base_latency, per_item_latency, chunk_size, workers):
+    # 基准测试不读写项目内的响应缓存
+    llm_cache.default_cache = llm_cache.LLMCache(cache_dir=tempfile.mkdtemp(prefix="bench_llm_cache_"))
+    topic_cluster.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(base_latency, per_item_latency)))
+    rows = []
+    for n in sizes:
+        news = make_news(n)
+        start = time.perf_counter()
+        topic_cluster._cluster_chunk(topic_cluster.collapse_near_duplicates(news), use_cache=False)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        topics = topic_cluster.cluster_topics_mapreduce(news, chunk_size=chunk_size, max_workers=workers, use_cache=False)
+        mapreduce = time.perf_counter() - start
+        rows.append({"items": n, "single_s": round(single, 3), "mapreduce_s": round(mapreduce, 3), "topics": len(topics)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 800])
+    parser.add_argument("--base-latency", type=float, default=0.3)
+    parser.add_argument("--per-item-latency", type=float, default=0.004)
+    parser.add_argument("--chunk-size", type=int, default=topic_cluster.MAP_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=topic_cluster.MAP_CONCURRENCY)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args()
+
+    rows = run(args.sizes, args.base_latency, args.per_item_latency, args.chunk_size, args.workers)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'items':>6} {'single(s)':>10} {'map-reduce(s)':>14} {'topics':>7}")
+    for row in rows:
+        print(f"{row['items']:>6} {row['single_s']:>10.3f} {row['mapreduce_s']:>14.3f} {row['topics']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+模块冷启动导入耗时基准：每次在全新的子进程里导入，取中位数。
+
+用于确认重量级依赖（openai、streamlit 等）没有在导入时被拉进来。用法：
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --modules topic_cluster app --runs 7 --json
+    python benchmarks/bench_import.py --modules editor_generate --top 10   # 显示最耗时的子模块
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["news_fetcher", "topic_cluster", "editor_generate", "video_utils", "storage", "refresh_jobs"]
+HEAVY_MODULES = ["openai", "httpx", "streamlit", "PIL", "docx"]
+
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    # 不带密钥也必须能导入；同时避免脚本在导入时意外访问网络
+    env.pop("OPENAI_API_KEY", None)
+    env["FINVIDEO_TELEMETRY"] = "0"
+    env["FINVIDEO_REFRESH_INTERVAL"] = "0"
+    return env
+
+
+def measure(module, runs):
+    seconds, heavy = [], []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _PROBE.format(root=ROOT, module=module, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, cwd=ROOT, env=_env())
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败"}
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        seconds.append(data["seconds"])
+        heavy = data["heavy"]
+    return {"module": module, "median_s": round(statistics.median(seconds), 4), "min_s": round(min(seconds), 4), "heavy_imports": heavy}
+
+
+def top_imports(module, top):
+    """
+    用 -X importtime 找出累计耗时最多的子模块。
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import {module}"],
+                            capture_output=True, text=True, cwd=ROOT, env=_env())
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if parts[0].isdigit():
+            rows.append({"name": parts[2].strip(), "self_ms": int(parts[0]) / 1000, "cumulative_ms": int(parts[1]) / 1000})
+    # 只看顶层包，避免同一依赖的子模块刷屏
+    rows = [r for r in rows if "." not in r["name"]]
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="每个模块显示累计耗时最多的前 N 个顶层依赖")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args()
+
+    rows = []
+    for module in args.modules:
+        row = measure(module, args.runs)
+        if args.top and "error" not in row:
+            row["top_imports"] = top_imports(module, args.top)
+        rows.append(row)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'module':<18} {'median(s)':>10} {'min(s)':>8}  heavy imports")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['module']:<18} {'error':>10}           {row['error']}")
+            continue
+        print(f"{row['module']:<18} {row['median_s']:>10.3f} {row['min_s']:>8.3f}  {', '.join(row['heavy_imports']) or '-'}")
+        for item in row.get("top_imports", []):
+            print(f"{'':<18} {item['cumulative_ms']:>9.1f}ms  {item['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+端到端流水线基准测试：抓取 → 聚类 → 生成脚本 → 切分场景 → 生成配图。
+
+启动本地假服务（见 fake_services.py）代替天行数据与 OpenAI 接口，完全离线；
+所有数据写入临时目录，不影响项目内的新闻库、缓存与配图。输出各阶段的
+p50/p95 耗时、吞吐与内存峰值。用法：
+
+    python benchmarks/bench_pipeline.py --runs 5 --json > bench.json
+    python benchmarks/bench_pipeline.py --chat-latency 1.0 --news-per-endpoint 200
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import DEFAULT_CONFIG, FakeServices  # noqa: E402
+
+# (阶段名, 吞吐单位)
+STAGES = [
+    ("fetch", "news"),
+    ("cluster", "news"),
+    ("script", "chars"),
+    ("scenes", "scenes"),
+    ("images", "images"),
+]
+
+
+def percentile(values, pct):
+    """
+    最近秩百分位数。
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.4999)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Pipeline:
+    """
+    持有被测模块与临时目录，按阶段执行一次完整流水线。
+    """
+
+    def __init__(self, work_dir, image_concurrency):
+        import editor_generate
+        import image_pipeline
+        import llm_cache
+        import news_fetcher
+        import news_store
+        import topic_cluster
+        import video_utils
+
+        self.work_dir = work_dir
+        self.image_concurrency = image_concurrency
+        self.modules = {
+            "editor_generate": editor_generate, "image_pipeline": image_pipeline, "news_fetcher": news_fetcher,
+            "news_store": news_store, "topic_cluster": topic_cluster, "video_utils": video_utils,
+        }
+        llm_cache.default_cache = llm_cache.LLMCache(cache_dir=os.path.join(work_dir, "llm_cache"))
+        news_fetcher.RAW_DATA_PATH = os.path.join(work_dir, "raw_news.json")
+
+    def run_once(self, run_id, on_stage):
+        m = self.modules
+        # 每轮使用新的新闻库，保证抓取结果都会被入库而不是按内容哈希跳过
+        m["news_store"].NEWS_STORE_PATH = os.path.join(self.work_dir, f"news_store_{run_id}.json")
+
+        def fetch():
+            m["news_fetcher"].main(force=True)
+            news = m["news_store"].current_items(m["news_store"].load_store())
+            return news, len(news)
+
+        news = on_stage("fetch", fetch)
+
+        def cluster():
+            return m["topic_cluster"].cluster_topics(news, use_cache=False), len(news)
+
+        topics = on_stage("cluster", cluster)
+        if not topics:
+            raise RuntimeError("聚类没有返回任何选题")
+        topic = topics[0]
+
+        def script():
+            subtopic = (topic.get("news_items") or [{"title": topic["topic"]}])[0]["title"]
+            content = m["editor_generate"].generate_script(
+                topic["topic"], subtopic, "深度解析", m["editor_generate"].DEFAULT_STYLE_DESC,
+                topic.get("news_items", []), use_cache=False)
+            if content.startswith("文稿生成失败"):
+                raise RuntimeError(content)
+            return content, len(content)
+
+        content = on_stage("script", script)
+
+        def scenes():
+            parsed = m["video_utils"].parse_script_to_scenes(content)
+            return parsed, len(parsed)
+
+        parsed = on_stage("scenes", scenes)
+
+        def images():
+            results = m["image_pipeline"].generate_all_images(
+                parsed, f"bench{run_id}", out_dir=os.path.join(self.work_dir, "images"),
+                max_concurrency=self.image_concurrency, rate_per_minute=0, force=True,
+                cache_dir=os.path.join(self.work_dir, "image_cache"))
+            ok = sum(1 for r in results.values() if r["path"])
+            if ok < len(results):
+                raise RuntimeError(f"{len(results) - ok} 张配图生成失败")
+            return results, ok
+
+        on_stage("images", images)
+
+
+def run(config, runs, warmup, image_concurrency, verbose=False):
+    services = FakeServices(config).start()
+    os.environ["TIANAPI_BASE_URL"] = services.tianapi_url
+    os.environ["OPENAI_BASE_URL"] = services.openai_url
+    os.environ["OPENAI_API_KEY"] = "bench"
+    samples = {name: {"latency": [], "units": 0, "peak_bytes": 0} for name, _ in STAGES}
+    end_to_end = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+            # 调用记录照常开启（属于被测热路径），但写到临时目录
+            os.environ["FINVIDEO_TELEMETRY_PATH"] = os.path.join(work_dir, "llm_requests.jsonl")
+            pipeline = Pipeline(work_dir, image_concurrency)
+            tracemalloc.start()
+            for run_id in range(warmup + runs):
+                record = run_id >= warmup
+
+                def on_stage(name, fn):
+                    tracemalloc.reset_peak()
+                    # 只统计阶段内新增的内存峰值，不含之前已导入模块与缓存占用的基线
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    start = time.perf_counter()
+                    # 被测模块用 print 记日志，基准输出中默认屏蔽
+                    with contextlib.redirect_stdout(sys.stderr if verbose else io.StringIO()):
+                        result, units = fn()
+                    elapsed = time.perf_counter() - start
+                    if record:
+                        stage = samples[name]
+                        stage["latency"].append(elapsed)
+                        stage["units"] += units
+                        stage["peak_bytes"] = max(stage["peak_bytes"], tracemalloc.get_traced_memory()[1] - baseline)
+                    return result
+
+                start = time.perf_counter()
+                pipeline.run_once(run_id, on_stage)
+                if record:
+                    end_to_end.append(time.perf_counter() - start)
+            tracemalloc.stop()
+            import telemetry
+            telemetry.default_writer.flush()
+    finally:
+        counts = services.counts
+        services.stop()
+
+    stages = {}
+    for name, unit in STAGES:
+        stage = samples[name]
+        total = sum(stage["latency"])
+        stages[name] = {
+            "p50_s": round(percentile(stage["latency"], 50), 4),
+            "p95_s": round(percentile(stage["latency"], 95), 4),
+            "mean_s": round(total / len(stage["latency"]), 4),
+            "max_s": round(max(stage["latency"]), 4),
+            "throughput_per_s": round(stage["units"] / total, 2) if total else None,
+            "unit": unit,
+            "units_per_run": stage["units"] / len(stage["latency"]),
+            "peak_py_mem_mb": round(stage["peak_bytes"] / (1024 * 1024), 2),
+        }
+    return {
+        "runs": runs,
+        "warmup": warmup,
+        "config": config,
+        "stages": stages,
+        "end_to_end": {
+            "p50_s": round(percentile(end_to_end, 50), 4),
+            "p95_s": round(percentile(end_to_end, 95), 4),
+            "runs_per_min": round(60 * len(end_to_end) / sum(end_to_end), 2),
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "requests": counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热轮数")
+    parser.add_argument("--image-concurrency", type=int, default=4)
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    parser.add_argument("--output", help="同时把 JSON 结果写入该文件")
+    parser.add_argument("--verbose", action="store_true", help="显示被测模块的日志")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    report = run(config, args.runs, args.warmup, args.image_concurrency, args.verbose)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"{'stage':>8} {'p50(s)':>8} {'p95(s)':>8} {'throughput':>18} {'py peak(MB)':>12}")
+    for name, stage in report["stages"].items():
+        throughput = f"{stage['throughput_per_s']} {stage['unit']}/s"
+        print(f"{name:>8} {stage['p50_s']:>8.3f} {stage['p95_s']:>8.3f} {throughput:>18} {stage['peak_py_mem_mb']:>12.2f}")
+    e2e = report["end_to_end"]
+    print(f"end-to-end p50 {e2e['p50_s']:.3f}s p95 {e2e['p95_s']:.3f}s, peak RSS {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
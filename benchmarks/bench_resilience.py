@@ -0,0 +1,118 @@
+"""
+模型调用容错基准：在注入长尾延迟与错误的本地假服务上比较对冲开/关时的尾延迟，并验证熔断与备用模型。
+
+完全离线（见 fake_services.py），每个场景都从空的耗时统计与熔断状态开始。用法：
+
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --calls 300 --slow-rate 0.03 --slow-latency 3 --json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import percentile  # noqa: E402
+from fake_services import FakeServices  # noqa: E402
+
+
+def run_scenario(name, services, fault_config, calls, concurrency, hedging):
+    import editor_generate
+    import resilience
+    import telemetry
+
+    services.config.update(fault_config)
+    resilience.reset()
+    resilience.HEDGING_ENABLED = hedging
+    telemetry.default_writer.flush()
+    telemetry.default_writer.path = f"{os.environ['FINVIDEO_TELEMETRY_PATH']}.{name}"
+    before = services.counts
+
+    def one(i):
+        start = time.perf_counter()
+        # 每次的选题不同，保证不命中响应缓存
+        content = editor_generate.generate_script(f"选题{name}{i}", "子选题", "深度解析", editor_generate.DEFAULT_STYLE_DESC, [], use_cache=False)
+        return time.perf_counter() - start, content.startswith("文稿生成失败")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(calls)))
+    elapsed = time.perf_counter() - start
+    telemetry.default_writer.flush()
+    entries = telemetry.load_entries(telemetry.default_writer.path)
+    after = services.counts
+    latencies = [r[0] for r in results]
+    return {
+        "scenario": name,
+        "hedging": hedging,
+        "faults": fault_config,
+        "calls": calls,
+        "failed": sum(1 for r in results if r[1]),
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "max_s": round(max(latencies), 3),
+        "wall_s": round(elapsed, 2),
+        "upstream_requests": after.get("chat", 0) - before.get("chat", 0),
+        "hedged": sum(1 for e in entries if e.get("hedged")),
+        "fallbacks": sum(1 for e in entries if e.get("fallback_from")),
+        "retries": sum(e.get("retries") or 0 for e in entries),
+        "breakers": resilience.breaker_states(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chat-latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args()
+
+    services = FakeServices({"chat_latency": args.chat_latency, "script_paragraphs": 5, "seed": 1}).start()
+    os.environ["OPENAI_BASE_URL"] = services.openai_url
+    os.environ["OPENAI_API_KEY"] = "bench"
+    tail = {"slow_rate": args.slow_rate, "slow_latency": args.slow_latency, "error_rate": 0.0, "fail_models": ""}
+    scenarios = [
+        ("tail_no_hedge", tail, False),
+        ("tail_hedge", tail, True),
+        ("errors", {"slow_rate": 0.0, "error_rate": args.error_rate, "fail_models": ""}, True),
+        ("primary_down", {"slow_rate": 0.0, "error_rate": 0.0, "fail_models": "gemini-2.5-flash"}, True),
+    ]
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_resilience_") as work_dir:
+            os.environ["FINVIDEO_TELEMETRY_PATH"] = os.path.join(work_dir, "llm_requests.jsonl")
+            import llm_cache
+            llm_cache.default_cache = llm_cache.LLMCache(cache_dir=os.path.join(work_dir, "llm_cache"))
+            for name, faults, hedging in scenarios:
+                rows.append(run_scenario(name, services, faults, args.calls, args.concurrency, hedging))
+    finally:
+        services.stop()
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'scenario':<14} {'p50(s)':>7} {'p95(s)':>7} {'p99(s)':>7} {'max(s)':>7} {'failed':>6} {'upstream':>8} {'hedged':>6} {'retries':>7} {'fallbk':>6}")
+    for r in rows:
+        print(f"{r['scenario']:<14} {r['p50_s']:>7.3f} {r['p95_s']:>7.3f} {r['p99_s']:>7.3f} {r['max_s']:>7.3f} {r['failed']:>6} "
+              f"{r['upstream_requests']:>8} {r['hedged']:>6} {r['retries']:>7} {r['fallbacks']:>6}")
+    for r in rows:
+        open_breakers = {m: b["state"] for m, b in r["breakers"].items() if b["state"] != "closed"}
+        if open_breakers:
+            print(f"{r['scenario']}: 熔断状态 {open_breakers}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+本地假服务：在同一个端口上模拟天行数据的新闻接口和 OpenAI 的 chat / images 接口，供基准测试离线使用。
+
+    services = FakeServices({"chat_latency": 0.5}).start()
+    os.environ["TIANAPI_BASE_URL"] = services.tianapi_url
+    os.environ["OPENAI_BASE_URL"] = services.openai_url
+    ...
+    services.stop()
+
+延迟、返回数据量与故障注入（错误率、长尾延迟、指定模型失败）都由 config 控制，见 DEFAULT_CONFIG。
+"""
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+WORDS = ("央行 降准 美联储 加息 A股 港股 黄金 原油 芯片 新能源 楼市 汇率 人工智能 出口 关税 消费 基建 债市 "
+         "光伏 锂电 券商 银行 保险 白酒 医药 半导体 机器人 航运 钢铁 煤炭 电力 通信 游戏 传媒 军工 地产 农业 旅游 零售 物流").split()
+
+DEFAULT_CONFIG = {
+    "tianapi_latency": 0.2,        # 每个新闻接口的响应延迟（秒）
+    "news_per_endpoint": 50,       # 每个新闻接口返回的条数
+    "chat_latency": 0.3,           # chat 接口的首包延迟（秒）
+    "chat_per_item_latency": 0.002,  # 聚类请求按新闻条数增加的生成耗时（秒/条）
+    "stream_chunk_latency": 0.01,  # 流式返回时每段之间的间隔（秒）
+    "script_paragraphs": 30,       # 生成脚本的正文段落数
+    "image_latency": 0.5,          # 图片生成接口的延迟（秒）
+    "image_side": 512,             # 返回图片的边长（像素），决定下载的数据量
+    # 故障注入（只作用于 chat 与图片接口）
+    "error_rate": 0.0,             # 按该比例返回 503
+    "slow_rate": 0.0,              # 按该比例额外延迟 slow_latency 秒，模拟长尾
+    "slow_latency": 5.0,
+    "stream_cut_rate": 0.0,        # 按该比例在流式回复输出一半时断开连接
+    "fail_models": "",             # 逗号分隔的模型名，请求这些模型一律返回 503，用于验证熔断与备用模型
+    "seed": 0,                     # 故障注入的随机种子
+}
+
+
+def _news_list(endpoint, count, seed):
+    rng = random.Random(f"{endpoint}-{seed}")
+    items = []
+    for i in range(count):
+        title = "".join(rng.sample(WORDS, 5))
+        items.append({"title": title, "word": title, "description": f"{title}的详细报道", "digest": title,
+                      "url": f"https://news.example.com/{endpoint}/{seed}/{i}", "ctime": "2024-01-01 08:00:00"})
+    return items
+
+
+def _cluster_reply(prompt):
+    lines = re.findall(r"^\s*- (.+?) \(", prompt, re.M)
+    topics = []
+    for i in range(0, len(lines), 8):
+        group = lines[i:i + 8]
+        topics.append({
+            "topic": group[0][:6],
+            "heat": 10000 + len(group) * 1000 + i,
+            "news_items": [{"title": t, "url": ""} for t in group[:4]],
+        })
+    # 分行输出，流式返回时选题逐个到达
+    return json.dumps(topics, ensure_ascii=False, indent=2), len(lines)
+
+
+def _script_reply(paragraphs):
+    rng = random.Random(paragraphs)
+    parts = ["### 标题矩阵", "深度追问风: [长标题] 降准之后钱去哪了 [短标题] 钱去哪了", "### 正文"]
+    for i in range(paragraphs):
+        sentence = "，".join("".join(rng.sample(WORDS, 3)) for _ in range(4))
+        parts.append(f"第{i + 1}点，{sentence}。")
+        if i % 3 == 0:
+            parts.append(f"（配图建议：{''.join(rng.sample(WORDS, 2))}走势图）")
+    parts.append("【本视频文稿特点】逻辑清晰，数据驱动。")
+    return "\n".join(parts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        path = self.path.split("?")[0].strip("/")
+        if path.startswith("images/"):
+            self._send(200, self.server.image_bytes, "image/png")
+            return
+        # 天行接口形如 /{endpoint}/index?key=...
+        endpoint = path.split("/")[0]
+        self.server.count("tianapi")
+        time.sleep(self.config["tianapi_latency"])
+        seed = self.server.count(f"tianapi:{endpoint}")
+        self._send_json({"code": 200, "msg": "success",
+                         "result": {"list": _news_list(endpoint, self.config["news_per_endpoint"], seed)}})
+
+    def _inject_fault(self, kind, body):
+        """
+        按配置注入故障：返回 True 表示已回复 503，调用方不再处理；慢请求只额外等待。
+        """
+        failing = {m.strip() for m in str(self.config["fail_models"]).split(",") if m.strip()}
+        roll_error, roll_slow = self.server.roll(), self.server.roll()
+        if body.get("model") in failing or roll_error < self.config["error_rate"]:
+            self.server.count(f"{kind}:errors")
+            self._send_json({"error": {"message": "injected failure", "type": "server_error"}}, status=503)
+            return True
+        if roll_slow < self.config["slow_rate"]:
+            self.server.count(f"{kind}:slow")
+            time.sleep(self.config["slow_latency"])
+        return False
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+        kind = "chat" if path.endswith("/chat/completions") else "images" if path.endswith("/images/generations") else None
+        if kind:
+            # 在注入故障前计数：失败与慢请求也算作一次上游请求
+            self.server.count(kind)
+            if self._inject_fault(kind, body):
+                return
+        if path.endswith("/chat/completions"):
+            self._chat(body)
+        elif path.endswith("/images/generations"):
+            time.sleep(self.config["image_latency"])
+            n = self.server.count("image_urls")
+            host, port = self.server.server_address[:2]
+            self._send_json({"created": int(time.time()), "data": [{"url": f"http://{host}:{port}/images/{n}.png"}]})
+        else:
+            self._send_json({"error": {"message": f"unknown path {path}"}}, status=404)
+
+    def _chat(self, body):
+        prompt = body.get("messages", [{}])[-1].get("content", "")
+        delay = self.config["chat_latency"]
+        if "聚类出" in prompt:
+            content, items = _cluster_reply(prompt)
+            delay += self.config["chat_per_item_latency"] * items
+        else:
+            content = _script_reply(self.config["script_paragraphs"])
+        time.sleep(delay)
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            self._send_json({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)},
+            })
+            return
+        # 流式返回：按行切成 SSE 事件
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        lines = content.splitlines(keepends=True)
+        cut = self.server.roll() < self.config["stream_cut_rate"]
+        if cut:
+            self.server.count("chat:cut")
+            lines = lines[:len(lines) // 2]
+        for line in lines:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.config["stream_chunk_latency"])
+        if not cut:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(config["seed"])
+        side = config["image_side"]
+        # 随机像素几乎无法压缩，PNG 大小约为 side*side*3 字节
+        image = Image.frombytes("RGB", (side, side), random.Random(side).randbytes(side * side * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        self.image_bytes = buffer.getvalue()
+
+    def roll(self):
+        with self._lock:
+            return self._rng.random()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return self.counts[name]
+
+
+class FakeServices:
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        self._server = _Server((self.host, self.port), self.config)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def counts(self):
+        return dict(self._server.counts) if self._server else {}
+
+    @property
+    def tianapi_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def openai_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="启动本地假服务")
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+    services = FakeServices(port=args.port).start()
+    print(f"TIANAPI_BASE_URL={services.tianapi_url}")
+    print(f"OPENAI_BASE_URL={services.openai_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        services.stop()
@@ -0,0 +1,61 @@
+import os
+import sys
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SECRETS_PATHS = [
+    os.path.join(BASE_DIR, ".streamlit", "secrets.toml"),
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+]
+
+_file_secrets = None
+
+def _load_secrets_files():
+    # 与 st.secrets 读取同样的 secrets.toml，但不需要导入 streamlit；项目目录中的配置优先
+    global _file_secrets
+    if _file_secrets is not None:
+        return _file_secrets
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            tomllib = None
+    merged = {}
+    for path in reversed(SECRETS_PATHS):
+        if tomllib is None or not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                merged.update(tomllib.load(f))
+        except Exception as e:
+            print(f"[WARN] 无法解析 {path}: {e}")
+    _file_secrets = merged
+    return merged
+
+def _lookup(data, path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, TypeError):
+            return None
+    return data
+
+def get_setting(env_name, secret_path=None, default=None):
+    """
+    读取配置：环境变量优先，其次是 Streamlit Secrets（secret_path 为嵌套键元组，默认与环境变量同名）。
+    只有在 streamlit 已被导入（即运行在应用内）时才读 st.secrets，脚本与命令行直接解析 secrets.toml。
+    """
+    value = os.getenv(env_name)
+    if value:
+        return value
+    secret_path = secret_path or (env_name,)
+    if "streamlit" in sys.modules:
+        try:
+            value = _lookup(sys.modules["streamlit"].secrets, secret_path)
+        except Exception:
+            value = None
+    if value is None:
+        value = _lookup(_load_secrets_files(), secret_path)
+    return value if value not in (None, "") else default
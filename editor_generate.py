@@ -1,27 +1,37 @@
-import os
-import streamlit as st
-from openai import OpenAI
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+from llm_cache import async_cached_chat_completion, cached_chat_completion, cached_chat_stream
+from openai_client import get_client, new_async_client
+from prompt_budget import SCRIPT_CONTEXT_BUDGET, STYLE_SAMPLES_BUDGET, STYLE_TAIL_RATIO, describe_report, new_report, pack_by_priority, pack_evenly, truncate_to_tokens
 
-# 优先从 Streamlit Secrets 或环境变量中读取 API 密钥
-try:
-    # Streamlit Cloud 上会使用 Secrets
-    openai_api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-except:
-    # 本地调试时使用环境变量
-    openai_api_key = os.getenv("OPENAI_API_KEY")
+# 客户端在首次调用模型时才创建（见 openai_client.py）；测试或基准可把 client 替换为假客户端
+client = None
 
-if openai_api_key:
-    client = OpenAI(api_key=openai_api_key)
-else:
-    client = OpenAI()  # 会自动从 OPENAI_API_KEY 环境变量中读取
+STYLE_MODEL = "gpt-4.1-mini"
+STYLE_CONCURRENCY = 8
+STYLE_SAMPLE_TOKENS = 6000  # 单个样本送去分析的 token 上限
+SCRIPT_MODEL = "gemini-2.5-flash"
+SCRIPT_TEMPERATURE = 0.7
+BATCH_CONCURRENCY = 4
+DEFAULT_STYLE_DESC = "口语化、深度分析"
 
-def analyze_multi_styles(samples):
+def analyze_multi_styles(samples, use_cache=True, budget=None, budget_report=None):
     """
     使用 GPT-4o 对多个样本文稿进行交叉分析，提取共性基因
+    样本总量超出 token 预算时均分预算、各自保留开头与结尾；传入 budget_report 字典时写入截断情况。
     """
+    samples = [s for s in samples if s.strip()]
+    report = new_report(budget or STYLE_SAMPLES_BUDGET)
+    packed = pack_evenly(samples, report["budget"], tail_ratio=STYLE_TAIL_RATIO, report=report)
+    if budget_report is not None:
+        budget_report.update(report)
+    if describe_report(report):
+        print(f"[INFO] 风格分析{describe_report(report)}")
     samples_text = ""
-    for i, s in enumerate(samples):
-        if s.strip():
+    for i, s in enumerate(packed):
+        if s:
             samples_text += f"--- 样本 {i+1} ---\n{s}\n\n"
     
     prompt = f"""
@@ -42,25 +52,159 @@ def analyze_multi_styles(samples):
     请直接输出风格描述，确保描述精准且具有可操作性。
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini", # 路由至 GPT-4o
+        return cached_chat_completion(
+            client or get_client(),
+            model=STYLE_MODEL, # 路由至 GPT-4o
             messages=[
                 {"role": "system", "content": "你是一个专业的自媒体风格分析师。"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3
+            temperature=0.3,
+            bypass_cache=not use_cache,
+            stage="style"
         )
-        return response.choices[0].message.content
     except Exception as e:
         return f"风格分析失败: {str(e)}"
 
-def generate_script(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template=""):
+def sample_hash(text):
     """
-    使用 Gemini 2.5 Flash 生成深度长文稿，支持 SOP 约束
+    样本的内容哈希（去掉首尾空白），用作单样本特征的缓存键。
     """
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+def _sample_feature_messages(sample):
+    sample = truncate_to_tokens(sample.strip(), STYLE_SAMPLE_TOKENS, tail_ratio=STYLE_TAIL_RATIO)
+    prompt = f"""
+    请分析下面这一份自媒体文稿的写作风格，只描述可观察到的特征（200 字以内），按以下四项分条列出：
+    1. 核心语感
+    2. 常用句式
+    3. 叙事逻辑
+    4. 标志性口头禅或固定开场/结尾方式
+    不要提取低俗、套路化的口癖（如：老铁、扒拉、干货等）。
+
+    【文稿】：
+    {sample}
+    """
+    return [
+        {"role": "system", "content": "你是一个专业的自媒体风格分析师。"},
+        {"role": "user", "content": prompt}
+    ]
+
+async def _extract_features_async(samples, max_concurrency, on_progress, use_cache):
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results = {}
+    done = 0
+    async_client = new_async_client()
+    async with async_client:
+
+        async def run(key, sample):
+            nonlocal done
+            async with semaphore:
+                try:
+                    features = await async_cached_chat_completion(
+                        async_client,
+                        model=STYLE_MODEL,
+                        messages=_sample_feature_messages(sample),
+                        temperature=0.3,
+                        bypass_cache=not use_cache,
+                        stage="style_sample"
+                    )
+                    if not features:
+                        raise ValueError("模型返回空内容")
+                    results[key] = {"ok": True, "features": features, "error": None}
+                except Exception as e:
+                    results[key] = {"ok": False, "features": None, "error": str(e)}
+            done += 1
+            if on_progress:
+                on_progress(done, len(samples), key, results[key])
+
+        await asyncio.gather(*(run(key, sample) for key, sample in samples.items()))
+    return results
+
+def merge_style_features(features, use_cache=True):
+    """
+    归并多份单样本特征为最终的风格描述。特征按样本哈希排序，样本集合不变时命中缓存。
+    """
+    features_text = "\n\n".join(f"--- 样本特征 {i+1} ---\n{text}" for i, (_, text) in enumerate(sorted(features.items())))
+    prompt = f"""
+    以下是同一位博主多份文稿各自的风格特征分析。请交叉比对，归纳出该博主最本质的“核心风格基因”（总字数 300 字以内）：
+    1. 核心语感（如：激进、专业、亲和、毒舌等）
+    2. 常用句式（如：爱用反问、多用短句、喜欢列举数据等）
+    3. 叙事逻辑（如：先抑后扬、剥洋葱式拆解、故事驱动等）
+    4. 标志性口头禅或固定开场/结尾方式
+
+    只保留在多份样本中反复出现的特征，个别样本独有的特征不要写入。
+    【负面约束】明确禁止提取和鼓励任何低俗、套路化的口癖（如：老铁、扒拉、干货等）。
+
+    【单样本特征】：
+    {features_text}
+
+    请直接输出风格描述，确保描述精准且具有可操作性。
+    """
+    return cached_chat_completion(
+        client or get_client(),
+        model=STYLE_MODEL,
+        messages=[
+            {"role": "system", "content": "你是一个专业的自媒体风格分析师。"},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        bypass_cache=not use_cache,
+        stage="style_merge"
+    )
+
+def analyze_styles_hierarchical(samples, known_features=None, max_concurrency=STYLE_CONCURRENCY, on_progress=None, use_cache=True):
+    """
+    分层风格分析：每个样本单独并发提取特征（按内容哈希复用 known_features 中已有的结果），
+    再用一次归并调用得到最终风格描述。追加样本时只需为新样本调用一次模型。
+    known_features 与返回的 sample_features 结构相同：{样本哈希: {"features", "chars", "added_at"}}。
+    返回 (风格描述, sample_features, 统计)；统计含 new / reused / failed 与各阶段耗时。
+    """
+    start = time.perf_counter()
+    sample_features = dict(known_features or {})
+    pending = {}
+    for sample in samples:
+        if sample.strip():
+            key = sample_hash(sample)
+            if key not in sample_features:
+                pending[key] = sample
+    stats = {"new": len(pending), "reused": len(sample_features), "failed": 0}
+
+    results = asyncio.run(_extract_features_async(pending, max_concurrency, on_progress, use_cache)) if pending else {}
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for key, result in results.items():
+        if result["ok"]:
+            sample_features[key] = {"features": result["features"], "chars": len(pending[key].strip()), "added_at": now}
+        else:
+            stats["failed"] += 1
+            print(f"[ERROR] 样本 {key[:8]} 风格分析失败: {result['error']}")
+    stats["extract_seconds"] = time.perf_counter() - start
+    if not sample_features:
+        return "风格分析失败: 没有可用的样本特征", sample_features, stats
+
+    merge_start = time.perf_counter()
+    try:
+        description = merge_style_features({k: v["features"] for k, v in sample_features.items()}, use_cache=use_cache)
+    except Exception as e:
+        description = f"风格分析失败: {str(e)}"
+    stats["merge_seconds"] = time.perf_counter() - merge_start
+    stats["total_seconds"] = time.perf_counter() - start
+    return description, sample_features, stats
+
+def build_script_messages(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template="", budget=None, budget_report=None):
+    """
+    构造脚本生成的对话消息，普通与流式生成共用。
+    背景素材按顺序（即优先级）装入 token 预算，超出部分截断或丢弃；传入 budget_report 字典时写入截断情况。
+    """
+    report = new_report(budget or SCRIPT_CONTEXT_BUDGET)
+    packed = pack_by_priority([f"{news.get('title')}\n内容摘要: {news.get('summary', '暂无摘要')}" for news in context_news], report["budget"], report=report)
+    if budget_report is not None:
+        budget_report.update(report)
+    if describe_report(report):
+        print(f"[INFO] 脚本生成{describe_report(report)}")
     news_context = ""
-    for idx, news in enumerate(context_news):
-        news_context += f"素材{idx+1}: {news.get('title')}\n内容摘要: {news.get('summary', '暂无摘要')}\n\n"
+    for idx, item in enumerate([x for x in packed if x]):
+        news_context += f"素材{idx+1}: {item}\n\n"
 
     sop_instruction = f"\n### 强制 SOP 结构约束\n请严格按照以下结构进行创作：\n{sop_template}" if sop_template else ""
 
@@ -93,16 +237,113 @@ def generate_script(topic_name, subtopic_name, style_name, style_desc, context_n
     
     请直接输出 Markdown 格式，确保字数充足，逻辑严密。
     """
+    return [
+        {"role": "system", "content": "你是一个擅长长视频创作的财经视频编导。"},
+        {"role": "user", "content": prompt}
+    ]
 
+def generate_script(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template="", use_cache=True, budget_report=None):
+    """
+    使用 Gemini 2.5 Flash 生成深度长文稿，支持 SOP 约束。
+    相同的选题、风格与 SOP 会直接命中缓存；use_cache=False 时强制重新生成。
+    """
+    messages = build_script_messages(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template, budget_report=budget_report)
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=[
-                {"role": "system", "content": "你是一个擅长长视频创作的财经视频编导。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
+        return cached_chat_completion(
+            client or get_client(),
+            model=SCRIPT_MODEL,
+            messages=messages,
+            temperature=SCRIPT_TEMPERATURE,
+            bypass_cache=not use_cache,
+            stage="script"
         )
-        return response.choices[0].message.content
     except Exception as e:
         return f"文稿生成失败: {str(e)}"
+
+def generate_script_stream(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template="", use_cache=True, timing=None, budget_report=None):
+    """
+    流式生成脚本，逐段 yield 文本。
+    传入 timing 字典时会写入 ttft（首字耗时）与 total（总耗时），单位秒。
+    """
+    messages = build_script_messages(topic_name, subtopic_name, style_name, style_desc, context_news, sop_template, budget_report=budget_report)
+    try:
+        yield from cached_chat_stream(
+            client or get_client(),
+            model=SCRIPT_MODEL,
+            messages=messages,
+            temperature=SCRIPT_TEMPERATURE,
+            bypass_cache=not use_cache,
+            timing=timing,
+            stage="script"
+        )
+    except Exception as e:
+        yield f"文稿生成失败: {str(e)}"
+
+def build_batch_jobs(topics, style_names, styles=None):
+    """
+    展开批量任务：每个选题的每个子选题 × 每种风格生成一份脚本。
+    styles 为 blogger_styles.json 的内容，用于取风格描述与 SOP。
+    """
+    styles = styles or {}
+    jobs = []
+    for t in topics:
+        if not isinstance(t, dict) or not t.get("topic"):
+            continue
+        news_items = [n for n in t.get("news_items", []) if isinstance(n, dict)]
+        for news in news_items:
+            for style_name in style_names:
+                style = styles.get(style_name) if isinstance(styles.get(style_name), dict) else {}
+                jobs.append({
+                    "topic": t.get("topic"),
+                    "subtopic": news.get("title"),
+                    "style": style_name,
+                    "style_desc": style.get("description", DEFAULT_STYLE_DESC),
+                    "sop_template": style.get("sop_template", ""),
+                    "context_news": news_items,
+                })
+    return jobs
+
+async def _generate_batch_async(jobs, max_concurrency, on_progress, use_cache):
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results = [None] * len(jobs)
+    done = 0
+    # 每批新建异步客户端：其连接池绑定在本次 asyncio.run 的事件循环上
+    async_client = new_async_client()
+    async with async_client:
+
+        async def run(index, job):
+            nonlocal done
+            async with semaphore:
+                start = time.perf_counter()
+                messages = build_script_messages(job["topic"], job["subtopic"], job["style"], job["style_desc"], job["context_news"], job.get("sop_template", ""))
+                try:
+                    content = await async_cached_chat_completion(
+                        async_client,
+                        model=SCRIPT_MODEL,
+                        messages=messages,
+                        temperature=SCRIPT_TEMPERATURE,
+                        bypass_cache=not use_cache,
+                        stage="script_batch"
+                    )
+                    if not content:
+                        raise ValueError("模型返回空内容")
+                    results[index] = {"job": job, "ok": True, "content": content, "error": None}
+                except Exception as e:
+                    results[index] = {"job": job, "ok": False, "content": None, "error": str(e)}
+                results[index]["latency"] = time.perf_counter() - start
+            done += 1
+            if on_progress:
+                on_progress(done, len(jobs), results[index])
+
+        await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+    return results
+
+def generate_scripts_batch(jobs, max_concurrency=BATCH_CONCURRENCY, on_progress=None, use_cache=True):
+    """
+    并发批量生成脚本（AsyncOpenAI，最多 max_concurrency 个请求同时进行）。
+    返回与 jobs 一一对应的结果列表，失败项 ok=False 并带 error，不影响其他任务。
+    on_progress(done, total, result) 在每个任务结束时回调。
+    """
+    if not jobs:
+        return []
+    return asyncio.run(_generate_batch_async(jobs, max_concurrency, on_progress, use_cache))
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import state_cache
+import video_utils
+from video_utils import TEMP_VIDEO_DIR
+
+IMAGE_CACHE_DIR = os.path.join(TEMP_VIDEO_DIR, "image_cache")
+IMAGE_CONCURRENCY = 4
+IMAGE_RATE_PER_MINUTE = 20  # 图片接口的请求速率上限
+THUMBNAIL_SIZE = 400        # 缩略图最长边（像素），与场景列表的显示宽度一致
+THUMBNAIL_QUALITY = 75
+
+def scene_image_path(script_id, idx, out_dir=TEMP_VIDEO_DIR):
+    return os.path.join(out_dir, f"img_{script_id}_{idx}.png")
+
+def image_cache_key(prompt):
+    """
+    配图缓存键：模型、尺寸与完整提示词的哈希，提示词不变的场景不会重复生成。
+    """
+    basis = f"{video_utils.IMAGE_MODEL}|{video_utils.IMAGE_SIZE}|{video_utils.IMAGE_PROMPT_PREFIX}{prompt}"
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+class RateLimiter:
+    """
+    简单的令牌桶：按固定间隔放行请求，多线程共享。
+    """
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+# 同一进程内的所有调用（界面、批量流水线的并行配图任务）共用按模型与速率区分的限速器，
+# 并发任务叠加后总速率仍不超过上限
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def shared_limiter(rate_per_minute=IMAGE_RATE_PER_MINUTE):
+    key = (video_utils.IMAGE_MODEL, rate_per_minute)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rate_per_minute)
+        return _limiters[key]
+
+def _materialize(cache_path, target_path):
+    # 优先硬链接，不支持时复制；都经由临时文件原子替换
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    if os.path.exists(target_path) and os.path.samefile(cache_path, target_path):
+        return
+    # 临时文件名带上进程与线程号，多个线程或进程同时落盘同一场景时互不覆盖
+    tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        try:
+            os.link(cache_path, tmp_path)
+        except OSError:
+            shutil.copyfile(cache_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def image_digest(path):
+    """
+    图片内容的 sha256；按文件 mtime/size 缓存，文件未变时不再重复读取。
+    """
+    def load():
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    return state_cache.get_or_load(("image_digest", path), state_cache.file_signature([path]), load)
+
+def thumbnail_path(image_path, digest):
+    # 缩略图与原图同目录：img_{script_id}_{idx}.{原图哈希前 16 位}.webp
+    return f"{os.path.splitext(image_path)[0]}.{digest[:16]}.webp"
+
+def ensure_thumbnail(image_path, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """
+    返回原图对应的 WebP 缩略图路径，不存在时才生成；按原图内容哈希命名，
+    重新生成配图后旧缩略图自动失效并被清理。原图不存在或无法解码时返回 None。
+    """
+    try:
+        digest = image_digest(image_path)
+    except OSError:
+        return None
+    thumb_path = thumbnail_path(image_path, digest)
+    if os.path.exists(thumb_path):
+        return thumb_path
+    tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        from PIL import Image
+        with Image.open(image_path) as img:
+            img.thumbnail((size, size))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            img.save(tmp_path, format="WEBP", quality=quality, method=4)
+        os.replace(tmp_path, thumb_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"[WARN] 缩略图生成失败 {os.path.basename(image_path)}: {e}")
+        return None
+    # 清理同一场景旧配图留下的缩略图
+    prefix = f"{os.path.basename(os.path.splitext(image_path)[0])}."
+    folder = os.path.dirname(image_path) or "."
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith(".webp") and os.path.join(folder, name) != thumb_path:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+    return thumb_path
+
+def generate_scene_image(prompt, target_path, limiter=None, force=False, cache_dir=IMAGE_CACHE_DIR):
+    """
+    生成单个场景配图并落盘到 target_path（同时生成缩略图），返回 (路径或 None, 是否命中缓存)。
+    未传 limiter 时使用进程内共享的限速器。
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{image_cache_key(prompt)}.png")
+    if os.path.exists(cache_path) and not force:
+        _materialize(cache_path, target_path)
+        ensure_thumbnail(target_path)
+        return target_path, True
+    (limiter or shared_limiter()).acquire()
+    if not video_utils.generate_image(prompt, save_path=cache_path):
+        return None, False
+    _materialize(cache_path, target_path)
+    # 顺带生成缩略图，场景列表首次打开时无需再逐张解码原图
+    ensure_thumbnail(target_path)
+    return target_path, False
+
+def generate_all_images(scenes, script_id, out_dir=TEMP_VIDEO_DIR, max_concurrency=IMAGE_CONCURRENCY,
+                        rate_per_minute=IMAGE_RATE_PER_MINUTE, force=False, on_progress=None, skip=None, cache_dir=IMAGE_CACHE_DIR):
+    """
+    并发为脚本的所有场景生成配图并写入 out_dir/img_{script_id}_{idx}.png。
+    提示词未变的场景直接复用缓存；skip 为需要跳过的场景下标集合（如已删除的场景）。
+    返回 {idx: {"path", "cached", "error"}}；on_progress(done, total, idx, result) 逐个回调。
+    """
+    skip = skip or set()
+    limiter = shared_limiter(rate_per_minute)
+    todo = [(idx, scene) for idx, scene in enumerate(scenes) if idx not in skip]
+    results = {}
+    if not todo:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(todo))), thread_name_prefix="scene-image") as executor:
+        futures = {}
+        for idx, scene in todo:
+            prompt = scene.get("image_suggestion") or scene.get("content", "")[:30]
+            futures[executor.submit(generate_scene_image, prompt, scene_image_path(script_id, idx, out_dir), limiter, force, cache_dir)] = idx
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            try:
+                path, cached = future.result()
+                results[idx] = {"path": path, "cached": cached, "error": None if path else "配图生成失败"}
+            except Exception as e:
+                results[idx] = {"path": None, "cached": False, "error": str(e)}
+            if on_progress:
+                on_progress(done, len(futures), idx, results[idx])
+    return results
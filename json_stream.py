@@ -0,0 +1,85 @@
+import json
+
+class JSONArrayStream:
+    """
+    增量解析模型输出中的 JSON 数组：逐段 feed 文本，数组里的每个对象一闭合就解析并返回，
+    不必等整个回复结束。数组前后的说明文字、```json 代码块标记都会被忽略；
+    单个对象解析失败只跳过该对象，不影响前后已完成的对象。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0            # 下一个待扫描字符在 _buffer 中的位置
+        self._depth = 0          # 相对于外层数组的嵌套深度，外层数组内为 1
+        self._item_start = None  # 当前顶层对象在 _buffer 中的起点
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.done = False
+        self.items = 0
+        self.errors = 0
+
+    def feed(self, text):
+        """
+        追加一段文本，返回这段文本中新闭合的对象列表。
+        """
+        if self.done or not text:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif not self.started:
+                # 外层数组之前的内容（说明文字、代码块标记、{"topics": ...）一律跳过
+                if ch == "[":
+                    self.started = True
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                if self._depth == 1 and ch == "{":
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and ch == "}" and self._item_start is not None:
+                    item = self._decode(buffer[self._item_start:i + 1])
+                    if item is not None:
+                        completed.append(item)
+                    self._item_start = None
+                elif self._depth == 0:
+                    self.done = True
+                    i += 1
+                    break
+            i += 1
+        # 已经处理完的前缀不再保留，缓冲区只留当前未闭合的对象
+        keep_from = self._item_start if self._item_start is not None else i
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return completed
+
+    def _decode(self, text):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return None
+        self.items += 1
+        return item
+
+def parse_array_items(text):
+    """
+    一次性解析：返回文本中外层 JSON 数组里所有能完整解析的对象，截断或损坏的结尾被丢弃。
+    """
+    return JSONArrayStream().feed(text)
@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import resilience
+import telemetry
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_CACHE_DIR = os.path.join(BASE_DIR, ".llm_cache")
+
+MEMORY_MAX_ENTRIES = 256             # 内存 LRU 条数上限
+DISK_MAX_BYTES = 200 * 1024 * 1024   # 磁盘缓存总大小上限
+DEFAULT_TTL = 7 * 24 * 3600          # 默认有效期（秒）
+EVICT_EVERY = 32                     # 每写入多少条检查一次磁盘容量
+
+def cache_key(model, messages, temperature=None):
+    """
+    请求的内容哈希：模型 + 消息 + 温度完全相同即视为同一请求。
+    """
+    payload = json.dumps({"model": model, "messages": messages, "temperature": temperature}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """
+    两级缓存：进程内 LRU 在前，磁盘 JSON 文件在后，按大小与有效期淘汰。
+    """
+
+    def __init__(self, cache_dir=LLM_CACHE_DIR, max_entries=MEMORY_MAX_ENTRIES, max_bytes=DISK_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry["created_at"] <= ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry["content"]
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        with self._lock:
+            if entry and now - entry.get("created_at", 0) <= ttl:
+                self._remember(key, entry)
+                self.stats["disk_hits"] += 1
+                return entry["content"]
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, content, model=None):
+        entry = {"created_at": time.time(), "model": model, "content": content}
+        with self._lock:
+            self._remember(key, entry)
+            self._writes += 1
+            check_disk = self._writes % EVICT_EVERY == 0
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 界面、后台刷新与批量流水线可能在不同进程中写同一缓存目录，临时文件名带上进程号
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] LLM cache write failed: {e}")
+        if check_disk:
+            self.evict_disk()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def evict_disk(self):
+        """
+        删除过期文件；总大小仍超限时从最旧的文件开始删除。
+        """
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                if now - info.st_mtime > self.ttl:
+                    _remove(path)
+                else:
+                    files.append((info.st_mtime, info.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                _remove(os.path.join(root, name))
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+default_cache = LLMCache()
+
+def _lookup(cache, key, bypass_cache, ttl):
+    if bypass_cache:
+        with cache._lock:
+            cache.stats["bypassed"] += 1
+        return None
+    return cache.get(key, ttl=ttl)
+
+def _request_params(model, messages, temperature, kwargs):
+    params = dict(model=model, messages=messages, **kwargs)
+    if temperature is not None:
+        params["temperature"] = temperature
+    return params
+
+def _record_cached(kind, model, stage, start):
+    telemetry.record(kind, model, stage=stage, latency=time.perf_counter() - start, ttft=time.perf_counter() - start,
+                     prompt_tokens=0, completion_tokens=0, cached=True)
+
+def _record_response(kind, model, stage, messages, start, response=None, content=None, call_info=None, error=None, ttft=None, usage=None):
+    usage = usage if usage is not None else getattr(response, "usage", None)
+    prompt_tokens, completion_tokens, estimated = telemetry.usage_tokens(usage, messages, content)
+    call_info = call_info or {}
+    attempts = call_info.get("attempts")
+    telemetry.record(kind, call_info.get("model", model), stage=stage, latency=time.perf_counter() - start, ttft=ttft,
+                     prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                     tokens_estimated=estimated, retries=attempts - 1 if attempts else None, error=error,
+                     hedged=call_info.get("hedged", False), fallback_from=model if call_info.get("fallback") else None)
+
+def _create(client, model, messages, temperature, kwargs, stage, call_info, stream=False):
+    # 单次请求的超时、重试、对冲与备用模型由 resilience 按阶段策略处理
+    def attempt(use_model, timeout):
+        params = _request_params(use_model, messages, temperature, kwargs)
+        if stream:
+            params["stream"] = True
+        response, _ = telemetry.create_with_retries(resilience.with_timeout(client, timeout).chat.completions, params)
+        return response
+    # 流式请求对冲会让整段生成的 token 翻倍，只重试与切换模型
+    return resilience.call(stage, model, attempt, info=call_info, hedge=not stream, record_latency=not stream)
+
+async def _acreate(client, model, messages, temperature, kwargs, stage, call_info):
+    async def attempt(use_model, timeout):
+        response, _ = await telemetry.async_create_with_retries(resilience.with_timeout(client, timeout).chat.completions,
+                                                                _request_params(use_model, messages, temperature, kwargs))
+        return response
+    return await resilience.acall(stage, model, attempt, info=call_info)
+
+def cached_chat_completion(client, model, messages, temperature=None, bypass_cache=False, ttl=None, cache=None, stage=None, **kwargs):
+    """
+    带缓存的 chat.completions.create，返回回复文本。
+    bypass_cache=True 时跳过读取（仍会写入新结果），用于“重新生成”。
+    每次调用（含命中缓存）都会以 stage 为阶段名写入调用记录。
+    """
+    cache = cache or default_cache
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature)
+    content = _lookup(cache, key, bypass_cache, ttl)
+    if content is not None:
+        _record_cached("chat", model, stage, start)
+        return content
+
+    call_info = {}
+    try:
+        response = _create(client, model, messages, temperature, kwargs, stage, call_info)
+    except Exception as e:
+        _record_response("chat", model, stage, messages, start, call_info=call_info, error=e)
+        raise
+    content = response.choices[0].message.content
+    _record_response("chat", model, stage, messages, start, response, content, call_info)
+    # 备用模型的回复只用这一次，不以主模型的键缓存
+    if content and not call_info["fallback"]:
+        cache.put(key, content, model=model)
+    return content
+
+async def async_cached_chat_completion(client, model, messages, temperature=None, bypass_cache=False, ttl=None, cache=None, stage=None, **kwargs):
+    """
+    cached_chat_completion 的异步版本，client 为 AsyncOpenAI。
+    """
+    cache = cache or default_cache
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature)
+    content = _lookup(cache, key, bypass_cache, ttl)
+    if content is not None:
+        _record_cached("chat", model, stage, start)
+        return content
+
+    call_info = {}
+    try:
+        response = await _acreate(client, model, messages, temperature, kwargs, stage, call_info)
+    except Exception as e:
+        _record_response("chat", model, stage, messages, start, call_info=call_info, error=e)
+        raise
+    content = response.choices[0].message.content
+    _record_response("chat", model, stage, messages, start, response, content, call_info)
+    if content and not call_info["fallback"]:
+        cache.put(key, content, model=model)
+    return content
+
+def cached_chat_stream(client, model, messages, temperature=None, bypass_cache=False, ttl=None, cache=None, timing=None, stage=None, **kwargs):
+    """
+    流式版本：逐段 yield 回复文本，完整结束后写入缓存；命中缓存时一次性返回全文。
+    传入 timing 字典时写入 ttft（首段耗时）、total（总耗时）与 cached。
+    """
+    cache = cache or default_cache
+    timing = timing if timing is not None else {}
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature)
+    content = _lookup(cache, key, bypass_cache, ttl)
+    if content is not None:
+        timing.update(ttft=time.perf_counter() - start, total=time.perf_counter() - start, cached=True)
+        _record_cached("chat_stream", model, stage, start)
+        yield content
+        return
+
+    timing.update(ttft=None, cached=False)
+    parts = []
+    usage = None
+    finished = False
+    call_info = {}
+    # 建立连接前的失败按策略重试；开始输出后仍受阶段截止时间约束，超时即中断
+    stream_deadline = resilience.get_policy(stage)["deadline"]
+    deadline = time.monotonic() + stream_deadline
+    try:
+        stream = _create(client, model, messages, temperature, kwargs, stage, call_info, stream=True)
+        for chunk in stream:
+            if time.monotonic() > deadline:
+                getattr(stream, "close", lambda: None)()
+                raise resilience.DeadlineExceeded(f"{stage} 阶段超过 {stream_deadline:.0f}s 截止时间，已输出 {sum(len(p) for p in parts)} 字")
+            # 部分服务会在最后一个分片里附带 usage
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            finished = finished or bool(getattr(chunk.choices[0], "finish_reason", None))
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if timing["ttft"] is None:
+                    timing["ttft"] = time.perf_counter() - start
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        _record_response("chat_stream", model, stage, messages, start, content="".join(parts), call_info=call_info, error=e, ttft=timing["ttft"])
+        raise
+    except GeneratorExit:
+        # 调用方提前关闭了流（如页面刷新），按中断记录
+        _record_response("chat_stream", model, stage, messages, start, content="".join(parts), call_info=call_info, error="aborted", ttft=timing["ttft"])
+        raise
+    timing["total"] = time.perf_counter() - start
+    # 连接被提前关闭时 SDK 不会报错，只是流结束；没收到 finish_reason 的回复视为不完整
+    _record_response("chat_stream", model, stage, messages, start, content="".join(parts), call_info=call_info, ttft=timing["ttft"], usage=usage,
+                     error=None if finished else "incomplete")
+    # 只有完整结束的流才写入缓存，中途中断的半截结果不会被复用
+    if parts and finished and not call_info["fallback"]:
+        cache.put(key, "".join(parts), model=model)
+
+def cache_stats(cache=None):
+    cache = cache or default_cache
+    stats = dict(cache.stats)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+    return stats
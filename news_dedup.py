@@ -0,0 +1,97 @@
+import hashlib
+import re
+
+# 本地近似去重：基于汉字字符 n-gram 的 MinHash + LSH 分桶，无需联网
+NGRAM_SIZE = 2
+NUM_PERM = 32
+BANDS = 16  # 每段 2 行；Jaccard 0.5 的标题对约 99% 概率成为候选，0.1 的约 15%
+MIN_JACCARD = 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha1(f"a{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.sha1(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME)
+    for i in range(NUM_PERM)
+]
+
+_STRIP_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    text = _STRIP_RE.sub("", str(text or "")).lower()
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def minhash(grams):
+    base = [int.from_bytes(hashlib.md5(g.encode("utf-8")).digest()[:4], "big") for g in grams]
+    return tuple(min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in base) for a, b in _PERMUTATIONS)
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _item_sources(item):
+    sources = item.get("sources")
+    if isinstance(sources, list) and sources:
+        return sources
+    return [s for s in str(item.get("source") or "").split("/") if s]
+
+def group_near_duplicates(news_items):
+    """
+    将标题近似重复的新闻分组，返回下标分组列表。
+    先用 MinHash 分段找候选，再用 n-gram Jaccard 确认，避免 O(n²) 全量比较。
+    """
+    grams = [char_ngrams(item.get("title")) for item in news_items]
+    signatures = [minhash(g) if g else None for g in grams]
+    parent = list(range(len(news_items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // BANDS
+    buckets = {}
+    for i, sig in enumerate(signatures):
+        if sig is None:
+            continue
+        candidates = set()
+        for band in range(BANDS):
+            key = (band, sig[band * rows:(band + 1) * rows])
+            candidates.update(buckets.get(key, ()))
+            buckets.setdefault(key, []).append(i)
+        for j in candidates:
+            if find(i) != find(j) and _jaccard(grams[i], grams[j]) >= MIN_JACCARD:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(news_items)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def collapse_near_duplicates(news_items):
+    """
+    每组近似重复新闻只保留一个代表，按覆盖来源数与组大小加权排序。
+    代表条目会带上合并后的 sources、weight 以及被折叠的条数 duplicates。
+    """
+    representatives = []
+    for members in group_near_duplicates(news_items):
+        items = [news_items[i] for i in members]
+        sources = []
+        for item in items:
+            for s in _item_sources(item):
+                if s not in sources:
+                    sources.append(s)
+        # 组内优先选来源最多的条目，其次选描述更完整的
+        best = max(items, key=lambda it: (len(_item_sources(it)), len(it.get("description") or ""), -items.index(it)))
+        rep = dict(best)
+        rep["sources"] = sources
+        rep["source"] = "/".join(sources)
+        rep["duplicates"] = len(items)
+        rep["weight"] = len(sources) + (len(items) - 1) * 0.5
+        representatives.append(rep)
+    representatives.sort(key=lambda r: r["weight"], reverse=True)
+    return representatives
@@ -1,70 +1,145 @@
 import requests
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import streamlit as st
+from requests.adapters import HTTPAdapter
+import news_store
+from config import get_setting
 
 # 配置
-# API_KEY = "765d0e02b73f9a975c3ce0fac97c4b82" # 部署时从 secrets 中读取
-try:
-    API_KEY = st.secrets["api_keys"]["tianapi_key"]
-except:
-    API_KEY = "765d0e02b73f9a975c3ce0fac97c4b82" # 本地调试时使用硬编码或环境变量
+# 部署时从 secrets 的 api_keys.tianapi_key 或环境变量 TIANAPI_KEY 中读取，本地调试时使用硬编码
+API_KEY = get_setting("TIANAPI_KEY", ("api_keys", "tianapi_key"), "765d0e02b73f9a975c3ce0fac97c4b82")
+TIANAPI_BASE_URL = os.getenv("TIANAPI_BASE_URL", "https://apis.tianapi.com")
 # 使用相对路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RAW_DATA_PATH = os.path.join(BASE_DIR, "raw_news.json")
 
-def fetch_tianapi(endpoint):
-    url = f"https://apis.tianapi.com/{endpoint}/index?key={API_KEY}"
+# 抓取的接口及其来源名称（按展示顺序）
+TIANAPI_SOURCES = {
+    "world": "国际新闻",
+    "networkhot": "全网热搜",
+    "toutiaohot": "今日头条",
+}
+ENDPOINT_TIMEOUT = 10  # 单个接口的截止时间（秒）
+OVERALL_TIMEOUT = 15   # 一次刷新的整体截止时间（秒）
+
+_session = None
+
+def get_session():
+    """
+    返回进程内共享的 keep-alive 会话，所有接口复用同一个连接池。
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(TIANAPI_SOURCES), pool_maxsize=len(TIANAPI_SOURCES) * 2)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+def fetch_tianapi(endpoint, timeout=ENDPOINT_TIMEOUT):
+    """
+    请求单个接口并返回新闻列表；网络错误、超时或接口返回错误码时抛出异常，由调用方记录状态。
+    """
+    url = f"{TIANAPI_BASE_URL}/{endpoint}/index?key={API_KEY}"
+    response = get_session().get(url, timeout=timeout)
+    response.raise_for_status()
+    res_json = response.json()
+    if res_json.get("code") != 200:
+        raise RuntimeError(f"接口返回 code={res_json.get('code')}: {res_json.get('msg', '')}")
+    return res_json.get("result", {}).get("list", [])
+
+def _timed_fetch(endpoint, timeout):
+    # 返回 {"items", "latency", "status", "error"}，status 为 ok / empty / timeout / error
+    start = time.perf_counter()
     try:
-        response = requests.get(url, timeout=10)
-        res_json = response.json()
-        if res_json.get("code") == 200:
-            return res_json.get("result", {}).get("list", [])
+        items = fetch_tianapi(endpoint, timeout=timeout)
+        status, error = ("ok" if items else "empty"), None
+    except requests.Timeout as e:
+        items, status, error = [], "timeout", str(e)
     except Exception as e:
-        print(f"Error fetching {endpoint}: {e}")
-    return []
+        items, status, error = [], "error", str(e)
+    return {"items": items, "latency": time.perf_counter() - start, "status": status, "error": error}
+
+def fetch_all_tianapi(endpoints=None, endpoint_timeout=ENDPOINT_TIMEOUT, overall_timeout=OVERALL_TIMEOUT, concurrent=True):
+    """
+    抓取多个接口，返回 {endpoint: {"items", "latency", "status", "error"}}。
+    并发模式下总耗时取决于最慢的接口；单个接口超时记为 timeout、请求失败记为 error，
+    超过整体截止时间的接口也记为 timeout，已返回的接口结果照常保留。
+    """
+    endpoints = list(endpoints or TIANAPI_SOURCES)
+    results = {}
+    if not concurrent:
+        for endpoint in endpoints:
+            results[endpoint] = _timed_fetch(endpoint, endpoint_timeout)
+        return results
+
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="tianapi")
+    futures = {executor.submit(_timed_fetch, endpoint, endpoint_timeout): endpoint for endpoint in endpoints}
+    done, _ = wait(futures, timeout=overall_timeout)
+    for future, endpoint in futures.items():
+        if future in done:
+            results[endpoint] = future.result()
+        else:
+            results[endpoint] = {"items": [], "latency": time.perf_counter() - start, "status": "timeout",
+                                 "error": f"超过整体截止时间 {overall_timeout}s"}
+    # 不等待超时的请求，它们会在各自的 endpoint_timeout 后自行结束
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def normalize_items(endpoint, items):
+    """
+    将不同接口的返回统一为 raw_news.json 的记录格式。
+    """
+    source = TIANAPI_SOURCES.get(endpoint, endpoint)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    news = []
+    for item in items:
+        if endpoint == "world":
+            news.append({
+                "title": item.get("title"),
+                "description": item.get("description"),
+                "source": source,
+                "url": item.get("url"),
+                "ctime": item.get("ctime")
+            })
+        else:
+            news.append({
+                "title": item.get("word") or item.get("title"),
+                "description": (item.get("digest") or "") if endpoint == "networkhot" else "",
+                "source": source,
+                "url": item.get("url") or "",
+                "ctime": now
+            })
+    return news
+
+def main(concurrent=True, force=False):
+    store = news_store.load_store()
+    # 只请求 TTL 已到期的接口，force=True 时全部重抓
+    endpoints = news_store.endpoints_due(store, TIANAPI_SOURCES, force=force)
+    results = fetch_all_tianapi(endpoints, concurrent=concurrent) if endpoints else {}
 
-def main():
-    all_news = []
-    
-    # 1. 国际新闻
-    world_news = fetch_tianapi("world")
-    for item in world_news:
-        all_news.append({
-            "title": item.get("title"),
-            "description": item.get("description"),
-            "source": "国际新闻",
-            "url": item.get("url"),
-            "ctime": item.get("ctime")
-        })
-        
-    # 2. 全网热搜
-    network_hot = fetch_tianapi("networkhot")
-    for item in network_hot:
-        all_news.append({
-            "title": item.get("word") or item.get("title"),
-            "description": item.get("digest") or "",
-            "source": "全网热搜",
-            "url": item.get("url") or "",
-            "ctime": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-    # 3. 今日头条热搜
-    toutiao_hot = fetch_tianapi("toutiaohot")
-    for item in toutiao_hot:
-        all_news.append({
-            "title": item.get("word") or item.get("title"),
-            "description": "",
-            "source": "今日头条",
-            "url": item.get("url") or "",
-            "ctime": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+    added = 0
+    for endpoint, res in results.items():
+        if res["items"]:
+            added += news_store.ingest(store, endpoint, normalize_items(endpoint, res["items"]))
+        print(f"[{endpoint}] {res['status']} {len(res['items'])} items in {res['latency']:.2f}s" + (f": {res['error']}" if res.get("error") else ""))
+    for endpoint in TIANAPI_SOURCES:
+        if endpoint not in results:
+            print(f"[{endpoint}] skipped (TTL not expired)")
+    news_store.prune(store)
+    news_store.save_store(store)
 
-    # 保存原始数据
+    # 保存原始数据（去重合并后的当前新闻视图）
+    all_news = news_store.current_items(store)
     with open(RAW_DATA_PATH, 'w', encoding='utf-8') as f:
         json.dump(all_news, f, ensure_ascii=False, indent=4)
-    print(f"Successfully fetched {len(all_news)} news items.")
+    print(f"Successfully fetched {len(all_news)} news items ({added} new).")
+    return results
 
 if __name__ == "__main__":
     main()
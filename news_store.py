@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from storage import write_json_atomic
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NEWS_STORE_PATH = os.path.join(BASE_DIR, "news_store.json")
+
+# 各接口的最短重抓间隔（秒），未到期的接口本轮不再请求
+ENDPOINT_TTL = {
+    "world": 30 * 60,
+    "networkhot": 10 * 60,
+    "toutiaohot": 10 * 60,
+}
+DEFAULT_TTL = 10 * 60
+# 超过该时长未再出现的新闻会被清理（秒）
+RETENTION_SECONDS = 3 * 24 * 3600
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def normalize_title(title):
+    """
+    归一化标题：去掉空白与标点并转小写，使不同来源的同一标题得到相同的键。
+    """
+    return _PUNCT_RE.sub("", str(title or "")).lower()
+
+def normalize_url(url):
+    url = str(url or "").strip().lower()
+    url = re.sub(r"^https?://", "", url)
+    return url.split("#")[0].rstrip("/")
+
+def content_key(item):
+    """
+    新闻的内容哈希：优先使用归一化标题，标题为空时退回到 URL。
+    """
+    basis = normalize_title(item.get("title")) or normalize_url(item.get("url"))
+    if not basis:
+        return None
+    return hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+def _empty_store():
+    return {"items": {}, "endpoints": {}, "last_clustered_at": 0}
+
+def load_store(path=None):
+    # 默认路径在调用时读取模块变量，测试与基准可直接替换 NEWS_STORE_PATH
+    path = path or NEWS_STORE_PATH
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                store = json.load(f)
+            if isinstance(store, dict) and isinstance(store.get("items"), dict):
+                store.setdefault("endpoints", {})
+                store.setdefault("last_clustered_at", 0)
+                return store
+        except Exception as e:
+            print(f"Error loading news store: {e}")
+    return _empty_store()
+
+def save_store(store, path=None):
+    # 唯一命名的临时文件 + 原子替换，避免中途失败留下半个文件，并发写入也互不干扰
+    write_json_atomic(path or NEWS_STORE_PATH, store)
+
+def endpoints_due(store, endpoints, now=None, force=False):
+    """
+    返回 TTL 已到期、需要重新抓取的接口列表。
+    """
+    if force:
+        return list(endpoints)
+    now = now or time.time()
+    due = []
+    for endpoint in endpoints:
+        last = store["endpoints"].get(endpoint, {}).get("last_fetched", 0)
+        if now - last >= ENDPOINT_TTL.get(endpoint, DEFAULT_TTL):
+            due.append(endpoint)
+    return due
+
+def ingest(store, endpoint, news, now=None):
+    """
+    将一个接口的本轮结果并入存储，返回新增条数。
+    同一标题出现在多个来源时合并为一条记录，来源记录在 sources 中。
+    """
+    now = now or time.time()
+    payload_hash = hashlib.sha1(json.dumps(news, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    meta = store["endpoints"].setdefault(endpoint, {})
+    meta["last_fetched"] = now
+    if meta.get("payload_hash") == payload_hash:
+        # 接口内容与上次完全一致：跳过合并，只刷新抓取时间与各条新闻的 last_seen，避免仍在榜的新闻被 prune 清掉
+        for item in news:
+            record = store["items"].get(content_key(item))
+            if record is not None:
+                record["last_seen"] = now
+        return 0
+    meta["payload_hash"] = payload_hash
+
+    added = 0
+    for item in news:
+        key = content_key(item)
+        if not key:
+            continue
+        record = store["items"].get(key)
+        if record is None:
+            record = {
+                "title": item.get("title"),
+                "description": item.get("description") or "",
+                "url": item.get("url") or "",
+                "ctime": item.get("ctime"),
+                "sources": [],
+                "first_seen": now,
+            }
+            store["items"][key] = record
+            added += 1
+        elif not record.get("description") and item.get("description"):
+            record["description"] = item.get("description")
+        if not record.get("url") and item.get("url"):
+            record["url"] = item.get("url")
+        if item.get("source") and item["source"] not in record["sources"]:
+            record["sources"].append(item["source"])
+        record["last_seen"] = now
+    return added
+
+def prune(store, now=None):
+    now = now or time.time()
+    stale = [k for k, r in store["items"].items() if now - r.get("last_seen", r.get("first_seen", 0)) > RETENTION_SECONDS]
+    for key in stale:
+        del store["items"][key]
+    return len(stale)
+
+def to_news_item(key, record):
+    """
+    转成 raw_news.json / cluster_topics 使用的新闻格式。
+    """
+    return {
+        "id": key,
+        "title": record.get("title"),
+        "description": record.get("description", ""),
+        "source": "/".join(record.get("sources", [])),
+        "sources": record.get("sources", []),
+        "url": record.get("url", ""),
+        "ctime": record.get("ctime"),
+    }
+
+def current_items(store, since=None):
+    """
+    按最近出现时间倒序返回新闻；since 为时间戳时只返回其后出现过的新闻。
+    """
+    rows = [(k, r) for k, r in store["items"].items() if since is None or r.get("last_seen", 0) >= since]
+    rows.sort(key=lambda kr: kr[1].get("last_seen", 0), reverse=True)
+    return [to_news_item(k, r) for k, r in rows]
+
+def new_since_last_cluster(store):
+    """
+    “自上次聚类以来新增”的视图：只包含首次出现时间晚于上次聚类的新闻。
+    """
+    since = store.get("last_clustered_at", 0)
+    rows = [(k, r) for k, r in store["items"].items() if r.get("first_seen", 0) > since]
+    rows.sort(key=lambda kr: kr[1].get("first_seen", 0))
+    return [to_news_item(k, r) for k, r in rows]
+
+def mark_clustered(store, now=None):
+    store["last_clustered_at"] = now or time.time()
+
+def last_clustered_label(store):
+    ts = store.get("last_clustered_at", 0)
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "从未"
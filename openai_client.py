@@ -0,0 +1,68 @@
+import os
+import threading
+
+from config import get_setting
+
+# 连接池与超时：所有模块共用一个客户端，keep-alive 连接在各阶段之间复用
+OPENAI_TIMEOUT = float(os.getenv("FINVIDEO_OPENAI_TIMEOUT", "120"))           # 单次请求读超时（秒）
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("FINVIDEO_OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_RETRIES = int(os.getenv("FINVIDEO_OPENAI_MAX_RETRIES", "2"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("FINVIDEO_OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("FINVIDEO_OPENAI_MAX_KEEPALIVE", "16"))
+
+_client = None
+_lock = threading.Lock()
+
+def _client_kwargs():
+    import httpx
+    kwargs = {
+        "timeout": httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        "max_retries": OPENAI_MAX_RETRIES,
+    }
+    api_key = get_setting("OPENAI_API_KEY")
+    if api_key:
+        kwargs["api_key"] = api_key
+    base_url = get_setting("OPENAI_BASE_URL")
+    if base_url:
+        kwargs["base_url"] = base_url
+    return kwargs
+
+def _limits():
+    import httpx
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE)
+
+def get_client():
+    """
+    返回进程内共享的 OpenAI 客户端，首次调用时才导入 SDK 并创建，线程安全。
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                kwargs = _client_kwargs()
+                kwargs["http_client"] = httpx.Client(limits=_limits(), timeout=kwargs["timeout"])
+                _client = OpenAI(**kwargs)
+    return _client
+
+def new_async_client():
+    """
+    新建 AsyncOpenAI 客户端。异步连接池绑定在创建它的事件循环上，每次 asyncio.run 需要各自创建，
+    配置与共享客户端相同，用完以 async with 关闭。
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    kwargs = _client_kwargs()
+    kwargs["http_client"] = httpx.AsyncClient(limits=_limits(), timeout=kwargs["timeout"])
+    return AsyncOpenAI(**kwargs)
+
+def reset_client():
+    """
+    关闭并丢弃共享客户端（如密钥变更后），下次 get_client() 时重新创建。
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,388 @@
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from storage import load_json, save_json
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(BASE_DIR, "runs")
+DAILY_TOPICS_PATH = os.path.join(BASE_DIR, "daily_topics.json")
+
+# 任务类型按流水线顺序排列；每类任务可同时运行的上限（配图与合成内部已经并行，限制得更紧）
+TASK_KINDS = ["fetch", "cluster", "script", "scenes", "images", "audio", "assemble"]
+KIND_LIMITS = {"fetch": 1, "cluster": 1, "script": 4, "scenes": 4, "images": 2, "audio": 2, "assemble": 1}
+MAX_TASK_ATTEMPTS = 2    # 单次运行内每个任务最多尝试几次；续跑时失败的任务会重新获得机会
+DEFAULT_TOPICS = 3
+DEFAULT_STYLE = "深度解析"
+DEFAULT_BGM = "激昂财经"
+# 可跳过的阶段：脚本与分镜的产出是下游任务的输入，不能跳过
+SKIPPABLE_KINDS = ["fetch", "cluster", "images", "audio", "assemble"]
+
+# 同一脚本的配图与配音任务并行改写场景，按脚本加锁并只合并各自的字段
+_scene_locks = {}
+_scene_locks_guard = threading.Lock()
+
+def _scene_lock(factory_id):
+    with _scene_locks_guard:
+        return _scene_locks.setdefault(factory_id, threading.Lock())
+
+def _patch_scenes(factory_id, patches):
+    """
+    把 {idx: {字段: 值}} 合并进数据库中的当前场景，不覆盖其他任务写入的字段。
+    """
+    from storage import get_factory_script, update_scenes
+    with _scene_lock(factory_id):
+        scenes = get_factory_script(factory_id)["scenes"]
+        update_scenes(factory_id, {idx: dict(scenes[idx], **fields) for idx, fields in patches.items() if fields})
+
+def _key(task):
+    # 同一脚本任务链共用的编号，如 script:003 → 003
+    return task["id"].split(":")[1]
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _new_task(task_id, kind, deps=(), job=None):
+    return {"id": task_id, "kind": kind, "deps": list(deps), "job": job, "status": "pending",
+            "attempts": 0, "error": None, "output": None, "seconds": None, "started_at": None, "finished_at": None}
+
+class PipelineRun:
+    """
+    一次批量生产：fetch → cluster → 每个脚本任务的 script → scenes → (images ∥ audio) → assemble。
+    任务图与每个任务的状态、产出都写入 runs/<run_id>/checkpoint.json，进程中断后用同一 run_id 续跑，
+    已完成的任务不会重做。
+    """
+
+    def __init__(self, run_id, options=None, runs_dir=RUNS_DIR):
+        self.run_id = run_id
+        self.dir = os.path.join(runs_dir, run_id)
+        self.checkpoint_path = os.path.join(self.dir, "checkpoint.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        state = load_json(self.checkpoint_path, default=None)
+        if state:
+            # 续跑：中断时还在运行的任务、失败或被跳过的任务重新排队
+            self.state = json.loads(json.dumps(state))
+            for task in self.state["tasks"].values():
+                if task["status"] in ("running", "failed", "skipped"):
+                    task.update(status="pending", attempts=0)
+            conflicts = [k for k, v in (options or {}).items() if k in state["options"] and state["options"][k] != v]
+            if conflicts:
+                print(f"[WARN] 续跑沿用检查点中的选项，本次传入的 {', '.join(conflicts)} 不生效："
+                      + "，".join(f"{k}={state['options'][k]!r}" for k in conflicts))
+            print(f"[INFO] 续跑 {run_id}：{sum(1 for t in self.state['tasks'].values() if t['status'] == 'done')}/{len(self.state['tasks'])} 个任务已完成")
+        else:
+            self.state = {"run_id": run_id, "created_at": _now(), "options": options or {}, "jobs": [], "tasks": {}}
+            self._add(_new_task("fetch", "fetch"))
+            self._add(_new_task("cluster", "cluster", ["fetch"]))
+        self.options = self.state["options"]
+        for task in self.state["tasks"].values():
+            if self._skipped(task["kind"]) and task["status"] == "pending":
+                task.update(status="done", output={"skipped_by_option": True})
+        self.save()
+
+    @property
+    def tasks(self):
+        return self.state["tasks"]
+
+    def _skipped(self, kind):
+        # 跳过聚类表示沿用已有的今日选题，该任务仍需运行以展开任务图
+        return kind in self.options.get("skip", []) and kind in SKIPPABLE_KINDS and kind != "cluster"
+
+    def _add(self, task):
+        self.tasks.setdefault(task["id"], task)
+
+    def save(self):
+        with self._lock:
+            save_json(self.checkpoint_path, self.state)
+
+    # ---------- 任务图 ----------
+
+    def expand(self, topics):
+        """
+        聚类完成后按选题展开每个脚本的任务链；重复调用（续跑）不会产生重复任务。
+        """
+        from editor_generate import build_batch_jobs
+        from storage import list_styles
+        if self.state["jobs"]:
+            return
+        styles = list_styles()
+        topics = sorted([t for t in topics if isinstance(t, dict) and t.get("topic")], key=lambda t: t.get("heat") or 0, reverse=True)
+        jobs = []
+        for topic in topics[:self.options.get("topics", DEFAULT_TOPICS)]:
+            # 每个选题取前 subtopics 个子选题 × 所选风格
+            topic = dict(topic, news_items=[n for n in topic.get("news_items", []) if isinstance(n, dict)][:self.options.get("subtopics", 1)])
+            jobs.extend(build_batch_jobs([topic], self.options.get("styles", [DEFAULT_STYLE]), styles))
+        self.state["jobs"] = jobs
+        for i, job in enumerate(jobs):
+            key = f"{i:03d}"
+            chain = [
+                _new_task(f"script:{key}", "script", ["cluster"], i),
+                _new_task(f"scenes:{key}", "scenes", [f"script:{key}"], i),
+                _new_task(f"images:{key}", "images", [f"scenes:{key}"], i),
+                _new_task(f"audio:{key}", "audio", [f"scenes:{key}"], i),
+                _new_task(f"assemble:{key}", "assemble", [f"images:{key}", f"audio:{key}"], i),
+            ]
+            for task in chain:
+                if self._skipped(task["kind"]):
+                    task.update(status="done", output={"skipped_by_option": True})
+                self._add(task)
+
+    def _output(self, task_id):
+        return self.tasks[task_id]["output"] or {}
+
+    # ---------- 各阶段 ----------
+
+    def run_fetch(self, task):
+        import news_fetcher
+        news_fetcher.main(force=self.options.get("force_fetch", False))
+        return {}
+
+    def run_cluster(self, task):
+        import topic_cluster
+        topics = None
+        if "cluster" not in self.options.get("skip", []):
+            topics = topic_cluster.main(stream=False)
+        if not topics:
+            # 没有新新闻（或跳过聚类）时沿用今日已有选题
+            topics = load_json(DAILY_TOPICS_PATH, default=[])
+        if not topics:
+            raise RuntimeError("没有可用的选题")
+        # 任务图由调度线程展开（见 run），这里只交回选题
+        return {"topics": len(topics), "topic_list": topics}
+
+    def run_script(self, task):
+        from editor_generate import generate_script
+        from storage import append_scripts
+        job = self.state["jobs"][task["job"]]
+        content = generate_script(job["topic"], job["subtopic"], job["style"], job["style_desc"], job["context_news"], job["sop_template"])
+        if not content or content.startswith("文稿生成失败"):
+            raise RuntimeError(content or "模型返回空内容")
+        saved = append_scripts([{"topic": job["topic"], "subtopic": job["subtopic"], "style": job["style"], "content": content}])
+        path = os.path.join(self.dir, "scripts", f"{_key(task)}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return {"path": path, "library_id": saved[0]["id"], "chars": len(content)}
+
+    def run_scenes(self, task):
+        from storage import create_factory_script
+        from video_utils import parse_script_to_scenes
+        job = self.state["jobs"][task["job"]]
+        with open(self._output(f"script:{_key(task)}")["path"], 'r', encoding='utf-8') as f:
+            content = f.read()
+        scenes = parse_script_to_scenes(content)
+        if not scenes:
+            raise RuntimeError("脚本没有切分出场景")
+        factory_id = create_factory_script(job["subtopic"], scenes, content)
+        return {"factory_id": factory_id, "scenes": len(scenes)}
+
+    def run_images(self, task):
+        from image_pipeline import generate_all_images
+        from storage import get_factory_script
+        factory_id = self._output(f"scenes:{_key(task)}")["factory_id"]
+        scenes = get_factory_script(factory_id)["scenes"]
+        results = generate_all_images(scenes, factory_id)
+        _patch_scenes(factory_id, {idx: {"image_url": r["path"]} for idx, r in results.items() if r["path"]})
+        failed = [idx for idx, r in results.items() if not r["path"]]
+        if failed:
+            # 成功的配图已写回并缓存，重试时只会重新请求失败的场景
+            raise RuntimeError(f"{len(failed)}/{len(results)} 张配图生成失败")
+        return {"images": len(results), "cached": sum(1 for r in results.values() if r["cached"])}
+
+    def run_audio(self, task):
+        from storage import get_factory_script
+        from tts_pipeline import apply_audio_results, synthesize_all
+        factory_id = self._output(f"scenes:{_key(task)}")["factory_id"]
+        scenes = get_factory_script(factory_id)["scenes"]
+        results = synthesize_all(scenes, self.options.get("voice_sample"))
+        retimed = apply_audio_results(scenes, results)
+        _patch_scenes(factory_id, {idx: {k: scene[k] for k in ("audio_path", "duration", "start") if k in scene} for idx, scene in enumerate(retimed)})
+        failed = [idx for idx, r in results.items() if r["error"]]
+        if failed:
+            raise RuntimeError(f"{len(failed)}/{len(results)} 段配音合成失败")
+        return {"clips": len(results), "cached": sum(1 for r in results.values() if r["cached"]),
+                "seconds_of_audio": round(sum(r["duration"] or 0 for r in results.values()), 1)}
+
+    def run_assemble(self, task):
+        from storage import get_factory_script
+        from video_utils import assemble_video
+        factory_id = self._output(f"scenes:{_key(task)}")["factory_id"]
+        scenes = get_factory_script(factory_id)["scenes"]
+        out_path = os.path.join(self.dir, "videos", f"{_key(task)}.mp4")
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        report = {}
+        assemble_video(scenes, bgm_style=self.options.get("bgm", DEFAULT_BGM), out_path=out_path, report=report)
+        return {"video": out_path, "segments": report["segments"], "render_seconds": round(report["timings"]["total"], 2)}
+
+    # ---------- 调度 ----------
+
+    def _ready(self, running_kinds):
+        ready = []
+        for task in self.tasks.values():
+            if task["status"] != "pending":
+                continue
+            deps = [self.tasks[d] for d in task["deps"]]
+            if any(d["status"] in ("failed", "skipped") for d in deps):
+                # 上游失败：整条链路跳过，续跑时会重新排队
+                task.update(status="skipped", error=f"上游任务失败: {', '.join(d['id'] for d in deps if d['status'] in ('failed', 'skipped'))}")
+                continue
+            if all(d["status"] == "done" for d in deps) and running_kinds.get(task["kind"], 0) < KIND_LIMITS[task["kind"]]:
+                running_kinds[task["kind"]] = running_kinds.get(task["kind"], 0) + 1
+                ready.append(task)
+        return ready
+
+    def _execute(self, task):
+        start = time.perf_counter()
+        output = getattr(self, f"run_{task['kind']}")(task)
+        return output, time.perf_counter() - start
+
+    def run(self, concurrency=4):
+        """
+        按依赖关系调度任务：依赖都已完成的任务立即提交，不同脚本的各阶段、同一脚本的配图与配音并行执行。
+        每次任务状态变化都写入检查点。返回汇总（见 summarize）。
+        """
+        started = time.perf_counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="pipeline") as executor:
+            while True:
+                running_kinds = {}
+                for task in running.values():
+                    running_kinds[task["kind"]] = running_kinds.get(task["kind"], 0) + 1
+                for task in self._ready(running_kinds):
+                    task.update(status="running", attempts=task["attempts"] + 1, started_at=_now(), error=None)
+                    running[executor.submit(self._execute, task)] = task
+                self.save()
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        output, seconds = future.result()
+                        if task["kind"] == "cluster":
+                            self.expand(output.pop("topic_list"))
+                            output["jobs"] = len(self.state["jobs"])
+                        task.update(status="done", output=output, seconds=round(seconds, 3), finished_at=_now())
+                        print(f"[INFO] ✓ {task['id']} {seconds:.1f}s")
+                    except Exception as e:
+                        retry = task["attempts"] < MAX_TASK_ATTEMPTS
+                        task.update(status="pending" if retry else "failed", error=str(e), finished_at=_now())
+                        print(f"[{'WARN' if retry else 'ERROR'}] ✗ {task['id']}（第 {task['attempts']} 次）: {e}")
+        summary = summarize(self.state, time.perf_counter() - started)
+        self.state["summary"] = summary
+        self.save()
+        save_json(os.path.join(self.dir, "summary.json"), summary)
+        return summary
+
+def summarize(state, wall_seconds):
+    """
+    运行汇总：各类任务的完成/失败/跳过数、耗时与吞吐，以及失败任务的错误信息。
+    """
+    kinds = {}
+    for task in state["tasks"].values():
+        row = kinds.setdefault(task["kind"], {"done": 0, "failed": 0, "skipped": 0, "pending": 0, "seconds": []})
+        if task["status"] == "done" and (task["output"] or {}).get("skipped_by_option"):
+            continue
+        row[task["status"] if task["status"] in row else "pending"] += 1
+        if task["status"] == "done" and task["seconds"] is not None:
+            row["seconds"].append(task["seconds"])
+    stages = {}
+    for kind in TASK_KINDS:
+        if kind not in kinds:
+            continue
+        row = kinds.pop(kind)
+        seconds = sorted(row.pop("seconds"))
+        stages[kind] = dict(row, total_s=round(sum(seconds), 2),
+                            p50_s=round(seconds[len(seconds) // 2], 2) if seconds else None,
+                            max_s=round(seconds[-1], 2) if seconds else None)
+    videos = [t["output"]["video"] for t in state["tasks"].values()
+              if t["kind"] == "assemble" and t["status"] == "done" and (t["output"] or {}).get("video")]
+    return {
+        "run_id": state["run_id"],
+        "finished_at": _now(),
+        "wall_s": round(wall_seconds, 2),
+        "jobs": len(state["jobs"]),
+        "videos": videos,
+        "videos_per_hour": round(len(videos) * 3600 / wall_seconds, 1) if wall_seconds and videos else 0,
+        "stages": stages,
+        "failures": [{"task": t["id"], "status": t["status"], "error": t["error"]}
+                     for t in state["tasks"].values() if t["status"] in ("failed", "skipped")],
+    }
+
+def print_summary(summary):
+    print(f"批次 {summary['run_id']}：{summary['jobs']} 个脚本任务，产出 {len(summary['videos'])} 个视频，"
+          f"耗时 {summary['wall_s']:.1f}s（{summary['videos_per_hour']} 个/小时）")
+    print(f"{'stage':<10} {'done':>5} {'failed':>6} {'skipped':>7} {'total(s)':>9} {'p50(s)':>7} {'max(s)':>7}")
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"
+    for kind, row in summary["stages"].items():
+        print(f"{kind:<10} {row['done']:>5} {row['failed']:>6} {row['skipped']:>7} {row['total_s']:>9.2f} {fmt(row['p50_s']):>7} {fmt(row['max_s']):>7}")
+    for failure in summary["failures"]:
+        print(f"  ✗ {failure['task']} [{failure['status']}] {failure['error']}")
+
+def latest_run_id(runs_dir=RUNS_DIR):
+    if not os.path.isdir(runs_dir):
+        return None
+    runs = [name for name in os.listdir(runs_dir) if os.path.exists(os.path.join(runs_dir, name, "checkpoint.json"))]
+    return max(runs, key=lambda name: os.path.getmtime(os.path.join(runs_dir, name, "checkpoint.json")), default=None)
+
+def _seconds_until(at):
+    now = datetime.now()
+    hour, minute = (int(part) for part in at.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量生产：抓取 → 聚类 → 脚本 → 场景 → 配图/配音 → 合成，支持断点续跑")
+    parser.add_argument("--run-id", help="批次标识，默认为当天日期；同一批次再次运行即从检查点续跑")
+    parser.add_argument("--resume", action="store_true", help="续跑最近一次批次")
+    parser.add_argument("--topics", type=int, default=DEFAULT_TOPICS, help="取热度最高的前 N 个选题")
+    parser.add_argument("--subtopics", type=int, default=1, help="每个选题取前 N 个子选题")
+    parser.add_argument("--styles", nargs="+", default=[DEFAULT_STYLE], help="创作风格（风格库中的名称）")
+    parser.add_argument("--bgm", default=DEFAULT_BGM)
+    parser.add_argument("--voice-sample", help="配音用的音色样本文件")
+    parser.add_argument("--skip", nargs="+", default=[], choices=SKIPPABLE_KINDS, help="跳过的阶段，如 --skip fetch assemble")
+    parser.add_argument("--force-fetch", action="store_true", help="忽略各接口的 TTL 全部重抓")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的任务数上限")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，每天在 --at 指定的时间生产当天的批次")
+    parser.add_argument("--at", default="02:00", help="常驻模式的每日运行时间（HH:MM）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出汇总")
+    args = parser.parse_args()
+
+    options = {"topics": args.topics, "subtopics": args.subtopics, "styles": args.styles, "bgm": args.bgm,
+               "voice_sample": args.voice_sample, "skip": args.skip, "force_fetch": args.force_fetch}
+
+    def run_once(run_id):
+        summary = PipelineRun(run_id, options).run(args.concurrency)
+        if args.json:
+            print(json.dumps(summary, ensure_ascii=False, indent=2))
+        else:
+            print_summary(summary)
+        return summary
+
+    if args.daemon:
+        while True:
+            wait_seconds = _seconds_until(args.at)
+            print(f"[INFO] 下一次批量生产将在 {wait_seconds / 3600:.1f} 小时后开始（{args.at}）")
+            time.sleep(wait_seconds)
+            try:
+                run_once(datetime.now().strftime("%Y-%m-%d"))
+            except Exception:
+                traceback.print_exc()
+        return
+
+    run_id = args.run_id or (latest_run_id() if args.resume else None) or datetime.now().strftime("%Y-%m-%d")
+    summary = run_once(run_id)
+    if summary["failures"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import re
+
+# 各类素材在提示词里的 token 预算，可用环境变量调整
+SCRIPT_CONTEXT_BUDGET = int(os.getenv("FINVIDEO_SCRIPT_CONTEXT_TOKENS", "6000"))
+STYLE_SAMPLES_BUDGET = int(os.getenv("FINVIDEO_STYLE_SAMPLES_TOKENS", "12000"))
+MIN_ITEM_TOKENS = 40     # 截断后少于这个长度的素材直接丢弃，不值得占位
+STYLE_TAIL_RATIO = 0.3   # 样本截断时保留结尾的比例（开场与结尾都是风格特征）
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+_SENTENCE_END_RE = re.compile(r'[。！？!?；;\n]')
+
+def count_tokens(text):
+    """
+    本地粗估 token 数：中文字符按每字 1 个，其余按每 4 个字符 1 个。结果确定，不依赖分词器。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _cjk_prefix(text):
+    # prefix[i] 为 text[:i] 中的中文字符数，用于 O(1) 计算任意前缀/后缀的 token 数
+    prefix = [0]
+    for ch in text:
+        prefix.append(prefix[-1] + (1 if _CJK_RE.match(ch) else 0))
+    return prefix
+
+def _span_tokens(prefix, start, end):
+    cjk = prefix[end] - prefix[start]
+    return cjk + (end - start - cjk + 3) // 4
+
+def _longest_prefix(prefix, length, max_tokens):
+    lo, hi = 0, length
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _span_tokens(prefix, 0, mid) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _longest_suffix(prefix, length, max_tokens):
+    # 最小的起点 start，使 text[start:] 不超过 max_tokens
+    lo, hi = 0, length
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _span_tokens(prefix, mid, length) <= max_tokens:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def _snap_end(text, end, floor):
+    # 截断点尽量回退到句末，但不回退到 floor 之前
+    for i in range(end - 1, floor - 1, -1):
+        if _SENTENCE_END_RE.match(text[i]):
+            return i + 1
+    return end
+
+def _snap_start(text, start, ceiling):
+    # 保留的结尾尽量从新句子开始，但不前进到 ceiling 之后
+    for i in range(start, min(ceiling, len(text))):
+        if _SENTENCE_END_RE.match(text[i]):
+            return i + 1
+    return start
+
+def truncate_to_tokens(text, max_tokens, tail_ratio=0.0):
+    """
+    把文本截到 max_tokens 以内，截断点对齐到句末。
+    tail_ratio > 0 时保留开头与结尾、省略中间，并插入省略标记。结果只取决于输入，可复现。
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    prefix = _cjk_prefix(text)
+    length = len(text)
+    marker_tokens = count_tokens("\n……（中略约 00000 字）……\n")
+    usable = max_tokens - marker_tokens
+    if tail_ratio <= 0 or usable < 2 * marker_tokens:
+        end = _longest_prefix(prefix, length, max_tokens - 1)
+        return text[:_snap_end(text, end, int(end * 0.7))].rstrip() + "……"
+
+    tail_tokens = int(usable * tail_ratio)
+    end = _longest_prefix(prefix, length, usable - tail_tokens)
+    end = _snap_end(text, end, int(end * 0.7))
+    start = _longest_suffix(prefix, length, tail_tokens)
+    start = _snap_start(text, start, start + (length - start) * 3 // 10)
+    if start <= end:
+        return text
+    return f"{text[:end].rstrip()}\n……（中略约 {start - end} 字）……\n{text[start:].lstrip()}"
+
+def new_report(budget):
+    return {"budget": budget, "used": 0, "items": 0, "kept": 0, "truncated": 0, "dropped": 0, "dropped_tokens": 0}
+
+def _account(report, original, packed):
+    report["items"] += 1
+    original_tokens = count_tokens(original)
+    packed_tokens = count_tokens(packed) if packed else 0
+    report["used"] += packed_tokens
+    if not packed:
+        report["dropped"] += 1
+    elif packed != original:
+        report["truncated"] += 1
+    else:
+        report["kept"] += 1
+    report["dropped_tokens"] += max(0, original_tokens - packed_tokens)
+
+def pack_by_priority(texts, budget, min_tokens=MIN_ITEM_TOKENS, report=None):
+    """
+    按优先级（列表顺序）装箱：放得下的整条保留，放不下的截断到剩余预算，
+    剩余预算不足 min_tokens 时丢弃。返回与 texts 等长的列表，被丢弃的位置为 None。
+    """
+    report = report if report is not None else new_report(budget)
+    packed = []
+    remaining = budget
+    for text in texts:
+        tokens = count_tokens(text)
+        if tokens <= remaining:
+            result = text
+        elif remaining >= min_tokens:
+            result = truncate_to_tokens(text, remaining)
+        else:
+            result = None
+        _account(report, text, result)
+        if result:
+            remaining -= count_tokens(result)
+        packed.append(result)
+    return packed
+
+def fair_share(sizes, budget):
+    """
+    均分预算（注水法）：比平均份额短的条目全额保留，省下的份额再均分给其余条目。
+    """
+    allocation = [0] * len(sizes)
+    pending = sorted(range(len(sizes)), key=lambda i: (sizes[i], i))
+    remaining = budget
+    while pending:
+        share = remaining // len(pending)
+        i = pending[0]
+        if sizes[i] <= share:
+            allocation[i] = sizes[i]
+            remaining -= sizes[i]
+            pending.pop(0)
+            continue
+        for i in pending:
+            allocation[i] = share
+        break
+    return allocation
+
+def pack_evenly(texts, budget, tail_ratio=0.0, min_tokens=MIN_ITEM_TOKENS, report=None):
+    """
+    多份同等重要的素材（如风格样本）按均分预算各自截断，保证每份都能被模型看到。
+    每份至少要分到 min_tokens（本身更短的按实际长度算），预算不够时按顺序只保留前面的素材。
+    返回与 texts 等长的列表，被丢弃的位置为 None。
+    """
+    report = report if report is not None else new_report(budget)
+    if not texts:
+        return []
+    sizes = [count_tokens(t) for t in texts]
+    # 按实际长度计算能容纳的条数：短素材只占用自身的 token 数，不按 min_tokens 计
+    count, used = 0, 0
+    for size in sizes:
+        used += min(size, min_tokens)
+        if used > budget:
+            break
+        count += 1
+    count = max(1, count)
+    allocation = fair_share(sizes[:count], budget) + [0] * (len(texts) - count)
+    packed = []
+    for text, tokens in zip(texts, allocation):
+        result = truncate_to_tokens(text, tokens, tail_ratio) if tokens > 0 else None
+        _account(report, text, result)
+        packed.append(result)
+    return packed
+
+def describe_report(report):
+    """
+    给界面与日志用的一句话说明；没有截断或丢弃时返回空字符串。
+    """
+    if not report or not (report["truncated"] or report["dropped"]):
+        return ""
+    return (f"素材超出 {report['budget']} tokens 预算：{report['items']} 份中截断 {report['truncated']} 份、"
+            f"丢弃 {report['dropped']} 份，约省去 {report['dropped_tokens']} tokens")
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import news_fetcher
+import topic_cluster
+
+# 定时刷新间隔（秒）；默认关闭，定时刷新会周期性调用付费的聚类模型，需由部署方显式开启
+REFRESH_INTERVAL_SECONDS = int(os.getenv("FINVIDEO_REFRESH_INTERVAL", "0"))
+
+# 刷新流程的阶段：(标识, 展示名称, 执行函数)；用户手动刷新时忽略各接口的 TTL 全部重抓
+STAGES = [
+    ("fetch", "抓取全网热点", lambda job: news_fetcher.main(force=job.trigger == "manual")),
+    ("cluster", "AI 聚类选题", lambda job: topic_cluster.main()),
+]
+
+class RefreshJob:
+    def __init__(self, trigger):
+        self.id = uuid.uuid4().hex[:8]
+        self.trigger = trigger
+        self.status = "queued"  # queued / running / done / failed
+        self.stage = None
+        self.stage_label = "排队中"
+        self.completed_stages = 0
+        self.timings = {}
+        self.error = None
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def progress(self):
+        return self.completed_stages / len(STAGES)
+
+# 刷新任务在进程内共享：所有 Streamlit 会话看到同一个任务，单线程执行
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refresh")
+_lock = threading.Lock()
+_latest = None
+_scheduler = None
+
+def _run(job):
+    job.status = "running"
+    try:
+        for key, label, func in STAGES:
+            job.stage, job.stage_label = key, label
+            start = time.perf_counter()
+            func(job)
+            job.timings[key] = time.perf_counter() - start
+            job.completed_stages += 1
+        job.status = "done"
+        job.stage_label = "刷新完成"
+    except Exception as e:
+        traceback.print_exc()
+        job.status = "failed"
+        job.error = str(e)
+        job.stage_label = f"{job.stage_label}失败"
+    finally:
+        job.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def start_refresh(trigger="manual"):
+    """
+    提交一次后台刷新并立即返回任务。已有任务在排队或执行时直接返回该任务，
+    多个会话的重复点击只会触发一次刷新。
+    """
+    global _latest
+    with _lock:
+        if _latest is not None and _latest.active:
+            return _latest
+        job = RefreshJob(trigger)
+        _latest = job
+        _executor.submit(_run, job)
+        return job
+
+def latest_job():
+    return _latest
+
+def _schedule_loop(interval):
+    while True:
+        time.sleep(interval)
+        start_refresh(trigger="schedule")
+
+def start_scheduler(interval=REFRESH_INTERVAL_SECONDS):
+    """
+    启动定时刷新线程（进程内只启动一次）；interval 为 0 时不启动。
+    """
+    global _scheduler
+    if not interval:
+        return None
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_schedule_loop, args=(interval,), daemon=True, name="refresh-scheduler")
+            _scheduler.start()
+    return _scheduler
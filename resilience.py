@@ -0,0 +1,354 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 各阶段的调用策略：deadline 为整次调用（含重试、退避与对冲）的截止时间，attempt_timeout 为单次请求的超时；
+# hedge=True 时单次请求超过近期 p95 仍未返回就再发一份，先返回者胜出（生成全文的流式请求不对冲）
+STAGE_POLICIES = {
+    "cluster": {"deadline": 150, "attempt_timeout": 90, "max_attempts": 3, "hedge": True},
+    "script": {"deadline": 240, "attempt_timeout": 150, "max_attempts": 3, "hedge": True},
+    "script_batch": {"deadline": 300, "attempt_timeout": 150, "max_attempts": 3, "hedge": False},
+    "style": {"deadline": 180, "attempt_timeout": 120, "max_attempts": 3, "hedge": False},
+    "style_sample": {"deadline": 120, "attempt_timeout": 60, "max_attempts": 3, "hedge": True},
+    "style_merge": {"deadline": 180, "attempt_timeout": 120, "max_attempts": 3, "hedge": False},
+    "image": {"deadline": 150, "attempt_timeout": 90, "max_attempts": 2, "hedge": False},
+}
+DEFAULT_POLICY = {"deadline": 180, "attempt_timeout": 120, "max_attempts": 3, "hedge": False}
+
+HEDGING_ENABLED = os.getenv("FINVIDEO_HEDGE", "1") != "0"
+HEDGE_MIN_SAMPLES = 20       # 至少积累这么多次成功耗时才计算 p95 并开始对冲
+HEDGE_MIN_DELAY = 0.5        # 对冲等待时间下限（秒），避免延迟极低时几乎每次都对冲
+HEDGE_MAX_RATIO = 0.1        # 对冲请求占该阶段请求数的上限，防止上游整体变慢时流量翻倍
+LATENCY_WINDOW = 200         # 每个 (阶段, 模型) 保留最近多少次成功耗时
+
+BACKOFF_BASE = 0.5           # 重试退避：在 [0, min(上限, 基数*2^n)] 内随机（full jitter）
+BACKOFF_CAP = 8.0
+FAILOVER_AFTER = 2           # 主模型在同一次调用里失败这么多次后改用备用模型
+
+BREAKER_THRESHOLD = 5        # 连续失败多少次后熔断
+BREAKER_COOLDOWN = 30.0      # 熔断后多久放行一次试探请求（秒）
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError", "TimeoutException", "TransportError"}
+
+def _parse_fallbacks(raw):
+    pairs = (item.split("=", 1) for item in raw.split(",") if "=" in item)
+    return {primary.strip(): fallback.strip() for primary, fallback in pairs if primary.strip() and fallback.strip()}
+
+# 备用模型：主模型熔断或连续失败时改用，格式 "主=备,主=备"
+FALLBACK_MODELS = _parse_fallbacks(os.getenv("FINVIDEO_FALLBACK_MODELS", "gemini-2.5-flash=gpt-4.1-mini,gpt-4.1-mini=gemini-2.5-flash"))
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class AttemptTimeout(TimeoutError):
+    pass
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+def get_policy(stage):
+    """
+    阶段的调用策略；截止时间可用 FINVIDEO_DEADLINE_<阶段名大写> 环境变量覆盖（秒）。
+    """
+    policy = dict(STAGE_POLICIES.get(stage, DEFAULT_POLICY))
+    override = os.getenv(f"FINVIDEO_DEADLINE_{str(stage).upper()}")
+    if override:
+        policy["deadline"] = float(override)
+        policy["attempt_timeout"] = min(policy["attempt_timeout"], policy["deadline"])
+    return policy
+
+def is_retryable(error):
+    """
+    超时、连接错误、限流与 5xx 可以重试；其余 4xx（参数错误、鉴权失败）重试也不会成功。
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__)
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器：连续 threshold 次可重试类失败后打开，cooldown 秒内拒绝请求，
+    之后放行一个试探请求（半开），成功则恢复，失败则重新计时。
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+_breakers = {}
+_latencies = {}
+_hedge_counts = {}
+_registry_lock = threading.Lock()
+
+def breaker(model):
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+def breaker_states():
+    with _registry_lock:
+        return {model: {"state": b.state, "failures": b.failures} for model, b in _breakers.items()}
+
+def reset():
+    """
+    清空熔断器、耗时统计与对冲计数（测试与基准用）。
+    """
+    with _registry_lock:
+        _breakers.clear()
+        _latencies.clear()
+        _hedge_counts.clear()
+
+def _observe(stage, model, ok, latency=None, error=None):
+    # 只有服务端问题才计入熔断；参数错误等客户端问题不代表模型不可用
+    if ok or is_retryable(error):
+        breaker(model).record(ok)
+    if ok and latency is not None:
+        with _registry_lock:
+            _latencies.setdefault((stage, model), deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+def hedge_delay(stage, model, policy):
+    """
+    对冲等待时间：该阶段该模型近期成功耗时的 p95。样本不足或对冲比例已达上限时返回 None（不对冲）。
+    """
+    if not (HEDGING_ENABLED and policy.get("hedge")):
+        return None
+    with _registry_lock:
+        samples = sorted(_latencies.get((stage, model), ()))
+        calls, hedges = _hedge_counts.get(stage, (0, 0))
+    if len(samples) < HEDGE_MIN_SAMPLES or hedges >= HEDGE_MAX_RATIO * max(calls, 1):
+        return None
+    p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+    return max(HEDGE_MIN_DELAY, p95)
+
+def _count_request(stage, hedged):
+    with _registry_lock:
+        calls, hedges = _hedge_counts.get(stage, (0, 0))
+        _hedge_counts[stage] = (calls + 1, hedges + (1 if hedged else 0))
+
+def _choose_model(model, primary_failures):
+    fallback = FALLBACK_MODELS.get(model)
+    if primary_failures < FAILOVER_AFTER and breaker(model).allow():
+        return model
+    if fallback and breaker(fallback).allow():
+        return fallback
+    if primary_failures >= FAILOVER_AFTER and breaker(model).allow():
+        return model
+    raise CircuitOpenError(f"模型 {model} 已熔断" + (f"，备用模型 {fallback} 也不可用" if fallback else "，且未配置备用模型"))
+
+def _backoff(attempt, remaining):
+    return min(remaining, random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1))))
+
+def _new_info(info, model):
+    info = info if info is not None else {}
+    info.update(model=model, requested_model=model, attempts=0, hedged=False, fallback=False)
+    return info
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="model-call")
+    return _executor
+
+def _timed(stage, model, fn, timeout, record_latency=True):
+    start = time.perf_counter()
+    try:
+        result = fn(model, timeout)
+    except Exception as e:
+        _observe(stage, model, False, error=e)
+        raise
+    # 流式调用此刻只拿到了流对象，耗时不代表完整回复，不计入对冲用的耗时样本（熔断结果照常记录）
+    _observe(stage, model, True, time.perf_counter() - start if record_latency else None)
+    return result
+
+def _attempt(stage, model, fn, timeout, policy, info, record_latency=True):
+    executor = _get_executor()
+    started = time.monotonic()
+    pending = {executor.submit(_timed, stage, model, fn, timeout, record_latency)}
+    delay = hedge_delay(stage, model, policy)
+    hedged = False
+    error = None
+    try:
+        while pending:
+            limit = min(delay, timeout) if delay is not None and not hedged else timeout
+            done, pending = wait(pending, timeout=max(0, limit - (time.monotonic() - started)), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                info["hedged"] = info["hedged"] or hedged
+                return future.result()
+            if not done and delay is not None and not hedged and time.monotonic() - started < timeout:
+                # 第一份请求超过 p95 仍未返回：再发一份，哪份先回来用哪份
+                hedged = True
+                pending.add(executor.submit(_timed, stage, model, fn, timeout - (time.monotonic() - started), record_latency))
+            elif not done:
+                break
+    finally:
+        _count_request(stage, hedged)
+    if error is not None and not pending:
+        raise error
+    # 超时未返回的请求留在后台自行结束（SDK 超时与本次相同），结果丢弃
+    raise AttemptTimeout(f"{model} 请求超过 {timeout:.0f}s 未返回")
+
+def call(stage, model, fn, info=None, hedge=True, record_latency=True):
+    """
+    按阶段策略调用模型：fn(model, timeout) 发起一次请求并返回结果。
+    在截止时间内按指数退避（随机抖动）重试可重试的错误，慢请求按 p95 对冲，
+    主模型熔断或连续失败时改用 FALLBACK_MODELS 中的备用模型。
+    传入 info 字典时写入实际使用的 model、attempts、hedged 与 fallback；
+    record_latency=False（如流式调用）时不把本次耗时计入对冲的 p95 样本。
+    """
+    policy = get_policy(stage)
+    if not hedge:
+        policy["hedge"] = False
+    info = _new_info(info, model)
+    deadline = time.monotonic() + policy["deadline"]
+    primary_failures = 0
+    last_error = None
+    while info["attempts"] < policy["max_attempts"]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        use_model = _choose_model(model, primary_failures)
+        info.update(model=use_model, fallback=use_model != model, attempts=info["attempts"] + 1)
+        try:
+            return _attempt(stage, use_model, fn, min(policy["attempt_timeout"], remaining), policy, info, record_latency)
+        except Exception as e:
+            last_error = e
+            if not is_retryable(e):
+                raise
+            if use_model == model:
+                primary_failures += 1
+            print(f"[WARN] {stage} 阶段第 {info['attempts']} 次请求 {use_model} 失败: {e}")
+        time.sleep(_backoff(info["attempts"], max(0, deadline - time.monotonic())))
+    if deadline - time.monotonic() <= 0:
+        raise DeadlineExceeded(f"{stage} 阶段超过 {policy['deadline']:.0f}s 截止时间（{info['attempts']} 次请求）: {last_error}") from last_error
+    raise last_error
+
+async def _atimed(stage, model, afn, timeout):
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(afn(model, timeout), timeout)
+    except asyncio.TimeoutError:
+        error = AttemptTimeout(f"{model} 请求超过 {timeout:.0f}s 未返回")
+        _observe(stage, model, False, error=error)
+        raise error
+    except Exception as e:
+        _observe(stage, model, False, error=e)
+        raise
+    _observe(stage, model, True, time.perf_counter() - start)
+    return result
+
+async def _aattempt(stage, model, afn, timeout, policy, info):
+    started = time.monotonic()
+    pending = {asyncio.ensure_future(_atimed(stage, model, afn, timeout))}
+    delay = hedge_delay(stage, model, policy)
+    hedged = False
+    error = None
+    try:
+        while pending:
+            limit = min(delay, timeout) if delay is not None and not hedged else timeout
+            done, pending = await asyncio.wait(pending, timeout=max(0, limit - (time.monotonic() - started)), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                info["hedged"] = info["hedged"] or hedged
+                return task.result()
+            if not done and delay is not None and not hedged and time.monotonic() - started < timeout:
+                hedged = True
+                pending.add(asyncio.ensure_future(_atimed(stage, model, afn, timeout - (time.monotonic() - started))))
+            elif not done:
+                break
+    finally:
+        _count_request(stage, hedged)
+        # 异步请求可以真正取消，落选的对冲请求不再占用连接
+        for task in pending:
+            task.cancel()
+    if error is not None and not pending:
+        raise error
+    raise AttemptTimeout(f"{model} 请求超过 {timeout:.0f}s 未返回")
+
+async def acall(stage, model, afn, info=None, hedge=True):
+    """
+    call 的异步版本，afn(model, timeout) 为协程函数。
+    """
+    policy = get_policy(stage)
+    if not hedge:
+        policy["hedge"] = False
+    info = _new_info(info, model)
+    deadline = time.monotonic() + policy["deadline"]
+    primary_failures = 0
+    last_error = None
+    while info["attempts"] < policy["max_attempts"]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        use_model = _choose_model(model, primary_failures)
+        info.update(model=use_model, fallback=use_model != model, attempts=info["attempts"] + 1)
+        try:
+            return await _aattempt(stage, use_model, afn, min(policy["attempt_timeout"], remaining), policy, info)
+        except Exception as e:
+            last_error = e
+            if not is_retryable(e):
+                raise
+            if use_model == model:
+                primary_failures += 1
+            print(f"[WARN] {stage} 阶段第 {info['attempts']} 次请求 {use_model} 失败: {e}")
+        await asyncio.sleep(_backoff(info["attempts"], max(0, deadline - time.monotonic())))
+    if deadline - time.monotonic() <= 0:
+        raise DeadlineExceeded(f"{stage} 阶段超过 {policy['deadline']:.0f}s 截止时间（{info['attempts']} 次请求）: {last_error}") from last_error
+    raise last_error
+
+def with_timeout(client, timeout):
+    """
+    返回单次请求超时为 timeout、关闭 SDK 内部重试的客户端副本（重试由本模块负责）。
+    假客户端没有 with_options 时原样返回。
+    """
+    with_options = getattr(client, "with_options", None)
+    if with_options is None:
+        return client
+    return with_options(timeout=timeout, max_retries=0)
@@ -0,0 +1,203 @@
+import html
+import math
+import re
+
+# 文稿库倒排索引：汉字按字符二元组（另加单字）切词，英文/数字按整词，存放在与文稿库相同的 SQLite 库中
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_postings (
+    term TEXT NOT NULL,
+    script_id INTEGER NOT NULL,
+    tf REAL NOT NULL,
+    PRIMARY KEY (term, script_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_search_postings_script ON search_postings(script_id);
+CREATE TABLE IF NOT EXISTS search_docs (
+    script_id INTEGER PRIMARY KEY,
+    length REAL NOT NULL
+);
+"""
+
+# 选题、子选题与风格命中比正文命中更重要
+FIELD_WEIGHTS = {"topic": 3.0, "subtopic": 3.0, "style": 2.0, "content": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_RADIUS = 40
+# 切词规则变化时递增，已有索引会在启动时整体重建
+INDEX_VERSION = 2
+
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+")
+
+def tokenize(text):
+    """
+    切词：连续汉字切成字符二元组（单字时保留单字），英文与数字按整词小写。
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(str(text or "").lower()):
+        if run.isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def index_terms(text):
+    """
+    建索引用的词：在 tokenize 的基础上额外收录每个汉字单字，
+    使 "A股"、"K线" 这类英文字母加单个汉字的查询（查询词为 a + 股）也能命中。
+    """
+    tokens = tokenize(text)
+    for run in _TOKEN_RE.findall(str(text or "").lower()):
+        if not run.isascii() and len(run) > 1:
+            tokens.extend(run)
+    return tokens
+
+def ensure_index(conn):
+    """
+    建表并补建尚未入索引的文稿（如刚从 JSON 迁移过来的历史数据）；
+    索引版本落后时清空后整体重建。
+    """
+    conn.executescript(SCHEMA)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'search_index_version'").fetchone()
+    if not row or int(row[0]) != INDEX_VERSION:
+        with conn:
+            conn.execute("DELETE FROM search_postings")
+            conn.execute("DELETE FROM search_docs")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_index_version', ?)", (INDEX_VERSION,))
+    rows = conn.execute(
+        "SELECT id, topic, subtopic, style, content FROM scripts WHERE id NOT IN (SELECT script_id FROM search_docs)"
+    ).fetchall()
+    if rows:
+        with conn:
+            for row in rows:
+                index_script(conn, row["id"], dict(row))
+    return len(rows)
+
+def index_script(conn, script_id, record):
+    """
+    为一篇文稿建立索引；由调用方控制事务，以便与文稿插入在同一事务中提交。
+    """
+    weights = {}
+    length = 0.0
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in index_terms(record.get(field)):
+            weights[term] = weights.get(term, 0.0) + weight
+            length += weight
+    conn.execute("DELETE FROM search_postings WHERE script_id = ?", (script_id,))
+    conn.executemany(
+        "INSERT INTO search_postings (term, script_id, tf) VALUES (?, ?, ?)",
+        [(term, script_id, tf) for term, tf in weights.items()]
+    )
+    conn.execute("INSERT OR REPLACE INTO search_docs (script_id, length) VALUES (?, ?)", (script_id, length))
+
+def search(conn, query, page=1, page_size=20):
+    """
+    BM25 排序检索。空格分隔的多个关键词之间为"或"：命中任一关键词（该关键词切出的词全部出现）即算命中，
+    同时命中的关键词越多得分越高。返回 (总命中数, 当前页 script_id 列表)。
+    """
+    groups = [sorted(set(tokenize(word))) for word in str(query or "").split()]
+    groups = [g for g in groups if g]
+    if not groups:
+        return 0, []
+    total_docs, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM search_docs").fetchone()
+    if not total_docs:
+        return 0, []
+    avg_length = total_length / total_docs
+
+    terms = sorted({term for group in groups for term in group})
+    placeholders = ",".join("?" * len(terms))
+    df = dict(conn.execute(
+        f"SELECT term, COUNT(*) FROM search_postings WHERE term IN ({placeholders}) GROUP BY term", terms
+    ).fetchall())
+    # 有词从未出现的关键词不可能命中
+    groups = [g for g in groups if all(term in df for term in g)]
+    if not groups:
+        return 0, []
+    idf = [(term, math.log(1 + (total_docs - df[term] + 0.5) / (df[term] + 0.5))) for term in sorted({t for g in groups for t in g})]
+
+    # 每个关键词求交集（HAVING 命中该词全部二元组），关键词之间取并集；打分与分页都在 SQLite 内完成
+    matched = " UNION ".join(
+        f"SELECT script_id FROM search_postings WHERE term IN ({','.join('?' * len(g))}) GROUP BY script_id HAVING COUNT(*) = {len(g)}"
+        for g in groups
+    )
+    values = ",".join("(?, ?)" for _ in idf)
+    params = [x for pair in idf for x in pair] + [term for g in groups for term in g]
+    rows = conn.execute(
+        f"""
+        WITH q(term, idf) AS (VALUES {values}),
+             matched(script_id) AS ({matched})
+        SELECT p.script_id,
+               SUM(q.idf * p.tf * {BM25_K1 + 1} / (p.tf + {BM25_K1} * (1 - {BM25_B} + {BM25_B} * d.length / ?))) AS score,
+               COUNT(*) OVER () AS total
+        FROM matched m
+        JOIN search_postings p ON p.script_id = m.script_id
+        JOIN q ON q.term = p.term
+        JOIN search_docs d ON d.script_id = p.script_id
+        GROUP BY p.script_id
+        ORDER BY score DESC, p.script_id DESC
+        LIMIT ? OFFSET ?
+        """,
+        params + [avg_length, page_size, (max(page, 1) - 1) * page_size]
+    ).fetchall()
+    if not rows:
+        return 0, []
+    return rows[0][2], [row[0] for row in rows]
+
+def highlight_snippet(text, query, radius=SNIPPET_RADIUS):
+    """
+    截取命中位置附近的片段并用 <mark> 高亮（已做 HTML 转义，可直接嵌入页面）。
+    """
+    text = str(text or "")
+    needles = [q for q in re.split(r"\s+", str(query or "").strip()) if q]
+    lowered = text.lower()
+    positions = [lowered.find(q.lower()) for q in needles]
+    positions = [p for p in positions if p >= 0]
+    if not positions:
+        # 整词未命中时退回到首个二元组的位置
+        for term in tokenize(query):
+            p = lowered.find(term)
+            if p >= 0:
+                positions.append(p)
+                break
+    center = min(positions) if positions else 0
+    start = max(0, center - radius)
+    end = min(len(text), center + radius * 2)
+    snippet = text[start:end].replace("\n", " ")
+    escaped = html.escape(snippet)
+    marks = sorted({html.escape(n) for n in needles if n.lower() in snippet.lower()}, key=len, reverse=True)
+    if marks:
+        escaped = re.sub("|".join(re.escape(m) for m in marks), lambda m: f"<mark>{m.group(0)}</mark>", escaped, flags=re.IGNORECASE)
+    return ("…" if start > 0 else "") + escaped + ("…" if end < len(text) else "")
+
+def self_check():
+    """
+    在内存库上回归检查检索行为：英文字母加单字（A股、K线）、单个汉字、多关键词"或"查询。
+    用法：python search_index.py
+    """
+    import sqlite3
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE scripts (id INTEGER PRIMARY KEY, topic TEXT, subtopic TEXT, style TEXT, content TEXT);
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    docs = [
+        ("A股", "A股市场震荡", "深度解析", "今天A股市场放量上涨，K线收出长阳。"),
+        ("黄金", "金价新高", "深度解析", "避险情绪推升黄金价格。"),
+        ("美联储", "议息会议", "深度解析", "美联储宣布降息25个基点。"),
+    ]
+    conn.executemany("INSERT INTO scripts (topic, subtopic, style, content) VALUES (?, ?, ?, ?)", docs)
+    ensure_index(conn)
+    cases = {"A股": [1], "k线": [1], "股": [1], "降息 黄金": [2, 3], "宣布降息": [3], "比特币": []}
+    failures = []
+    for query, expected in cases.items():
+        total, ids = search(conn, query)
+        if sorted(ids) != expected or total != len(expected):
+            failures.append(f"{query!r}: 期望 {expected}，实际 {sorted(ids)}（共 {total}）")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    print(f"[INFO] 检索自检 {len(cases) - len(failures)}/{len(cases)} 通过")
+    return not failures
+
+if __name__ == "__main__":
+    raise SystemExit(0 if self_check() else 1)
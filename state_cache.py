@@ -0,0 +1,53 @@
+import os
+import threading
+
+# 进程级状态缓存：按键缓存解析结果，并记录数据源签名（文件为 mtime + size，
+# 数据库表为版本号）。数据被其他进程（如 news_fetcher / topic_cluster）改写后签名变化，自动重新解析。
+# 缓存返回的是共享对象，调用方应只读；要修改请先复制。
+_entries = {}
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "writes": 0}
+
+def file_signature(paths):
+    sig = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            sig.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+def get_or_load(key, sig, loader):
+    """
+    签名未变时直接返回缓存值（计一次 hit），否则调用 loader() 重新解析（计一次 miss）。
+    """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == sig:
+            stats["hits"] += 1
+            return entry[1]
+    value = loader()
+    with _lock:
+        _entries[key] = (sig, value)
+        stats["misses"] += 1
+    return value
+
+def write_through(key, sig, value):
+    """
+    本进程写入后调用：用写入后的签名直接更新缓存，下次读取无需重新解析。
+    """
+    with _lock:
+        _entries[key] = (sig, value)
+        stats["writes"] += 1
+
+def invalidate(key=None):
+    with _lock:
+        if key is None:
+            _entries.clear()
+        else:
+            _entries.pop(key, None)
+
+def snapshot():
+    with _lock:
+        return dict(stats)
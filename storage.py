@@ -0,0 +1,347 @@
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+import search_index
+import state_cache
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EDITOR_OUTPUT_PATH = os.path.join(BASE_DIR, "editor_output.json")
+STYLES_PATH = os.path.join(BASE_DIR, "blogger_styles.json")
+VIDEO_FACTORY_STATE_PATH = os.path.join(BASE_DIR, "video_factory_state.json")
+DB_PATH = os.getenv("FINVIDEO_DB_PATH", os.path.join(BASE_DIR, "finvideo.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scripts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT,
+    subtopic TEXT,
+    style TEXT,
+    content TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scripts_created_at ON scripts(created_at);
+CREATE TABLE IF NOT EXISTS factory_scripts (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    original_script TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_factory_scripts_created_at ON factory_scripts(created_at);
+CREATE TABLE IF NOT EXISTS factory_scenes (
+    script_id TEXT NOT NULL REFERENCES factory_scripts(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (script_id, idx)
+);
+CREATE TABLE IF NOT EXISTS styles (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    sop_template TEXT,
+    created_at TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 被缓存的表在每次增删改后递增 meta 中的版本号
+VERSIONED_TABLES = ("factory_scripts", "styles")
+
+def _version_triggers():
+    sql = []
+    for table in VERSIONED_TABLES:
+        sql.append(f"INSERT OR IGNORE INTO meta (key, value) VALUES ('version:{table}', 0);")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            sql.append(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version AFTER {event} ON {table} "
+                f"BEGIN UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version:{table}'; END;"
+            )
+    return "\n".join(sql)
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+def _read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+            if not content: return default
+            return json.loads(content)
+    except: return default
+
+_UNREADABLE = object()
+
+def load_json(path, default=None):
+    """
+    读取 JSON 文件；文件未变化（mtime/size 相同）时直接返回进程内缓存的解析结果。
+    返回值为共享对象，请勿原地修改。文件不存在或无法解析时返回 default 的副本，
+    调用方修改它不会影响其他调用。
+    """
+    if os.path.exists(path):
+        data = state_cache.get_or_load(("json", path), state_cache.file_signature([path]), lambda: _read_json(path, _UNREADABLE))
+        if data is not _UNREADABLE:
+            return data
+    return copy.deepcopy(default)
+
+def write_json_atomic(path, data):
+    """
+    先写同目录下唯一命名的临时文件再原子替换：读者不会读到半个文件，
+    多个进程（界面刷新、批量流水线）同时写同一文件时也不会截断或替换彼此的临时文件。
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path) or ".",
+                                     prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False) as f:
+        tmp_path = f.name
+        try:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        except Exception:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    # NamedTemporaryFile 创建的文件权限为 0600，恢复为普通数据文件的权限
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+def save_json(path, data):
+    write_json_atomic(path, data)
+    state_cache.write_through(("json", path), state_cache.file_signature([path]), data)
+
+def table_version(table, db_path=None):
+    """
+    表的版本号，由触发器在每次增删改时递增，跨进程可见，用作缓存签名。
+    """
+    row = get_db(db_path).execute("SELECT value FROM meta WHERE key = ?", (f"version:{table}",)).fetchone()
+    return int(row[0]) if row else 0
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def get_db(db_path=None):
+    """
+    返回当前线程的 SQLite 连接（WAL 模式）；每个进程首次连接时建表并迁移旧 JSON 数据。
+    """
+    db_path = db_path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conns[db_path] = conn
+        with _init_lock:
+            if db_path not in _initialized:
+                conn.executescript(SCHEMA)
+                conn.executescript(_version_triggers())
+                migrate_from_json(conn)
+                search_index.ensure_index(conn)
+                _initialized.add(db_path)
+    return conn
+
+def migrate_from_json(conn, editor_output_path=EDITOR_OUTPUT_PATH, factory_state_path=VIDEO_FACTORY_STATE_PATH, styles_path=STYLES_PATH):
+    """
+    一次性把旧的整文件 JSON（文稿库、视频工厂、风格库）导入 SQLite，原 JSON 文件保留不动。
+    """
+    # IMMEDIATE 事务先拿写锁，多个进程同时启动时只有一个会执行导入
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+            conn.rollback()
+            return False
+        # 迁移只读一次，直接解析文件，不进入状态缓存
+        lib = _read_json(editor_output_path, default=[])
+        for item in lib if isinstance(lib, list) else []:
+            if isinstance(item, dict):
+                conn.execute(
+                    "INSERT INTO scripts (topic, subtopic, style, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (item.get("topic"), item.get("subtopic"), item.get("style"), item.get("content"), item.get("created_at") or _now())
+                )
+        factory_state = _read_json(factory_state_path, default={})
+        for script_id, data in (factory_state.items() if isinstance(factory_state, dict) else []):
+            if isinstance(data, dict):
+                _insert_factory_script(conn, script_id, data.get("title"), data.get("scenes", []), data.get("original_script"), data.get("created_at"))
+        styles = _read_json(styles_path, default={})
+        for name, data in (styles.items() if isinstance(styles, dict) else []):
+            if isinstance(data, dict):
+                _upsert_style(conn, name, data)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (_now(),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+# ---------- 文稿库 ----------
+
+def append_scripts(records, db_path=None):
+    """
+    批量追加文稿到文稿库：整批在一个事务里插入，id 由数据库自增分配，返回带 id 的记录。
+    """
+    conn = get_db(db_path)
+    now = _now()
+    saved = []
+    with conn:
+        for record in records:
+            entry = {
+                "topic": record.get("topic"),
+                "subtopic": record.get("subtopic"),
+                "style": record.get("style"),
+                "content": record.get("content"),
+                "created_at": record.get("created_at") or now
+            }
+            cur = conn.execute(
+                "INSERT INTO scripts (topic, subtopic, style, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (entry["topic"], entry["subtopic"], entry["style"], entry["content"], entry["created_at"])
+            )
+            saved.append(dict(id=cur.lastrowid, **entry))
+            # 同一事务内增量更新检索索引
+            search_index.index_script(conn, cur.lastrowid, entry)
+    return saved
+
+def list_scripts(limit=None, offset=0, db_path=None):
+    """
+    按 id 倒序（最新在前）返回文稿。
+    """
+    sql = "SELECT id, topic, subtopic, style, content, created_at FROM scripts ORDER BY id DESC"
+    params = ()
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = (limit, offset)
+    return [dict(row) for row in get_db(db_path).execute(sql, params)]
+
+def get_script(script_id, db_path=None):
+    row = get_db(db_path).execute("SELECT id, topic, subtopic, style, content, created_at FROM scripts WHERE id = ?", (script_id,)).fetchone()
+    return dict(row) if row else None
+
+def count_scripts(db_path=None):
+    return get_db(db_path).execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+
+def search_scripts(query, page=1, page_size=20, db_path=None):
+    """
+    文稿库检索，返回 (总数, 当前页文稿列表)；每条文稿附带高亮片段 snippet（HTML）。
+    查询为空时按时间倒序分页列出全部文稿。
+    """
+    conn = get_db(db_path)
+    query = (query or "").strip()
+    offset = (max(page, 1) - 1) * page_size
+    if not query:
+        return count_scripts(db_path), list_scripts(page_size, offset, db_path)
+    # 索引同时收录汉字单字，单字与 "A股" 这类查询也直接走倒排索引
+    total, ids = search_index.search(conn, query, page, page_size)
+    by_id = {}
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        by_id = {r["id"]: dict(r) for r in conn.execute(
+            f"SELECT id, topic, subtopic, style, content, created_at FROM scripts WHERE id IN ({placeholders})", ids
+        )}
+    rows = [by_id[i] for i in ids if i in by_id]
+    for row in rows:
+        row["snippet"] = search_index.highlight_snippet(row.get("content"), query)
+    return total, rows
+
+# ---------- 视频工厂 ----------
+
+def _insert_factory_script(conn, script_id, title, scenes, original_script, created_at=None):
+    conn.execute(
+        "INSERT INTO factory_scripts (id, title, original_script, created_at) VALUES (?, ?, ?, ?)",
+        (script_id, title, original_script, created_at or _now())
+    )
+    conn.executemany(
+        "INSERT INTO factory_scenes (script_id, idx, data) VALUES (?, ?, ?)",
+        [(script_id, idx, json.dumps(scene, ensure_ascii=False)) for idx, scene in enumerate(scenes)]
+    )
+
+def create_factory_script(title, scenes, original_script, db_path=None):
+    """
+    新建视频工厂脚本及其场景，返回脚本 id。
+    id 以创建时间戳为基础；同一时刻（如界面与批量流水线并发）已有同名 id 时追加序号，不会覆盖已有脚本。
+    """
+    conn = get_db(db_path)
+    base_id = str(datetime.now().timestamp())
+    for attempt in range(100):
+        script_id = base_id if attempt == 0 else f"{base_id}-{attempt}"
+        try:
+            with conn:
+                _insert_factory_script(conn, script_id, title, scenes, original_script)
+            return script_id
+        except sqlite3.IntegrityError:
+            continue
+    raise RuntimeError(f"无法为视频工厂脚本分配唯一 id（{base_id}）")
+
+def list_factory_scripts(db_path=None):
+    """
+    返回 {script_id: {"title", "created_at"}}，不加载场景与原文。
+    数据库文件未变化时直接返回缓存结果。
+    """
+    def load():
+        rows = get_db(db_path).execute("SELECT id, title, created_at FROM factory_scripts ORDER BY created_at")
+        return {row["id"]: {"title": row["title"], "created_at": row["created_at"]} for row in rows}
+    return state_cache.get_or_load(("factory_scripts", db_path or DB_PATH), table_version("factory_scripts", db_path), load)
+
+def get_factory_script(script_id, db_path=None):
+    conn = get_db(db_path)
+    row = conn.execute("SELECT id, title, original_script, created_at FROM factory_scripts WHERE id = ?", (script_id,)).fetchone()
+    if not row:
+        return None
+    scenes = [json.loads(r["data"]) for r in conn.execute("SELECT data FROM factory_scenes WHERE script_id = ? ORDER BY idx", (script_id,))]
+    return {"title": row["title"], "scenes": scenes, "original_script": row["original_script"], "created_at": row["created_at"]}
+
+def update_scene(script_id, idx, scene, db_path=None):
+    """
+    只改写单个场景这一行。
+    """
+    conn = get_db(db_path)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO factory_scenes (script_id, idx, data) VALUES (?, ?, ?)",
+            (script_id, idx, json.dumps(scene, ensure_ascii=False))
+        )
+
+def update_scenes(script_id, updates, db_path=None):
+    """
+    批量改写若干场景，updates 为 {idx: scene}，在一个事务内完成。
+    """
+    conn = get_db(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO factory_scenes (script_id, idx, data) VALUES (?, ?, ?)",
+            [(script_id, idx, json.dumps(scene, ensure_ascii=False)) for idx, scene in updates.items()]
+        )
+
+# ---------- 风格库 ----------
+
+def _upsert_style(conn, name, data):
+    extra = {k: v for k, v in data.items() if k not in ("description", "sop_template", "created_at")}
+    conn.execute(
+        "INSERT OR REPLACE INTO styles (name, description, sop_template, created_at, extra) VALUES (?, ?, ?, ?, ?)",
+        (name, data.get("description"), data.get("sop_template", ""), data.get("created_at") or _now(), json.dumps(extra, ensure_ascii=False))
+    )
+
+def list_styles(db_path=None):
+    """
+    返回与旧 blogger_styles.json 相同结构的字典：{name: {"description", "sop_template", "created_at", ...}}。
+    """
+    def load():
+        styles = {}
+        for row in get_db(db_path).execute("SELECT name, description, sop_template, created_at, extra FROM styles ORDER BY created_at"):
+            data = json.loads(row["extra"] or "{}")
+            data.update(description=row["description"], sop_template=row["sop_template"] or "", created_at=row["created_at"])
+            styles[row["name"]] = data
+        return styles
+    return state_cache.get_or_load(("styles", db_path or DB_PATH), table_version("styles", db_path), load)
+
+def save_style(name, data, db_path=None):
+    conn = get_db(db_path)
+    with conn:
+        _upsert_style(conn, name, data)
+
@@ -0,0 +1,212 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from prompt_budget import count_tokens
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TELEMETRY_PATH = os.getenv("FINVIDEO_TELEMETRY_PATH", os.path.join(BASE_DIR, "llm_requests.jsonl"))
+TELEMETRY_ENABLED = os.getenv("FINVIDEO_TELEMETRY", "1") != "0"
+
+FLUSH_EVERY = 50        # 缓冲多少条记录后写盘
+FLUSH_INTERVAL = 5.0    # 缓冲中最早一条记录最多等待多久（秒）
+
+# 价格估算（美元）：chat 模型为每百万 token 的 (输入, 输出)，图片模型为每张
+MODEL_PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+IMAGE_PRICES = {
+    "dall-e-3": 0.04,
+}
+
+def estimate_message_tokens(messages):
+    # 每条消息另有约 4 个 token 的角色与分隔开销
+    return sum(count_tokens(m.get("content") or "") + 4 for m in messages)
+
+class TelemetryWriter:
+    """
+    追加写入的 JSONL 记录器：记录先进入内存缓冲，攒够 FLUSH_EVERY 条或等待
+    FLUSH_INTERVAL 秒后一次性写盘，调用方的热路径上没有文件 IO。
+    """
+
+    def __init__(self, path=TELEMETRY_PATH, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, entry):
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.flush_every
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not entries:
+            return
+        lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"[WARN] 写入调用记录失败: {e}")
+
+default_writer = TelemetryWriter()
+atexit.register(default_writer.flush)
+
+def record(kind, model, stage=None, latency=None, ttft=None, prompt_tokens=None, completion_tokens=None,
+           tokens_estimated=False, retries=None, cached=False, error=None, writer=None, **extra):
+    """
+    记录一次模型调用。kind 为 chat / chat_stream / image；命中缓存的调用也会记录（cached=True）。
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    entry = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "kind": kind,
+        "stage": stage or "unknown",
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_estimated": tokens_estimated,
+        "latency": round(latency, 4) if latency is not None else None,
+        "ttft": round(ttft, 4) if ttft is not None else None,
+        "retries": retries,
+        "cached": cached,
+        "ok": error is None,
+        "error": str(error)[:300] if error is not None else None,
+    }
+    entry.update(extra)
+    (writer or default_writer).record(entry)
+
+def create_with_retries(resource, params, method="create"):
+    """
+    调用 SDK 资源的 create/generate，返回 (结果, SDK 内部重试次数)。
+    支持 with_raw_response 的客户端可读到重试次数，假客户端等没有时记为 None。
+    """
+    raw_api = getattr(resource, "with_raw_response", None)
+    if raw_api is None:
+        return getattr(resource, method)(**params), None
+    raw = getattr(raw_api, method)(**params)
+    return raw.parse(), getattr(raw, "retries_taken", None)
+
+async def async_create_with_retries(resource, params, method="create"):
+    raw_api = getattr(resource, "with_raw_response", None)
+    if raw_api is None:
+        return await getattr(resource, method)(**params), None
+    raw = await getattr(raw_api, method)(**params)
+    return raw.parse(), getattr(raw, "retries_taken", None)
+
+def usage_tokens(usage, messages, content):
+    """
+    优先使用接口返回的 usage，没有时用本地估算。返回 (输入, 输出, 是否为估算)。
+    """
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        return usage.prompt_tokens, usage.completion_tokens, False
+    return estimate_message_tokens(messages), count_tokens(content or ""), True
+
+def entry_cost(entry):
+    if entry.get("cached") or not entry.get("ok"):
+        return 0.0
+    if entry.get("kind") == "image":
+        return IMAGE_PRICES.get(entry.get("model"), 0.0) * entry.get("images", 1)
+    price = MODEL_PRICES.get(entry.get("model"))
+    if not price:
+        return 0.0
+    return ((entry.get("prompt_tokens") or 0) * price[0] + (entry.get("completion_tokens") or 0) * price[1]) / 1e6
+
+def load_entries(path=TELEMETRY_PATH, since=None):
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 进程被强制结束时可能留下半行
+            if since and entry.get("ts", "") < since:
+                continue
+            entries.append(entry)
+    return entries
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def summarize(entries):
+    """
+    按 (日期, 阶段) 汇总：调用数、缓存命中、失败、重试、对冲与备用模型次数、实际请求的 p50/p95 延迟与平均首字耗时、token 与估算费用。
+    """
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[(entry.get("ts", "")[:10], entry.get("stage", "unknown"))].append(entry)
+    rows = []
+    for (day, stage), items in sorted(groups.items()):
+        live = [e for e in items if not e.get("cached")]
+        latencies = [e["latency"] for e in live if e.get("latency") is not None]
+        ttfts = [e["ttft"] for e in live if e.get("ttft") is not None]
+        rows.append({
+            "day": day,
+            "stage": stage,
+            "calls": len(items),
+            "cached": len(items) - len(live),
+            "errors": sum(1 for e in items if not e.get("ok")),
+            "retries": sum(e.get("retries") or 0 for e in items),
+            "hedged": sum(1 for e in items if e.get("hedged")),
+            "fallbacks": sum(1 for e in items if e.get("fallback_from")),
+            "p50_s": _percentile(latencies, 50),
+            "p95_s": _percentile(latencies, 95),
+            "avg_ttft_s": round(sum(ttfts) / len(ttfts), 4) if ttfts else None,
+            "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in live),
+            "completion_tokens": sum(e.get("completion_tokens") or 0 for e in live),
+            "cost_usd": round(sum(entry_cost(e) for e in items), 4),
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="按天、按阶段汇总模型调用的耗时与费用")
+    parser.add_argument("--path", default=TELEMETRY_PATH)
+    parser.add_argument("--days", type=int, default=7, help="只统计最近几天，0 表示全部")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args()
+
+    since = (datetime.now() - timedelta(days=args.days - 1)).strftime("%Y-%m-%d") if args.days else None
+    rows = summarize(load_entries(args.path, since))
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        print(f"没有调用记录: {args.path}")
+        return
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"
+    print(f"{'day':<10} {'stage':<14} {'calls':>6} {'cached':>6} {'errors':>6} {'retries':>7} {'hedged':>6} {'fallbk':>6} {'p50(s)':>7} {'p95(s)':>7} {'ttft(s)':>7} {'tok in':>9} {'tok out':>9} {'cost($)':>8}")
+    for r in rows:
+        print(f"{r['day']:<10} {r['stage']:<14} {r['calls']:>6} {r['cached']:>6} {r['errors']:>6} {r['retries']:>7} {r['hedged']:>6} {r['fallbacks']:>6} "
+              f"{fmt(r['p50_s']):>7} {fmt(r['p95_s']):>7} {fmt(r['avg_ttft_s']):>7} {r['prompt_tokens']:>9} {r['completion_tokens']:>9} {r['cost_usd']:>8.4f}")
+    print(f"合计费用约 ${sum(r['cost_usd'] for r in rows):.4f}")
+
+if __name__ == "__main__":
+    main()
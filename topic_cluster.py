@@ -1,39 +1,37 @@
 import json
 import os
 import re
-import streamlit as st
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import news_store
+import topic_history
+from json_stream import JSONArrayStream, parse_array_items
+from llm_cache import cached_chat_completion, cached_chat_stream
+from openai_client import get_client
+from storage import save_json
+from news_dedup import char_ngrams, collapse_near_duplicates
 
-# 优先从 Streamlit Secrets 或环境变量中读取 API 密钥
-try:
-    openai_api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-except:
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if openai_api_key:
-    client = OpenAI(api_key=openai_api_key)
-else:
-    client = OpenAI()
+# 客户端在首次调用模型时才创建（见 openai_client.py）；测试或基准可把 client 替换为假客户端
+client = None
 
 # 使用相对路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RAW_DATA_PATH = os.path.join(BASE_DIR, "raw_news.json")
 DAILY_TOPICS_PATH = os.path.join(BASE_DIR, "daily_topics.json")
-HISTORY_TOPICS_PATH = os.path.join(BASE_DIR, "history_topics.json")
+# 去重后的新闻超过该条数时改用 map-reduce 聚类，每个分片一次模型调用
+MAP_CHUNK_SIZE = 60
+MAP_CONCURRENCY = 8
+MERGED_TOPIC_LIMIT = 10
+MERGED_SUBTOPIC_LIMIT = 6
+TOPIC_MERGE_JACCARD = 0.5
+CLUSTER_MODEL = "gemini-2.5-flash"
+# 刷新时用流式聚类：每个选题一生成完就写入 daily_topics.json，设为 0 时等整段回复结束再写
+CLUSTER_STREAMING = os.getenv("FINVIDEO_CLUSTER_STREAM", "1") != "0"
 
-def cluster_topics(news_items):
-    """
-    使用 LLM 对新闻进行聚类并生成选题。
-    """
-    if not news_items:
-        return []
-    
-    # 简化输入，只取前 50 条新闻以节省 token
-    news_summary = "\n".join([f"- {item['title']} ({item['source']})" for item in news_items[:50]])
-    
-    prompt = f"""
-    你是一个资深的财经短视频编导。请根据以下最新的新闻资讯，聚类出 8-10 个最适合做短视频的选题大方向。请确保至少一半的选题与金融、股市、宏观经济等财经领域强相关。
+def _build_cluster_prompt(news_summary, topic_range="8-10"):
+    return f"""
+    你是一个资深的财经短视频编导。请根据以下最新的新闻资讯，聚类出 {topic_range} 个最适合做短视频的选题大方向。请确保至少一半的选题与金融、股市、宏观经济等财经领域强相关。
     
     要求：
     1. 每个大方向要有一个核心主题（Topic）。
@@ -54,63 +52,254 @@ def cluster_topics(news_items):
     新闻资讯：
     {news_summary}
     """
-    
+
+def _parse_topics(content):
+    # 尝试提取 JSON
+    json_match = re.search(r'\[.*\]', content, re.DOTALL)
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=[{"role": "user", "content": prompt}]
+        result = json.loads(json_match.group(0) if json_match else content)
+    except ValueError:
+        # 结尾被截断或夹杂了多余内容：保留所有已完整的选题，而不是整批丢弃
+        topics = [t for t in parse_array_items(content) if isinstance(t, dict)]
+        if not topics:
+            raise
+        print(f"[WARN] 聚类结果不是完整的 JSON，保留其中 {len(topics)} 个完整选题")
+        return topics
+    if isinstance(result, dict) and "topics" in result:
+        return result["topics"]
+    elif isinstance(result, dict):
+        # 有些模型可能直接返回列表作为值的字典
+        for key in result:
+            if isinstance(result[key], list):
+                return result[key]
+    return result if isinstance(result, list) else []
+
+def _cluster_messages(news_items, topic_range):
+    news_summary = "\n".join([f"- {item['title']} ({item.get('source', '')})" for item in news_items])
+    return [{"role": "user", "content": _build_cluster_prompt(news_summary, topic_range)}]
+
+def _new_report(report):
+    report = report if report is not None else {}
+    report.update(complete=True, errors=[])
+    return report
+
+def _cluster_chunk(news_items, topic_range="8-10", use_cache=True, report=None):
+    try:
+        content = cached_chat_completion(
+            client or get_client(),
+            model=CLUSTER_MODEL,
+            messages=_cluster_messages(news_items, topic_range),
+            bypass_cache=not use_cache,
+            stage="cluster"
         )
-        content = response.choices[0].message.content
-        # 尝试提取 JSON
-        json_match = re.search(r'\[.*\]', content, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group(0))
-        else:
-            result = json.loads(content)
-        if isinstance(result, dict) and "topics" in result:
-            return result["topics"]
-        elif isinstance(result, dict):
-            # 有些模型可能直接返回列表作为值的字典
-            for key in result:
-                if isinstance(result[key], list):
-                    return result[key]
-        return result if isinstance(result, list) else []
+        return _parse_topics(content)
     except Exception as e:
         print(f"Error clustering topics: {e}")
+        if report is not None:
+            report["complete"] = False
+            report["errors"].append(str(e))
+        return []
+
+def _cluster_chunk_stream(news_items, on_topic, topic_range="8-10", use_cache=True, report=None):
+    """
+    流式聚类一个分片：回复中每个选题对象一闭合就调用 on_topic(topic)。
+    流中途断开时返回已完成的选题，并在 report 中标记为不完整。
+    """
+    parser = JSONArrayStream()
+    topics = []
+    try:
+        for delta in cached_chat_stream(
+            client or get_client(),
+            model=CLUSTER_MODEL,
+            messages=_cluster_messages(news_items, topic_range),
+            bypass_cache=not use_cache,
+            stage="cluster"
+        ):
+            for topic in parser.feed(delta):
+                if isinstance(topic, dict):
+                    topics.append(topic)
+                    on_topic(topic)
+        if not parser.done:
+            raise ValueError("回复中没有完整的选题数组")
+    except Exception as e:
+        print(f"[WARN] 流式聚类中断，保留已完成的 {len(topics)} 个选题: {e}")
+        if report is not None:
+            report["complete"] = False
+            report["errors"].append(str(e))
+    return topics
+
+def cluster_topics(news_items, use_cache=True, on_update=None, report=None):
+    """
+    使用 LLM 对新闻进行聚类并生成选题。
+    use_cache=False 时跳过响应缓存，强制重新请求模型。
+    传入 on_update 时改用流式聚类，每完成一个选题就以当前的选题列表回调一次；
+    传入 report 字典时写入 complete（是否所有请求都完整结束）与 errors。
+    """
+    report = _new_report(report)
+    if not news_items:
+        return []
+    
+    # 先在本地折叠近似重复的标题，每组只保留一个代表，按覆盖来源数排序
+    representatives = collapse_near_duplicates(news_items)
+    if len(representatives) > MAP_CHUNK_SIZE:
+        return _map_reduce(representatives, use_cache=use_cache, on_update=on_update, report=report)
+    if on_update is None:
+        return _cluster_chunk(representatives, use_cache=use_cache, report=report)
+    topics = []
+
+    def on_topic(topic):
+        topics.append(topic)
+        on_update(list(topics))
+
+    _cluster_chunk_stream(representatives, on_topic, use_cache=use_cache, report=report)
+    return topics
+
+def cluster_topics_mapreduce(news_items, chunk_size=MAP_CHUNK_SIZE, max_workers=MAP_CONCURRENCY, use_cache=True):
+    """
+    map-reduce 聚类：新闻分片后并行聚类（并发数受 max_workers 限制），
+    再在本地合并各分片中重叠的选题。总耗时约等于最慢的一个分片。
+    """
+    if not news_items:
         return []
+    return _map_reduce(collapse_near_duplicates(news_items), chunk_size, max_workers, use_cache)
+
+def _map_reduce(representatives, chunk_size=MAP_CHUNK_SIZE, max_workers=MAP_CONCURRENCY, use_cache=True, on_update=None, report=None):
+    chunks = [representatives[i:i + chunk_size] for i in range(0, len(representatives), chunk_size)]
+    partials = [[] for _ in chunks]
+    lock = threading.Lock()
+
+    def run_chunk(idx):
+        if on_update is None:
+            partials[idx] = _cluster_chunk(chunks[idx], topic_range="4-6", use_cache=use_cache, report=report)
+            return
+
+        def on_topic(topic):
+            # 各分片并行输出，每来一个选题就把目前所有分片的结果合并后回调
+            with lock:
+                partials[idx].append(topic)
+                on_update(merge_topic_lists(partials))
+
+        _cluster_chunk_stream(chunks[idx], on_topic, topic_range="4-6", use_cache=use_cache, report=report)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="cluster-map") as executor:
+        list(executor.map(run_chunk, range(len(chunks))))
+    return merge_topic_lists(partials)
+
+def merge_topic_lists(topic_lists, limit=MERGED_TOPIC_LIMIT):
+    """
+    reduce 阶段：名称相近或子选题重叠的选题合并为一个，热度取最大值；
+    每个子选题只保留在热度最高的选题下，最后按热度取前 limit 个。
+    """
+    topics = [t for topics in topic_lists for t in topics if isinstance(t, dict) and t.get("topic")]
+    names = [char_ngrams(t.get("topic")) for t in topics]
+    subtitles = [{news_store.normalize_title(n.get("title")) for n in t.get("news_items", []) if isinstance(n, dict)} - {""} for t in topics]
+    parent = list(range(len(topics)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(topics)):
+        for j in range(i):
+            if find(i) == find(j):
+                continue
+            name_overlap = len(names[i] & names[j]) / max(1, len(names[i] | names[j]))
+            if name_overlap >= TOPIC_MERGE_JACCARD or subtitles[i] & subtitles[j]:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(topics)):
+        groups.setdefault(find(i), []).append(topics[i])
+
+    merged = []
+    for members in groups.values():
+        members.sort(key=_heat, reverse=True)
+        merged.append({
+            "topic": members[0].get("topic"),
+            "heat": _heat(members[0]),
+            "news_items": [n for t in members for n in t.get("news_items", []) if isinstance(n, dict)],
+        })
+    merged.sort(key=_heat, reverse=True)
 
-def main():
-    if not os.path.exists(RAW_DATA_PATH):
+    # 重新分配子选题：同一标题只归属热度最高的选题
+    assigned = set()
+    for topic in merged:
+        items = []
+        for n in topic["news_items"]:
+            key = news_store.normalize_title(n.get("title"))
+            if key and key not in assigned:
+                assigned.add(key)
+                items.append(n)
+        topic["news_items"] = items[:MERGED_SUBTOPIC_LIMIT]
+    return [t for t in merged if t["news_items"]][:limit]
+
+def _heat(topic):
+    heat = topic.get("heat")
+    return heat if isinstance(heat, (int, float)) else 0
+
+MAX_DAILY_TOPICS = 12
+
+def merge_daily_topics(new_topics, existing_topics):
+    """
+    将增量聚类结果并入当天已有选题：同名选题以新结果为准，按热度排序。
+    """
+    names = {str(t.get("topic")).strip() for t in new_topics if isinstance(t, dict)}
+    merged = list(new_topics) + [t for t in existing_topics if isinstance(t, dict) and str(t.get("topic")).strip() not in names]
+    merged.sort(key=_heat, reverse=True)
+    return merged[:MAX_DAILY_TOPICS]
+
+def main(full=False, stream=CLUSTER_STREAMING):
+    store = news_store.load_store()
+    if store["items"]:
+        # 只处理自上次聚类以来新出现的新闻；full=True 时处理当前全部新闻
+        news_items = news_store.current_items(store) if full else news_store.new_since_last_cluster(store)
+        if not news_items:
+            print(f"No new news since last clustering ({news_store.last_clustered_label(store)}).")
+            return
+        cutoff = max(store["items"][n["id"]].get("first_seen", 0) for n in news_items)
+    elif os.path.exists(RAW_DATA_PATH):
+        with open(RAW_DATA_PATH, 'r', encoding='utf-8') as f:
+            news_items = json.load(f)
+        cutoff = None
+    else:
         print("Raw news data not found.")
         return
         
-    with open(RAW_DATA_PATH, 'r', encoding='utf-8') as f:
-        news_items = json.load(f)
-        
-    new_topics = cluster_topics(news_items)
+    today = datetime.now().strftime("%Y-%m-%d")
+    existing_topics = [] if full else topic_history.load_day(today)
+
+    def publish(partial_topics):
+        # 流式聚类过程中逐个写入今日选题，页面无需等整段回复结束
+        save_json(DAILY_TOPICS_PATH, partial_topics if full else merge_daily_topics(partial_topics, existing_topics))
+
+    report = {}
+    new_topics = cluster_topics(news_items, on_update=publish if stream else None, report=report)
     
     if new_topics:
+        if not full:
+            new_topics = merge_daily_topics(new_topics, existing_topics)
+
         # 1. 更新今日选题
-        with open(DAILY_TOPICS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(new_topics, f, ensure_ascii=False, indent=4)
-            
-        # 2. 归档到历史选题
-        today = datetime.now().strftime("%Y-%m-%d")
-        history = {}
-        if os.path.exists(HISTORY_TOPICS_PATH):
-            try:
-                with open(HISTORY_TOPICS_PATH, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except:
-                history = {}
-        
-        history[today] = new_topics
-        with open(HISTORY_TOPICS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
+        save_json(DAILY_TOPICS_PATH, new_topics)
+
+        # 2. 归档到当天的历史分区，并增量更新趋势索引
+        topic_history.save_day(today, new_topics)
+
+        # 3. 记录聚类进度，重新加载以免覆盖聚类期间抓取到的新闻；
+        #    聚类没有完整结束时不推进进度，下次刷新会重新处理这批新闻
+        if cutoff is not None and report["complete"]:
+            store = news_store.load_store()
+            news_store.mark_clustered(store, cutoff)
+            news_store.save_store(store)
+        elif cutoff is not None:
+            print(f"[WARN] 聚类未完整结束（{'; '.join(report['errors'])}），下次刷新将重新处理这批新闻。")
             
-        print(f"Successfully clustered {len(new_topics)} topics.")
+        print(f"Successfully clustered {len(new_topics)} topics from {len(news_items)} news items.")
     else:
         print("No topics generated.")
+    return new_topics
 
 if __name__ == "__main__":
     main()
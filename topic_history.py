@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+import news_store
+from news_dedup import char_ngrams
+from storage import load_json, save_json
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_DIR = os.path.join(BASE_DIR, "history")
+TREND_INDEX_PATH = os.path.join(HISTORY_DIR, "trend_index.json")
+LEGACY_HISTORY_PATH = os.path.join(BASE_DIR, "history_topics.json")
+
+TREND_MATCH_JACCARD = 0.5   # 选题名字符二元组相似度达到该值即视为同一选题
+RISING_WINDOW_DAYS = 7
+RECURRING_SPAN_DAYS = 90
+
+_DAY_FILE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})\.json$')
+
+def day_path(date):
+    return os.path.join(HISTORY_DIR, f"{date}.json")
+
+def _empty_index():
+    return {"version": 1, "days": {}, "topics": {}}
+
+def _read_partition(path):
+    """
+    读取单日分区。文件损坏时移到一旁并告警，而不是当作空数据覆盖掉。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except FileNotFoundError:
+        return []
+    except ValueError as e:
+        corrupt_path = f"{path}.corrupt-{int(time.time())}"
+        os.replace(path, corrupt_path)
+        print(f"[WARN] 历史分区 {path} 无法解析（{e}），已移至 {corrupt_path}")
+        return []
+
+def list_days():
+    """
+    所有有记录的日期，新的在前。只列目录，不读取文件内容。
+    """
+    ensure_migrated()
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    days = [m.group(1) for m in (_DAY_FILE_RE.match(name) for name in os.listdir(HISTORY_DIR)) if m]
+    return sorted(days, reverse=True)
+
+def load_day(date):
+    ensure_migrated()
+    path = day_path(date)
+    if not os.path.exists(path):
+        return []
+    topics = load_json(path, default=None)
+    # load_json 解析失败时返回 default，这里区分“文件坏了”与“当天为空”
+    return topics if isinstance(topics, list) else _read_partition(path)
+
+def load_index():
+    ensure_migrated()
+    index = load_json(TREND_INDEX_PATH, default=None)
+    return index if isinstance(index, dict) and "topics" in index else _empty_index()
+
+def _match_key(index, name):
+    key = news_store.normalize_title(name)
+    if not key or key in index["topics"]:
+        return key
+    grams = char_ngrams(key)
+    best, best_score = key, 0.0
+    for existing in index["topics"]:
+        other = char_ngrams(existing)
+        score = len(grams & other) / max(1, len(grams | other))
+        if score >= TREND_MATCH_JACCARD and score > best_score:
+            best, best_score = existing, score
+    return best
+
+def _heat(topic):
+    heat = topic.get("heat")
+    return heat if isinstance(heat, (int, float)) else 0
+
+def _refresh_entry(entry):
+    # 展示名取最近一天的选题名
+    dates = sorted(entry["series"])
+    entry["first_seen"], entry["last_seen"] = dates[0], dates[-1]
+    entry["label"] = entry["labels"].get(dates[-1], entry["label"])
+
+def update_index(index, date, topics):
+    """
+    增量更新趋势索引：先撤销该日期之前的贡献，再写入新的选题热度。
+    只触及当天的选题，与历史总天数无关。
+    """
+    for key in index["days"].get(date, []):
+        entry = index["topics"].get(key)
+        if not entry:
+            continue
+        entry["series"].pop(date, None)
+        entry["labels"].pop(date, None)
+        if not entry["series"]:
+            del index["topics"][key]
+        else:
+            _refresh_entry(entry)
+
+    keys = []
+    for topic in topics:
+        if not isinstance(topic, dict) or not str(topic.get("topic") or "").strip():
+            continue
+        name = str(topic["topic"]).strip()
+        key = _match_key(index, name)
+        if not key:
+            continue
+        entry = index["topics"].setdefault(key, {"label": name, "series": {}, "labels": {}})
+        # 同一天多个相近选题合并时取最高热度
+        if _heat(topic) >= entry["series"].get(date, 0):
+            entry["series"][date] = _heat(topic)
+            entry["labels"][date] = name
+        _refresh_entry(entry)
+        if key not in keys:
+            keys.append(key)
+    index["days"][date] = keys
+    return index
+
+def save_day(date, topics):
+    """
+    写入单日分区并更新趋势索引，两者都经临时文件原子替换；其他日期的分区不会被改写。
+    """
+    ensure_migrated()
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    save_json(day_path(date), topics)
+    index = json.loads(json.dumps(load_index()))  # load_json 返回共享对象，修改前先复制
+    save_json(TREND_INDEX_PATH, update_index(index, date, topics))
+
+def ensure_migrated():
+    """
+    首次使用时把旧的 history_topics.json 拆成按天分区并建立索引，旧文件保持不动。
+    """
+    if os.path.exists(TREND_INDEX_PATH) or not os.path.exists(LEGACY_HISTORY_PATH):
+        return
+    try:
+        with open(LEGACY_HISTORY_PATH, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except ValueError as e:
+        print(f"[WARN] 旧历史文件无法解析，跳过迁移: {e}")
+        return
+    if not isinstance(legacy, dict) or not legacy:
+        return
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    index = _empty_index()
+    for date in sorted(legacy):
+        topics = legacy[date] if isinstance(legacy[date], list) else []
+        if not os.path.exists(day_path(date)):
+            save_json(day_path(date), topics)
+        update_index(index, date, topics)
+    save_json(TREND_INDEX_PATH, index)
+    print(f"[INFO] 已将 {len(legacy)} 天的历史选题迁移到 {HISTORY_DIR}")
+
+def _shift(date, days):
+    return (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+def rising_topics(index, window=RISING_WINDOW_DAYS, limit=10, today=None):
+    """
+    升温选题：最近 window 天的日均热度相对之前 window 天的增量，只看最近仍出现过的选题。
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    recent_start, prior_start = _shift(today, -window + 1), _shift(today, -2 * window + 1)
+    rows = []
+    for key, entry in index["topics"].items():
+        recent = [h for d, h in entry["series"].items() if recent_start <= d <= today]
+        if not recent:
+            continue
+        prior = [h for d, h in entry["series"].items() if prior_start <= d < recent_start]
+        recent_avg = sum(recent) / len(recent)
+        prior_avg = sum(prior) / len(prior) if prior else 0
+        rows.append({
+            "key": key, "label": entry["label"], "recent_days": len(recent), "prior_days": len(prior),
+            "recent_heat": round(recent_avg), "delta": round(recent_avg - prior_avg), "new": not prior,
+            "series": sorted(entry["series"].items()),
+        })
+    rows.sort(key=lambda r: (r["delta"], r["recent_days"], r["recent_heat"]), reverse=True)
+    return rows[:limit]
+
+def recurring_topics(index, span=RECURRING_SPAN_DAYS, min_days=2, limit=10, today=None):
+    """
+    反复出现的选题：最近 span 天内出现天数不少于 min_days 的选题，按出现天数排序。
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    start = _shift(today, -span + 1)
+    rows = []
+    for key, entry in index["topics"].items():
+        days = sorted(d for d in entry["series"] if start <= d <= today)
+        if len(days) < min_days:
+            continue
+        heats = [entry["series"][d] for d in days]
+        rows.append({
+            "key": key, "label": entry["label"], "days": len(days), "first_seen": days[0], "last_seen": days[-1],
+            "avg_heat": round(sum(heats) / len(heats)), "series": [(d, entry["series"][d]) for d in days],
+        })
+    rows.sort(key=lambda r: (r["days"], r["last_seen"], r["avg_heat"]), reverse=True)
+    return rows[:limit]
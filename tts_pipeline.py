@@ -0,0 +1,189 @@
+import array
+import hashlib
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import video_utils
+from openai_client import get_client
+from video_utils import TEMP_VIDEO_DIR, estimate_duration, is_annotation_scene
+
+TTS_CACHE_DIR = os.path.join(TEMP_VIDEO_DIR, "tts_cache")
+TTS_ENGINE = os.getenv("FINVIDEO_TTS_ENGINE", "offline")
+TTS_CONCURRENCY = 4
+
+_DURATION_RE = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+class OfflineToneEngine:
+    """
+    离线替身引擎：不联网，按估算口播时长生成一段低音量提示音 WAV，
+    用于本地调试时间线与视频合成。
+    """
+
+    name = "offline"
+    version = "1"
+    ext = "wav"
+    sample_rate = 16000
+
+    def synthesize(self, text, voice_sample_path, out_path):
+        seconds = max(0.5, estimate_duration(text))
+        total = int(seconds * self.sample_rate)
+        # 每个字约 0.22 秒：前 0.15 秒发声、其余静音，模拟逐字播报的节奏
+        period = int(0.22 * self.sample_rate)
+        voiced = int(0.15 * self.sample_rate)
+        step = 2 * math.pi * 220 / self.sample_rate
+        samples = array.array("h", (int(2000 * math.sin(i * step)) if i % period < voiced else 0 for i in range(total)))
+        with wave.open(out_path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(samples.tobytes())
+
+class OpenAITTSEngine:
+    """
+    OpenAI 语音合成。接口不支持音色克隆，voice_sample 只参与缓存键。
+    """
+
+    name = "openai"
+    version = "1"
+    ext = "mp3"
+    model = os.getenv("FINVIDEO_TTS_MODEL", "tts-1")
+    voice = os.getenv("FINVIDEO_TTS_VOICE", "alloy")
+
+    def synthesize(self, text, voice_sample_path, out_path):
+        response = (video_utils.client or get_client()).audio.speech.create(model=self.model, voice=self.voice, input=text, response_format="mp3")
+        with open(out_path, "wb") as f:
+            f.write(response.content)
+
+TTS_ENGINES = {
+    OfflineToneEngine.name: OfflineToneEngine,
+    OpenAITTSEngine.name: OpenAITTSEngine,
+}
+
+def get_engine(name=None):
+    name = name or TTS_ENGINE
+    if name not in TTS_ENGINES:
+        raise ValueError(f"未知的 TTS 引擎: {name}（可选: {', '.join(TTS_ENGINES)}）")
+    return TTS_ENGINES[name]()
+
+def file_digest(path):
+    if not path or not os.path.exists(path):
+        return ""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def tts_cache_key(text, voice_digest, engine):
+    """
+    配音缓存键：文案、音色样本内容哈希与引擎配置的 sha256，跨进程稳定。
+    """
+    basis = json.dumps({
+        "text": text.strip(),
+        "voice": voice_digest,
+        "engine": [engine.name, engine.version, getattr(engine, "model", ""), getattr(engine, "voice", "")],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+def measure_duration(path):
+    """
+    测量音频实际时长（秒）：WAV 直接读头信息，其他格式交给 ffmpeg 解析。
+    """
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as w:
+            return w.getnframes() / float(w.getframerate())
+    from video_assembly import get_ffmpeg
+    result = subprocess.run([get_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        raise RuntimeError(f"无法读取音频时长: {path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def synthesize_scene(text, voice_sample_path=None, engine=None, force=False, cache_dir=TTS_CACHE_DIR, voice_digest=None):
+    """
+    合成单段配音，返回 (音频路径, 实测时长, 是否命中缓存)。
+    音频与时长按内容寻址存放在 cache_dir，相同输入重复调用不会再次合成。
+    """
+    engine = engine or get_engine()
+    if voice_digest is None:
+        voice_digest = file_digest(voice_sample_path)
+    key = tts_cache_key(text, voice_digest, engine)
+    os.makedirs(cache_dir, exist_ok=True)
+    audio_path = os.path.join(cache_dir, f"{key}.{engine.ext}")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    if os.path.exists(audio_path) and os.path.exists(meta_path) and not force:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return audio_path, json.load(f)["duration"], True
+
+    # 同一文案可能被多个线程同时合成，临时文件名带线程号避免互相覆盖
+    tmp_path = f"{audio_path}.{threading.get_ident()}.part.{engine.ext}"
+    try:
+        engine.synthesize(text, voice_sample_path, tmp_path)
+        duration = round(measure_duration(tmp_path), 3)
+        os.replace(tmp_path, audio_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with open(f"{meta_path}.{threading.get_ident()}.part", 'w', encoding='utf-8') as f:
+        json.dump({"duration": duration, "engine": engine.name}, f)
+    os.replace(f"{meta_path}.{threading.get_ident()}.part", meta_path)
+    return audio_path, duration, False
+
+def synthesize_all(scenes, voice_sample_path=None, engine=None, max_concurrency=TTS_CONCURRENCY, force=False, on_progress=None, skip=None):
+    """
+    并发为所有场景合成配音。skip 为需要跳过的场景下标集合；画面标注场景不配音。
+    返回 {idx: {"path", "duration", "cached", "error"}}；on_progress(done, total, idx, result) 逐个回调。
+    """
+    skip = skip or set()
+    engine = engine or get_engine()
+    voice_digest = file_digest(voice_sample_path)
+    todo = [(idx, scene) for idx, scene in enumerate(scenes)
+            if idx not in skip and scene.get("content", "").strip() and not is_annotation_scene(scene["content"])]
+    results = {}
+    if not todo:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(todo))), thread_name_prefix="scene-tts") as executor:
+        futures = {
+            executor.submit(synthesize_scene, scene["content"], voice_sample_path, engine, force, TTS_CACHE_DIR, voice_digest): idx
+            for idx, scene in todo
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            try:
+                path, duration, cached = future.result()
+                results[idx] = {"path": path, "duration": duration, "cached": cached, "error": None}
+            except Exception as e:
+                results[idx] = {"path": None, "duration": None, "cached": False, "error": str(e)}
+            if on_progress:
+                on_progress(done, len(futures), idx, results[idx])
+    return results
+
+def apply_audio_results(scenes, results, skip=None):
+    """
+    把配音路径与实测时长写回场景，并按实际时长重新排布时间线（start）。
+    skip 中的场景（如已删除）不会被合成，不占用时间线，保持原样返回。
+    返回新的场景列表，不修改传入的场景。
+    """
+    skip = skip or set()
+    updated = []
+    start = 0.0
+    for idx, scene in enumerate(scenes):
+        scene = dict(scene)
+        if idx in skip:
+            updated.append(scene)
+            continue
+        result = results.get(idx)
+        if result and result["path"]:
+            scene["audio_path"] = result["path"]
+            scene["duration"] = round(result["duration"], 1)
+        scene["start"] = round(start, 1)
+        start += scene.get("duration") or 0
+        updated.append(scene)
+    return updated
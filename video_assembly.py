@@ -0,0 +1,271 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageDraw, ImageFont
+
+# 使用相对路径
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMP_VIDEO_DIR = os.path.join(BASE_DIR, "temp_video")
+SEGMENT_CACHE_DIR = os.path.join(TEMP_VIDEO_DIR, "segments")
+BGM_DIR = os.getenv("FINVIDEO_BGM_DIR", os.path.join(BASE_DIR, "assets", "bgm"))
+
+# 所有片段使用同一套编码参数，拼接时才能直接 -c copy
+VIDEO_WIDTH = 1280
+VIDEO_HEIGHT = 720
+FPS = 25
+AUDIO_RATE = 44100
+RENDER_VERSION = "v1"  # 修改渲染参数时递增，使旧片段缓存失效
+BGM_VOLUME = 0.15
+DEFAULT_SCENE_SECONDS = 5.0
+RENDER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# BGM 风格 -> assets/bgm 下的文件名。仓库不附带音乐文件，需自行放入（或用 FINVIDEO_BGM_DIR 指定目录）；
+# 文件不存在时跳过混音并给出警告
+BGM_FILES = {
+    "激昂财经": "energetic.mp3",
+    "沉稳叙事": "calm.mp3",
+    "快节奏电子": "electronic.mp3",
+}
+
+FONT_CANDIDATES = [
+    os.getenv("FINVIDEO_FONT", ""),
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wqy-zenhei/wqy-zenhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+]
+
+def get_ffmpeg():
+    """
+    优先使用 imageio-ffmpeg 自带的 ffmpeg，其次是 PATH 中的 ffmpeg，均可离线使用。
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        exe = shutil.which("ffmpeg")
+        if not exe:
+            raise RuntimeError("未找到 ffmpeg，请安装 imageio-ffmpeg 或系统 ffmpeg")
+        return exe
+
+def _run_ffmpeg(args):
+    cmd = [get_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg 执行失败: {result.stderr.strip()[-500:]}")
+
+def _file_digest(path):
+    if not path or not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def segment_key(job):
+    """
+    片段缓存键：配图与音频的内容哈希 + 字幕 + 时长 + 渲染参数。只改一个场景时只有它的键会变。
+    """
+    basis = {
+        "image": _file_digest(job.get("image_path")),
+        "audio": _file_digest(job.get("audio_path")),
+        "caption": job.get("caption", ""),
+        "duration": round(job.get("duration") or 0, 2),
+        "render": [RENDER_VERSION, VIDEO_WIDTH, VIDEO_HEIGHT, FPS, AUDIO_RATE],
+    }
+    return hashlib.sha256(json.dumps(basis, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _load_font(size):
+    for path in FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                continue
+    return ImageFont.load_default(size=size)
+
+def _wrap(draw, text, font, max_width):
+    lines, current = [], ""
+    for ch in text.replace("\n", " "):
+        if draw.textlength(current + ch, font=font) > max_width and current:
+            lines.append(current)
+            current = ""
+        current += ch
+    if current:
+        lines.append(current)
+    return lines
+
+def compose_frame(image_path, caption, out_path):
+    """
+    用 PIL 合成单帧：配图等比缩放居中（无图时为深色底），底部叠加半透明字幕条。
+    """
+    frame = Image.new("RGB", (VIDEO_WIDTH, VIDEO_HEIGHT), (18, 24, 38))
+    if image_path and os.path.exists(image_path):
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            img.thumbnail((VIDEO_WIDTH, VIDEO_HEIGHT))
+            frame.paste(img, ((VIDEO_WIDTH - img.width) // 2, (VIDEO_HEIGHT - img.height) // 2))
+    if caption:
+        font = _load_font(34)
+        draw = ImageDraw.Draw(frame, "RGBA")
+        lines = _wrap(draw, caption, font, VIDEO_WIDTH - 120)[-3:]
+        line_height = 46
+        top = VIDEO_HEIGHT - 40 - line_height * len(lines)
+        draw.rectangle([0, top - 16, VIDEO_WIDTH, VIDEO_HEIGHT], fill=(0, 0, 0, 150))
+        for i, line in enumerate(lines):
+            width = draw.textlength(line, font=font)
+            draw.text(((VIDEO_WIDTH - width) / 2, top + i * line_height), line, font=font, fill=(255, 255, 255))
+    frame.save(out_path)
+
+def render_segment(job):
+    """
+    渲染一个场景片段（在子进程中执行）：静帧 + 音频（无音频时为静音）→ H.264/AAC 的 mp4。
+    返回 (输出路径, 耗时)。
+    """
+    start = time.perf_counter()
+    out_path = job["out_path"]
+    duration = job.get("duration") or DEFAULT_SCENE_SECONDS
+    with tempfile.TemporaryDirectory(prefix="segment_") as tmp:
+        frame_path = os.path.join(tmp, "frame.png")
+        compose_frame(job.get("image_path"), job.get("caption", ""), frame_path)
+        args = ["-loop", "1", "-framerate", str(FPS), "-i", frame_path]
+        if job.get("audio_path") and os.path.exists(job["audio_path"]):
+            # 有音频时以音频长度为准，静帧循环由 -shortest 截断
+            args += ["-i", job["audio_path"]]
+        else:
+            args += ["-f", "lavfi", "-i", f"anullsrc=channel_layout=stereo:sample_rate={AUDIO_RATE}"]
+            args += ["-t", f"{duration:.2f}"]
+        tmp_out = os.path.join(tmp, "segment.mp4")
+        args += [
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage", "-pix_fmt", "yuv420p", "-r", str(FPS),
+            "-c:a", "aac", "-ar", str(AUDIO_RATE), "-ac", "2",
+            "-shortest", "-movflags", "+faststart", tmp_out,
+        ]
+        _run_ffmpeg(args)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        # 先移到目标目录下的唯一临时名再原子替换，多个进程同时渲染同一片段时互不覆盖
+        part_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.move(tmp_out, part_path)
+        os.replace(part_path, out_path)
+    return out_path, time.perf_counter() - start
+
+def build_segment_jobs(scenes, image_paths=None, segment_dir=SEGMENT_CACHE_DIR):
+    """
+    把场景转换为片段渲染任务；image_paths 可按下标覆盖场景自带的 image_url。
+    """
+    image_paths = image_paths or {}
+    jobs = []
+    for idx, scene in enumerate(scenes):
+        image_path = image_paths.get(idx) or scene.get("image_url")
+        if image_path and not os.path.exists(str(image_path)):
+            image_path = None
+        job = {
+            "idx": idx,
+            "image_path": image_path,
+            "audio_path": scene.get("audio_path"),
+            "caption": scene.get("content", ""),
+            "duration": scene.get("duration") or DEFAULT_SCENE_SECONDS,
+        }
+        job["key"] = segment_key(job)
+        job["out_path"] = os.path.join(segment_dir, f"{job['key']}.mp4")
+        jobs.append(job)
+    return jobs
+
+def concat_segments(segment_paths, out_path):
+    """
+    用 concat demuxer 无损拼接片段（-c copy，不重新编码）。
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+        list_path = f.name
+    try:
+        _run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", out_path])
+    finally:
+        os.remove(list_path)
+    return out_path
+
+def bgm_path(bgm_style):
+    """
+    BGM 风格对应的文件路径；"无" 或未知风格返回 None（不检查文件是否存在）。
+    """
+    name = BGM_FILES.get(bgm_style)
+    return os.path.join(BGM_DIR, name) if name else None
+
+def resolve_bgm(bgm_style):
+    path = bgm_path(bgm_style)
+    if path and not os.path.exists(path):
+        print(f"[WARN] 未找到 BGM 文件 {path}，本次合成不混入背景音乐")
+        return None
+    return path
+
+def mix_bgm(video_path, bgm_path, out_path, volume=BGM_VOLUME):
+    """
+    最后一遍混入循环播放的 BGM：视频流直接复制，只重新编码音频。
+    """
+    _run_ffmpeg([
+        "-i", video_path, "-stream_loop", "-1", "-i", bgm_path,
+        "-filter_complex", f"[1:a]volume={volume}[bgm];[0:a][bgm]amix=inputs=2:duration=first:dropout_transition=0[a]",
+        "-map", "0:v", "-map", "[a]", "-c:v", "copy", "-c:a", "aac", "-ar", str(AUDIO_RATE), "-ac", "2",
+        "-movflags", "+faststart", out_path,
+    ])
+    return out_path
+
+def assemble(scenes, out_path, bgm_style="无", image_paths=None, max_workers=RENDER_WORKERS, on_progress=None, segment_dir=SEGMENT_CACHE_DIR):
+    """
+    完整合成：进程池并行渲染（或复用缓存的）场景片段 → 无损拼接 → 混入 BGM。
+    返回报告字典：输出路径、各阶段耗时、渲染/复用的片段数。
+    """
+    total_start = time.perf_counter()
+    report = {"output": None, "segments": len(scenes), "rendered": 0, "cached": 0, "timings": {}, "segment_seconds": {}, "bgm_missing": None}
+    if not scenes:
+        raise ValueError("没有可合成的场景")
+    jobs = build_segment_jobs(scenes, image_paths, segment_dir)
+    todo = [job for job in jobs if not os.path.exists(job["out_path"])]
+    report["cached"] = len(jobs) - len(todo)
+
+    stage_start = time.perf_counter()
+    if todo:
+        # 在多线程的 Streamlit 进程里 fork 不安全，子进程统一用 spawn 启动
+        with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(todo))), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(render_segment, job): job for job in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                _, seconds = future.result()
+                report["segment_seconds"][job["idx"]] = round(seconds, 3)
+                if on_progress:
+                    on_progress(done, len(todo), job["idx"])
+    report["rendered"] = len(todo)
+    report["timings"]["render"] = time.perf_counter() - stage_start
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    bgm_file = resolve_bgm(bgm_style)
+    if bgm_path(bgm_style) and not bgm_file:
+        report["bgm_missing"] = bgm_path(bgm_style)
+    stage_start = time.perf_counter()
+    concat_path = out_path if not bgm_file else f"{out_path}.concat.mp4"
+    concat_segments([job["out_path"] for job in jobs], concat_path)
+    report["timings"]["concat"] = time.perf_counter() - stage_start
+
+    if bgm_file:
+        stage_start = time.perf_counter()
+        mix_bgm(concat_path, bgm_file, out_path)
+        os.remove(concat_path)
+        report["timings"]["bgm"] = time.perf_counter() - stage_start
+
+    report["timings"]["total"] = time.perf_counter() - total_start
+    report["output"] = out_path
+    return report
@@ -1,93 +1,214 @@
 import re
 import os
+import time
 import asyncio
-import streamlit as st
-from openai import OpenAI
+import threading
+import requests
 
-# 优先从 Streamlit Secrets 或环境变量中读取 API 密钥
-try:
-    openai_api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-except:
-    openai_api_key = os.getenv("OPENAI_API_KEY")
+import resilience
+import telemetry
+from openai_client import get_client
+from prompt_budget import count_tokens
 
-if openai_api_key:
-    client = OpenAI(api_key=openai_api_key)
-else:
-    client = OpenAI()
+# 客户端在首次调用模型时才创建（见 openai_client.py）；测试或基准可把 client 替换为假客户端
+client = None
 
 # 使用相对路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMP_VIDEO_DIR = os.path.join(BASE_DIR, "temp_video")
 
-def parse_script_to_scenes(script_text):
+# 场景切分参数：中文口播约每秒 4-5 字，每个场景目标时长约 8 秒
+SPEECH_RATE_CPS = 4.5
+TARGET_SCENE_SECONDS = 8.0
+MIN_SCENE_SECONDS = 3.0
+MAX_SCENE_SECONDS = 15.0
+SENTENCE_PAUSE_SECONDS = 0.3
+
+_TITLE_MATRIX_RE = re.compile(r'(### 标题矩阵.*?)(#+ 正文|#+ 脚本正文)', re.DOTALL | re.IGNORECASE)
+_BODY_SPLIT_RE = re.compile(r'#+ 正文|#+ 脚本正文', re.IGNORECASE)
+_SUGGESTION_RE = re.compile(r'[（(]配图建议[：:](.*?)[）)]')
+_SECTION_RE = re.compile(r'^(#+\s|-{3,}$|\*{3,}$)')
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？!?；;])')
+_SPOKEN_RE = re.compile(r'[\u4e00-\u9fff]|[A-Za-z]+|\d')
+
+def estimate_duration(text, speech_rate=SPEECH_RATE_CPS):
+    """
+    按口播字数估算时长（秒）：汉字与数字各算一字，英文单词按 1.5 字，句末停顿另计。
+    """
+    units = 0.0
+    for token in _SPOKEN_RE.findall(text):
+        units += 1.5 if len(token) > 1 or token.isalpha() and token.isascii() else 1
+    pauses = len(_SENTENCE_END_RE.findall(text))
+    return units / speech_rate + pauses * SENTENCE_PAUSE_SECONDS
+
+def _split_long_line(text, max_seconds, speech_rate):
+    # 超长段落按句末标点切开，再把句子装箱到不超过 max_seconds 的块里
+    if estimate_duration(text, speech_rate) <= max_seconds:
+        return [text]
+    chunks, current = [], ""
+    for sentence in [x for x in _SENTENCE_END_RE.split(text) if x.strip()]:
+        if current and estimate_duration(current + sentence, speech_rate) > max_seconds:
+            chunks.append(current.strip())
+            current = ""
+        current += sentence
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+def parse_script_to_scenes(script_text, target_seconds=TARGET_SCENE_SECONDS, speech_rate=SPEECH_RATE_CPS):
     """
     将脚本解析为场景。
-    逻辑：按段落拆分，并尝试提取配图建议。
+    逻辑：去掉标题矩阵后单遍扫描正文，按估算口播时长把相邻短段落合并为一个场景
+    （目标约 target_seconds 秒），超长段落按句切开；配图建议挂到所在场景上。
+    每个场景带 duration（估算秒数）与 start（在时间线上的起点）。
     """
-    scenes = []
     # 移除标题矩阵部分，只保留正文
-    print(f"[DEBUG] parse_script_to_scenes received script_text length: {len(script_text)}")
-    # 移除标题矩阵部分，只保留正文
-    # 查找“### 标题矩阵”和“### 正文”之间的内容，并将其移除
-    title_matrix_match = re.search(r'(### 标题矩阵.*?)(#+ 正文|#+ 脚本正文)', script_text, re.DOTALL | re.IGNORECASE)
+    title_matrix_match = _TITLE_MATRIX_RE.search(script_text)
     if title_matrix_match:
-        script_text_cleaned = script_text[:title_matrix_match.start(1)] + script_text[title_matrix_match.end(1):]
-        print("[DEBUG] Removed title matrix section.")
-    else:
-        script_text_cleaned = script_text
-        print("[DEBUG] No title matrix section found.")
-
-    body = re.split(r'#+ 正文|#+ 脚本正文', script_text_cleaned, flags=re.I)[-1]
-    print(f"[DEBUG] Script body length after splitting: {len(body)}")
-    
-    # 按段落拆分
-    paragraphs = [p.strip() for p in body.split('\n') if p.strip()]
-    
-    for i, p in enumerate(paragraphs):
-        # 提取配图建议（如果有）
-        image_suggestion = ""
-        suggestion_match = re.search(r'\(配图建议[：:](.*?)\)', p)
+        script_text = script_text[:title_matrix_match.start(1)] + script_text[title_matrix_match.end(1):]
+    body = _BODY_SPLIT_RE.split(script_text)[-1]
+
+    max_seconds = max(target_seconds, MAX_SCENE_SECONDS)
+    scenes = []
+    current = {"lines": [], "duration": 0.0, "suggestion": ""}
+    pending_suggestion = ""
+
+    def flush():
+        if not current["lines"]:
+            return
+        content = "\n".join(current["lines"])
+        summary = content.replace("\n", " ")[:30]
+        start = scenes[-1]["start"] + scenes[-1]["duration"] if scenes else 0.0
+        scenes.append({
+            "id": len(scenes) + 1,
+            "content": content,
+            "image_suggestion": current["suggestion"] or f"财经视频场景：{summary}",
+            "image_url": None,
+            "audio_path": None,
+            "duration": round(current["duration"], 1),
+            "start": round(start, 1)
+        })
+        current.update(lines=[], duration=0.0, suggestion="")
+
+    for raw_line in body.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            continue
+        # 小节标题与分隔线只作为场景边界，不进入配音文案
+        if _SECTION_RE.match(line):
+            flush()
+            continue
+        # 提取配图建议（如果有），并从文案中移除
+        suggestion_match = _SUGGESTION_RE.search(line)
+        suggestion = suggestion_match.group(1).strip() if suggestion_match else ""
         if suggestion_match:
-            image_suggestion = suggestion_match.group(1).strip()
-            # 清洗文案，移除配图建议
-            p = re.sub(r'\(配图建议[：:].*?\)', '', p).strip()
-        
-        if p:
-            scenes.append({
-                "id": i + 1,
-                "content": p,
-                "image_suggestion": image_suggestion or f"财经视频场景：{p[:30]}",
-                "image_url": None,
-                "audio_path": None
-            })
+            line = _SUGGESTION_RE.sub('', line).strip()
+        if not line:
+            # 独立成行的配图建议挂到当前场景，当前场景已有配图时留给下一个场景
+            if current["lines"] and not current["suggestion"]:
+                current["suggestion"] = suggestion
+            else:
+                pending_suggestion = pending_suggestion or suggestion
+            continue
+        # 新段落自带不同的配图建议时另起一个场景
+        if suggestion and current["suggestion"] and current["duration"] >= MIN_SCENE_SECONDS:
+            flush()
+        for chunk in _split_long_line(line, max_seconds, speech_rate):
+            duration = estimate_duration(chunk, speech_rate)
+            if current["lines"] and current["duration"] >= MIN_SCENE_SECONDS and current["duration"] + duration > target_seconds:
+                flush()
+            if not current["lines"] and pending_suggestion:
+                current["suggestion"], pending_suggestion = pending_suggestion, ""
+            current["lines"].append(chunk)
+            current["duration"] += duration
+        if suggestion and not current["suggestion"]:
+            current["suggestion"] = suggestion
+    flush()
     return scenes
 
+def is_annotation_scene(content):
+    """
+    判断场景是否为画面标注（仅标注，不配音）：场景由多段合并而成，只有以标注开头的场景才算。
+    """
+    return "配图建议" in content or content.startswith(("画面", "（", "("))
+
 def generate_audio(text, voice_sample_path=None):
     """
-    模拟配音生成。
-    由于环境限制，此处仅返回模拟路径。
+    生成单段配音并返回音频路径；按文案、音色样本与引擎的哈希缓存，重启后仍可复用。
     """
-    return os.path.join(TEMP_VIDEO_DIR, f"audio_{hash(text)}.mp3")
+    from tts_pipeline import synthesize_scene
+    audio_path, _, _ = synthesize_scene(text, voice_sample_path)
+    return audio_path
+
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE = "1024x1024"
+IMAGE_PROMPT_PREFIX = "Professional financial news illustration, 16:9 aspect ratio, high quality, modern style: "
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/1024x576.png?text=Image+Generation+Failed"
 
-def generate_image(prompt):
+def generate_image(prompt, save_path=None):
     """
     调用 DALL-E 3 生成配图。
+    不传 save_path 时返回图片 URL（失败时返回占位图 URL）；
+    传入 save_path 时下载到该路径并返回路径，失败返回 None。
     """
-    try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=f"Professional financial news illustration, 16:9 aspect ratio, high quality, modern style: {prompt}",
+    start = time.perf_counter()
+    call_info = {}
+
+    def attempt(model, timeout):
+        response, _ = telemetry.create_with_retries(resilience.with_timeout(client or get_client(), timeout).images, dict(
+            model=model,
+            prompt=f"{IMAGE_PROMPT_PREFIX}{prompt}",
             n=1,
-            size="1024x1024"
-        )
-        return response.data[0].url
+            size=IMAGE_SIZE
+        ), method="generate")
+        return response
+
+    try:
+        response = resilience.call("image", IMAGE_MODEL, attempt, info=call_info)
+        url = response.data[0].url
+        telemetry.record("image", call_info["model"], stage="image", latency=time.perf_counter() - start,
+                         prompt_tokens=count_tokens(prompt), retries=call_info["attempts"] - 1, images=1,
+                         hedged=call_info["hedged"], fallback_from=IMAGE_MODEL if call_info["fallback"] else None)
+        if save_path is None:
+            return url
+        return download_image(url, save_path)
     except Exception as e:
+        attempts = call_info.get("attempts")
+        telemetry.record("image", call_info.get("model", IMAGE_MODEL), stage="image", latency=time.perf_counter() - start,
+                         retries=attempts - 1 if attempts else None, error=e, images=1)
         print(f"[ERROR] Error generating image: {e}")
-        return "https://via.placeholder.com/1024x576.png?text=Image+Generation+Failed"
+        return None if save_path else PLACEHOLDER_IMAGE_URL
+
+def download_image(url, save_path, timeout=60):
+    """
+    流式下载图片：先写入同目录临时文件，完整后再原子替换，避免留下半张图。
+    """
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    # 临时文件名带上进程与线程号，多个批次并发下载同一张缓存图时互不覆盖
+    tmp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        os.replace(tmp_path, save_path)
+        return save_path
+    except Exception as e:
+        print(f"[ERROR] Error downloading image: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
 
-def assemble_video(scenes, bgm_style="激昂"):
+def assemble_video(scenes, bgm_style="激昂财经", out_path=None, image_paths=None, report=None, on_progress=None):
     """
-    模拟视频合成。
+    合成完整视频：场景片段并行渲染并按内容哈希缓存，拼接后混入 BGM。
+    传入 report 字典时写入各阶段耗时。
     """
-    print("[DEBUG] Assembling video (simulated).")
-    return os.path.join(TEMP_VIDEO_DIR, "final_video.mp4")
+    from video_assembly import assemble
+    out_path = out_path or os.path.join(TEMP_VIDEO_DIR, "final_video.mp4")
+    result = assemble(scenes, out_path, bgm_style=bgm_style, image_paths=image_paths, on_progress=on_progress)
+    if report is not None:
+        report.update(result)
+    print(f"[INFO] 视频合成完成: {out_path}，耗时 {result['timings']['total']:.1f}s（渲染 {result['rendered']} 段，复用 {result['cached']} 段）")
+    return out_path